@@ -0,0 +1,126 @@
+"""Who was seen when: aggregates over the ``sightings`` table.
+
+Every recognized face is one sighting row (timestamp, device, person,
+confidence, box), so the questions below are single indexed SQL aggregates
+instead of a parse of every log row. Times are normalized ISO strings
+(``until`` exclusive); faces nobody was matched to ("Unknown") are left out
+unless ``include_unknown`` is set.
+"""
+
+from . import logger
+
+UNKNOWN = 'Unknown'
+
+# bucket name -> SQL expression of the bucket of a sighting
+HISTOGRAM_BUCKETS = {
+    'hour': "substr(timestamp, 1, 13)",
+    'day': "substr(timestamp, 1, 10)",
+    'hour_of_day': "CAST(substr(timestamp, 12, 2) AS INTEGER)",
+    'weekday': "CAST(strftime('%w', timestamp) AS INTEGER)",  # 0 = Sunday
+}
+
+RECENT_SIGHTINGS_MAX = 500
+
+
+def _filters(person=None, since=None, until=None, device=None, include_unknown=False):
+    """WHERE clause and parameters for the sighting filters"""
+    clauses, params = [], []
+    if person:
+        clauses.append("person = ?")
+        params.append(person)
+    elif not include_unknown:
+        clauses.append("person != ?")
+        params.append(UNKNOWN)
+    if since:
+        clauses.append("timestamp >= ?")
+        params.append(since)
+    if until:
+        clauses.append("timestamp < ?")
+        params.append(until)
+    if device:
+        clauses.append("device = ?")
+        params.append(device)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def _round(value, digits=1):
+    return round(value, digits) if value is not None else None
+
+
+def people(since=None, until=None, device=None, include_unknown=False):
+    """Sightings, average confidence and first/last seen of every person, most seen first"""
+    where, params = _filters(None, since, until, device, include_unknown)
+    rows = logger._reader().execute(f'''
+    SELECT person, COUNT(*), AVG(confidence), MIN(timestamp), MAX(timestamp), COUNT(DISTINCT device)
+    FROM sightings{where}
+    GROUP BY person ORDER BY COUNT(*) DESC, person
+    ''', params).fetchall()
+    return {
+        'since': since,
+        'until': until,
+        'device': device,
+        'people': [{
+            'name': person,
+            'sightings': sightings,
+            'avg_confidence': _round(confidence),
+            'first_seen': first,
+            'last_seen': last,
+            'devices': devices,
+        } for person, sightings, confidence, first, last, devices in rows],
+        'total_sightings': sum(row[1] for row in rows),
+    }
+
+
+def person(name, since=None, until=None, device=None, recent=20):
+    """One person's sightings, last seen, per-device counts and most recent sightings"""
+    where, params = _filters(name, since, until, device)
+    conn = logger._reader()
+    sightings, confidence, first, last = conn.execute(f'''
+    SELECT COUNT(*), AVG(confidence), MIN(timestamp), MAX(timestamp) FROM sightings{where}
+    ''', params).fetchone()
+    devices = conn.execute(f'''
+    SELECT device, COUNT(*), MAX(timestamp) FROM sightings{where}
+    GROUP BY device ORDER BY COUNT(*) DESC
+    ''', params).fetchall()
+    latest = conn.execute(f'''
+    SELECT timestamp, device, confidence, recognition_id, box_top, box_right, box_bottom, box_left
+    FROM sightings{where} ORDER BY timestamp DESC LIMIT ?
+    ''', params + [max(0, min(int(recent), RECENT_SIGHTINGS_MAX))]).fetchall()
+    return {
+        'name': name,
+        'since': since,
+        'until': until,
+        'sightings': sightings,
+        'avg_confidence': _round(confidence),
+        'first_seen': first,
+        'last_seen': last,
+        'devices': [{'device': d, 'sightings': count, 'last_seen': seen} for d, count, seen in devices],
+        'recent': [{
+            'timestamp': timestamp,
+            'device': d,
+            'confidence': confidence,
+            'recognition_id': recognition_id,
+            'location': {'top': top, 'right': right, 'bottom': bottom, 'left': left},
+        } for timestamp, d, confidence, recognition_id, top, right, bottom, left in latest],
+    }
+
+
+def histogram(bucket='hour', person=None, since=None, until=None, device=None, include_unknown=False):
+    """Sightings (and distinct people) per time bucket: hour, day, hour_of_day or weekday"""
+    if bucket not in HISTOGRAM_BUCKETS:
+        raise ValueError(f'bucket must be one of: {", ".join(HISTOGRAM_BUCKETS)}')
+    where, params = _filters(person, since, until, device, include_unknown)
+    rows = logger._reader().execute(f'''
+    SELECT {HISTOGRAM_BUCKETS[bucket]} AS bucket, COUNT(*), COUNT(DISTINCT person)
+    FROM sightings{where}
+    GROUP BY 1 ORDER BY 1
+    ''', params).fetchall()
+    return {
+        'bucket': bucket,
+        'person': person,
+        'since': since,
+        'until': until,
+        'device': device,
+        'buckets': [{'bucket': b, 'sightings': count, 'people': distinct} for b, count, distinct in rows],
+        'total_sightings': sum(row[1] for row in rows),
+    }
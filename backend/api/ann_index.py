@@ -0,0 +1,116 @@
+"""Approximate nearest-neighbour index over face encodings"""
+
+import numpy as np
+
+DEFAULT_N_PROBE = 8
+KMEANS_ITERATIONS = 8
+KMEANS_SAMPLES_PER_LIST = 40
+
+# Upper bound on the (rows x centroids) block used during assignment
+MAX_BLOCK_ELEMENTS = 1 << 24
+
+
+class IVFIndex:
+    """Inverted-file index.
+
+    Gallery rows are bucketed by their nearest k-means centroid. A query only
+    scans the rows in its ``n_probe`` closest buckets; exact distances are then
+    computed on that shortlist by the matcher.
+    """
+
+    def __init__(self, centroids, lists, n_probe=DEFAULT_N_PROBE):
+        self.centroids = centroids
+        self.centroid_sq = np.einsum('ij,ij->i', centroids, centroids)
+        self.lists = lists
+        self.n_probe = n_probe
+
+    @classmethod
+    def build(cls, matrix, n_lists=None, n_probe=DEFAULT_N_PROBE, seed=0):
+        """Train centroids on (a sample of) ``matrix`` and bucket every row"""
+        n_lists = min(len(matrix), n_lists or max(1, int(np.sqrt(len(matrix)))))
+        centroids = _kmeans(matrix, n_lists, np.random.default_rng(seed))
+        assignments = nearest_centroids(matrix, centroids)
+        lists = _bucket(assignments, np.arange(len(matrix), dtype=np.int64), n_lists)
+        return cls(centroids, lists, n_probe)
+
+    @classmethod
+    def from_assignments(cls, centroids, assignments, n_probe=DEFAULT_N_PROBE):
+        """Index from trained centroids and the list of every row (-1 for none), as stored with a gallery"""
+        assignments = np.asarray(assignments, dtype=np.int64)
+        rows = np.flatnonzero(assignments >= 0)
+        centroids = np.asarray(centroids, dtype=np.float32)
+        return cls(centroids, _bucket(assignments[rows], rows, len(centroids)), n_probe)
+
+    def assignments(self, n_rows):
+        """List of every gallery row (-1 for rows in none); the inverse of ``lists``"""
+        out = np.full(n_rows, -1, dtype=np.int32)
+        for i, rows in enumerate(self.lists):
+            out[rows] = i
+        return out
+
+    def __len__(self):
+        return sum(len(rows) for rows in self.lists)
+
+    def search(self, probes, n_probe=None):
+        """Candidate gallery rows for every probe"""
+        n_probe = min(n_probe or self.n_probe, len(self.centroids))
+        d2 = self.centroid_sq[None, :] - 2 * (probes @ self.centroids.T)
+        nearest = np.argpartition(d2, n_probe - 1, axis=1)[:, :n_probe]
+        return [np.concatenate([self.lists[c] for c in row]) for row in nearest]
+
+    def extended(self, vectors, rows, remap=None):
+        """New index with ``vectors`` added at gallery ``rows``.
+
+        Centroids are kept as-is; ``remap`` translates the existing row numbers
+        when the gallery was reordered to make room for the new rows (-1 drops
+        a row).
+        """
+        lists = self.lists
+        if remap is not None:
+            lists = [remap[rows_] for rows_ in self.lists]
+            lists = [rows_[rows_ >= 0] for rows_ in lists]
+        added = _bucket(nearest_centroids(vectors, self.centroids), np.asarray(rows, dtype=np.int64),
+                        len(self.centroids))
+        lists = [np.concatenate([old, new]) if len(new) else old for old, new in zip(lists, added)]
+        return IVFIndex(self.centroids, lists, self.n_probe)
+
+
+def nearest_centroids(vectors, centroids):
+    """Index of the closest centroid for every vector"""
+    centroid_sq = np.einsum('ij,ij->i', centroids, centroids)
+    out = np.empty(len(vectors), dtype=np.int64)
+    step = max(1, MAX_BLOCK_ELEMENTS // len(centroids))
+    for i in range(0, len(vectors), step):
+        d2 = centroid_sq[None, :] - 2 * (vectors[i:i + step] @ centroids.T)
+        out[i:i + step] = np.argmin(d2, axis=1)
+    return out
+
+
+def _bucket(assignments, rows, n_lists):
+    """Split ``rows`` into one array per list according to ``assignments``"""
+    order = np.argsort(assignments, kind='stable')
+    counts = np.bincount(assignments, minlength=n_lists)
+    return np.split(rows[order], np.cumsum(counts)[:-1])
+
+
+def _kmeans(matrix, k, rng):
+    """Lloyd's k-means on a random sample of the gallery"""
+    sample_size = min(len(matrix), k * KMEANS_SAMPLES_PER_LIST)
+    sample = np.asarray(matrix[np.sort(rng.choice(len(matrix), sample_size, replace=False))],
+                        dtype=np.float32)
+    centroids = sample[rng.choice(sample_size, k, replace=False)].copy()
+
+    for _ in range(KMEANS_ITERATIONS):
+        assignments = nearest_centroids(sample, centroids)
+        counts = np.bincount(assignments, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Reseed empty clusters with random sample points
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = sample[rng.choice(sample_size, len(empty), replace=False)]
+
+    return centroids
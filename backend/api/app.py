@@ -1,16 +1,31 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
-import face_recognition
-import pickle
 import numpy as np
 from PIL import Image
 import os
 from datetime import datetime
 from zoneinfo import ZoneInfo
-import shutil
+import io
 import queue
 import threading
+import time
+import tarfile
+import uuid
+import zipfile
 from . import logger  # Import the new logger module as a package-relative import
+from . import log_maintenance
+from . import analytics
+from . import metrics
+from . import profiler
+from . import gallery_store
+from . import enrollments
+from .gallery_sync import VersionSegment, default_segment_path
+from .inference import InferenceExecutor, InferenceTimeout, QueueFull, detect_faces
+from .training_jobs import TrainingJobs
+from .pruning import DEFAULT_MAX_PER_PERSON, DEFAULT_MIN_DISTANCE, prune_person
+from .ann_index import IVFIndex
+from .matcher import GalleryLayer, GalleryMatcher, DEFAULT_TOLERANCE, ENCODING_DIM, MATCH_MODES
+from .quantization import PRECISIONS, requantize
 import dotenv
 
 dotenv.load_dotenv()
@@ -21,15 +36,36 @@ CORS(app)
 # Initialize Logger DB
 logger.init_db()
 
-# Load encodings at startup
+# Load encodings at startup. The legacy pickle is only converted when there is no
+# memory-mapped gallery yet: after that the gallery (with its online changes) is the source.
 encodings_path = os.path.join(os.path.dirname(__file__), '..', 'encodings.pkl')
+gallery_path = os.environ.get('GALLERY_PATH', gallery_store.gallery_path_for(encodings_path))
 temp_enrollments_path = os.path.join(os.path.dirname(__file__), '..', 'temp_enrollments')
+training_jobs_path = os.environ.get('TRAIN_JOBS_PATH', os.path.join(os.path.dirname(__file__), '..', 'training_jobs'))
 
 # Ensure temp enrollments directory exists
 os.makedirs(temp_enrollments_path, exist_ok=True)
 
-print(f"Loading face encodings from: {encodings_path}")
-encodings = None
+print(f"Loading face encodings from: {gallery_path}")
+gallery = None  # GalleryMatcher over the memory-mapped gallery, rebuilt on every reload
+gallery_version = 0  # Published version `gallery` corresponds to
+gallery_file_state = None  # gallery_store.gallery_state() of the files behind `gallery`
+_base_layer = (None, None, None)  # (base file state, GalleryLayer, IVFIndex) reused until compaction
+_unsaved_centroids = None  # IVF centroids trained by this worker that the base file does not store yet
+
+# The current gallery version is shared by all workers through a small shared-memory segment
+version_segment = VersionSegment(os.environ.get('GALLERY_VERSION_PATH', default_segment_path(gallery_path)))
+GALLERY_POLL_INTERVAL = float(os.environ.get('GALLERY_POLL_INTERVAL', 1.0))
+# /train appends delta segments; they are folded into the base file once this many pile up
+GALLERY_COMPACT_SEGMENTS = int(os.environ.get('GALLERY_COMPACT_SEGMENTS', 8))
+# Storage precision of the gallery ("float32", "float16" or "int8"); the base file is
+# rewritten in it by the next compaction, until then workers convert it in memory
+GALLERY_PRECISION = os.environ.get('GALLERY_PRECISION', 'float32').lower()
+if GALLERY_PRECISION not in PRECISIONS:
+    raise ValueError(f"GALLERY_PRECISION must be one of: {', '.join(PRECISIONS)}")
+_gallery_lock = threading.Lock()
+_gallery_watcher = None
+_compaction = None
 
 # Raspberry Pi Management
 pi_command_queue = queue.Queue()
@@ -41,6 +77,53 @@ pi_state = {
 
 PACIFIC_TIMEZONE = ZoneInfo("America/Los_Angeles")
 
+# Approximate nearest-neighbour index ("ivf" to enable), only used for large galleries
+ANN_INDEX = os.environ.get('ANN_INDEX', '').lower()
+ANN_MIN_GALLERY = int(os.environ.get('ANN_MIN_GALLERY', 50000))
+ANN_NPROBE = int(os.environ.get('ANN_NPROBE', 8))
+
+# Face detection/encoding runs in a process pool with a bounded queue (0 workers = inline)
+inference = InferenceExecutor(
+    workers=int(os.environ.get('INFERENCE_WORKERS', 1)),
+    queue_size=int(os.environ.get('INFERENCE_QUEUE_SIZE', 4)),
+    timeout=float(os.environ.get('INFERENCE_TIMEOUT', 100)),
+    start_method=os.environ.get('INFERENCE_START_METHOD', 'forkserver'),
+)
+
+# Training jobs process legacy enrollment images in a separate, lower-priority pool. Two
+# processes let a job detect two images at once; being niced, they only take idle CPU from
+# /recognize, but each holds its own copy of the models
+training_inference = InferenceExecutor(
+    workers=int(os.environ.get('TRAIN_WORKERS', 2)),
+    queue_size=0,
+    timeout=float(os.environ.get('INFERENCE_TIMEOUT', 100)),
+    start_method=os.environ.get('INFERENCE_START_METHOD', 'forkserver'),
+    niceness=int(os.environ.get('TRAIN_NICENESS', 10)),
+)
+
+# Detection runs on images reduced to this long side (0 = native resolution)
+DETECT_MAX_DIM = int(os.environ.get('DETECT_MAX_DIM', 1600))
+FULL_RES_ENCODINGS = os.environ.get('FULL_RES_ENCODINGS', '').lower() in ('1', 'true', 'yes')
+
+# Training drops near-duplicate encodings and optionally caps encodings per person (0 = off)
+PRUNE_MIN_DISTANCE = float(os.environ.get('PRUNE_MIN_DISTANCE', DEFAULT_MIN_DISTANCE))
+PRUNE_MAX_PER_PERSON = int(os.environ.get('PRUNE_MAX_PER_PERSON', DEFAULT_MAX_PER_PERSON))
+
+# /recognize/batch limits
+BATCH_MAX_IMAGES = int(os.environ.get('BATCH_MAX_IMAGES', 32))
+BATCH_MAX_IMAGE_BYTES = 25 * 1024 * 1024
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# Protects the /admin endpoints when set (sent as the X-Admin-Token header)
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+# Default /recognize matching mode ("exact", "ann" or "prototype"); empty = index if built, else exact
+MATCH_MODE = os.environ.get('MATCH_MODE', '').lower() or None
+PROTOTYPE_REFINE_PEOPLE = int(os.environ.get('PROTOTYPE_REFINE_PEOPLE', 5))
+# Smallest gallery (in people) matched in prototype mode; below it a batch's shortlists cover
+# most of the gallery and the exact scan is faster (benchmarks.bench_prototypes)
+PROTOTYPE_MIN_PEOPLE = int(os.environ.get('PROTOTYPE_MIN_PEOPLE', 200))
+
 
 def get_pacific_time(dt: datetime | None = None) -> datetime:
     """Return a timezone-aware datetime in US Pacific time."""
@@ -67,38 +150,220 @@ def format_pacific_time(dt: datetime | None = None) -> str:
     year = pacific_dt.strftime("%Y")
     return f"{weekday} {day_str} {month} {time_str} {tz_name} {year}"
 
+def ensure_index(matcher):
+    """Build the ANN index once the gallery is large enough, if enabled.
+
+    Freshly trained centroids are stored with the base file by a compaction,
+    so later versions (and the other workers) extend them instead of training again.
+    """
+    global _unsaved_centroids
+    if ANN_INDEX == 'ivf' and matcher.index is None and len(matcher) >= ANN_MIN_GALLERY:
+        matcher.build_index(n_probe=ANN_NPROBE)
+        print(f"✅ Built IVF index with {len(matcher.index.lists)} lists")
+        _unsaved_centroids = matcher.index.centroids
+        schedule_compaction()
+    return matcher
+
+def _load_gallery_file():
+    """Map the gallery file and load its delta segments; returns (matcher, generation, file state).
+
+    The base layer (and the IVF index stored with it) is reused while the
+    base file is unchanged, so a new version only reads and indexes the
+    segment rows.
+    """
+    global _base_layer
+    state = gallery_store.gallery_state(gallery_path)
+    if state is None:
+        print("⚠️ No encodings file found, starting fresh")
+        return GalleryMatcher([], []).quantized(GALLERY_PRECISION), 0, None
+    (people, person_ids, matrix), delta, info = gallery_store.load_layers(gallery_path)
+    cached_state, layer, index = _base_layer
+    if layer is None or state[0] is None or cached_state != state[0]:
+        layer = GalleryLayer.grouped(people, person_ids, matrix, info['scales'])[0]
+        index = None
+        if info['index'] is not None and ANN_INDEX == 'ivf':
+            index = IVFIndex.from_assignments(*info['index'], n_probe=ANN_NPROBE)
+    if index is not None and len(layer) + len(delta[1]) < ANN_MIN_GALLERY:
+        index = None
+    matcher = GalleryMatcher.layered(layer, (*delta, info['scales']), info['deleted'], index)
+    matcher = matcher.quantized(GALLERY_PRECISION)
+    if state[0] is not None and len(matcher.layers[0]):
+        _base_layer = (state[0], matcher.layers[0], index)
+    return matcher, info['generation'], state
+
+def _swap_gallery(matcher, version, state):
+    """Make `matcher` live; in-flight requests keep the reference they already hold"""
+    global gallery, gallery_version, gallery_file_state
+    with _gallery_lock:
+        if gallery is None or version >= gallery_version:
+            gallery, gallery_version, gallery_file_state = matcher, version, state
+
+def publish_gallery(matcher):
+    """Write `matcher` as a new base file for the next gallery version and make it current.
+
+    Must be called with `version_segment.lock()` held.
+    """
+    version = version_segment.read() + 1
+    os.makedirs(os.path.dirname(gallery_path), exist_ok=True)
+    people, person_ids, matrix = matcher.live_arrays()
+    matrix, scales = requantize(matrix, matcher.scales, GALLERY_PRECISION)
+    index = None
+    if matcher.index is not None and len(matcher.layers) == 1 and not len(matcher.dead_runs):
+        # Same rows in the same order: the index is stored with them
+        index = (matcher.index.centroids, matcher.index.assignments(len(matcher)))
+    gallery_store.write_base(gallery_path, people, person_ids, matrix, version, scales, index)
+    version_segment.write(version)
+
+    # Serve from the mapped file so the pages are shared with the other workers
+    mapped, _, state = _load_gallery_file()
+    _swap_gallery(mapped, version, state)
+    return version
+
+def publish_segment(matcher, names, encodings, deleted=()):
+    """Append `names`/`encodings` (after removing `deleted` people) as the next gallery version.
+
+    `matcher` must already reflect the change; only the new rows and tombstones
+    are written. Must be called with `version_segment.lock()` held.
+    """
+    version = version_segment.read() + 1
+    os.makedirs(os.path.dirname(gallery_path), exist_ok=True)
+    gallery_store.append_names_and_encodings(gallery_path, names, encodings, version, deleted)
+    version_segment.write(version)
+    _swap_gallery(matcher, version, gallery_store.gallery_state(gallery_path))
+    schedule_compaction()
+    return version
+
+def latest_gallery():
+    """The newest published gallery, which another worker may have just written.
+
+    Must be called with `version_segment.lock()` held.
+    """
+    current = current_gallery()
+    if current is None or version_segment.read() != gallery_version:
+        current = ensure_index(_load_gallery_file()[0])
+    return current
+
+def _compact_gallery():
+    """Fold the delta segments into a new base file; the watchers then remap it"""
+    global _unsaved_centroids
+    try:
+        centroids = _unsaved_centroids
+        with version_segment.lock():
+            precision = gallery_store.base_precision(gallery_path)
+            indexed = gallery_store.base_indexed(gallery_path)
+            merged = gallery_store.compact(gallery_path, GALLERY_PRECISION, centroids)
+        _unsaved_centroids = None
+        if merged:
+            print(f"🗜️ Compacted {merged} gallery segment(s) into {gallery_path}")
+        if precision not in (None, GALLERY_PRECISION):
+            print(f"🗜️ Rewrote {gallery_path} from {precision} to {GALLERY_PRECISION}")
+        if centroids is not None and not indexed and precision is not None:
+            print(f"🗜️ Stored the IVF index ({len(centroids)} lists) with {gallery_path}")
+    except Exception as e:
+        print(f"⚠️ Gallery compaction failed: {e}")
+
+def schedule_compaction():
+    """Compact in the background once GALLERY_COMPACT_SEGMENTS segments have piled up,
+    when the base file is not stored in GALLERY_PRECISION, or to store a newly trained IVF index"""
+    global _compaction
+    try:
+        pending = len(gallery_store.segment_paths(gallery_path, after=gallery_store.base_generation(gallery_path)))
+        precision = gallery_store.base_precision(gallery_path)
+        unindexed = _unsaved_centroids is not None and not gallery_store.base_indexed(gallery_path)
+    except (OSError, gallery_store.GalleryFormatError):
+        return
+    due = pending >= GALLERY_COMPACT_SEGMENTS or precision not in (None, GALLERY_PRECISION) or unindexed
+    if due and (_compaction is None or not _compaction.is_alive()):
+        _compaction = threading.Thread(target=_compact_gallery, name='gallery-compaction', daemon=True)
+        _compaction.start()
+
 def reload_encodings():
     """Reload encodings from file into memory"""
-    global encodings
     try:
         if os.path.exists(encodings_path):
-            with open(encodings_path, "rb") as f:
-                encodings = pickle.load(f)
-            print(f"✅ Reloaded {len(encodings['encodings'])} face encodings")
-            print(f"✅ Known people: {set(encodings['names'])}")
-        else:
-            print("⚠️ No encodings file found, starting fresh")
-            encodings = {"names": [], "encodings": []}
+            with version_segment.lock():
+                if gallery_store.gallery_state(gallery_path) is None:
+                    print(f"📦 Converting {encodings_path} to {gallery_path}...")
+                    people, person_ids, matrix = gallery_store.load_pickle(encodings_path)
+                    publish_gallery(ensure_index(GalleryMatcher.from_arrays(people, person_ids, matrix)))
+                elif (gallery is None and os.path.exists(gallery_path)
+                        and os.path.getmtime(encodings_path) > os.path.getmtime(gallery_path)):
+                    print(f"⚠️ {encodings_path} is newer than {gallery_path} and is ignored; "
+                          f"run python -m tools.convert_gallery to replace the gallery with it")
+
+        # Files are written before the counter is bumped, so this version is never ahead of the file
+        version = version_segment.read()
+        matcher, generation, state = _load_gallery_file()
+        version_segment.ensure_at_least(generation)
+        _swap_gallery(ensure_index(matcher), max(version, generation), state)
+        schedule_compaction()
+        print(f"✅ Reloaded {matcher.live_rows} face encodings (gallery version {gallery_version})")
+        print(f"✅ Known people: {set(matcher.live_people)}")
     except Exception as e:
         print(f"❌ Error loading encodings: {e}")
-        encodings = None
+
+def _watch_gallery():
+    """Swap to a new gallery as soon as another worker (or train.py) publishes one"""
+    while True:
+        time.sleep(GALLERY_POLL_INTERVAL)
+        try:
+            if (version_segment.read() != gallery_version
+                    or gallery_store.gallery_state(gallery_path) != gallery_file_state):
+                reload_encodings()
+        except Exception as e:
+            print(f"⚠️ Gallery watcher error: {e}")
+
+def current_gallery():
+    """The live matcher; also makes sure this worker process is watching for new versions"""
+    global _gallery_watcher
+    if _gallery_watcher is None or not _gallery_watcher.is_alive():
+        _gallery_watcher = threading.Thread(target=_watch_gallery, name='gallery-watcher', daemon=True)
+        _gallery_watcher.start()
+    return gallery
 
 # Initial load
 reload_encodings()
 
+def warm_up():
+    """Get this worker ready before it takes traffic: the current gallery, and the inference
+    pool started with its models loaded (gunicorn.conf.py runs this in every worker)"""
+    started = time.time()
+    # A preloaded master may have mapped an older gallery than the one now published
+    if (version_segment.read() != gallery_version
+            or gallery_store.gallery_state(gallery_path) != gallery_file_state):
+        reload_encodings()
+    current_gallery()
+    try:
+        blank = io.BytesIO()
+        Image.new('RGB', (160, 120)).save(blank, 'JPEG')
+        inference.warm_up(detect_faces, blank.getvalue(), DETECT_MAX_DIM, False)
+    except Exception as e:
+        print(f"⚠️ Inference warm-up failed: {e}")
+    print(f"🔥 Worker {os.getpid()} ready in {time.time() - started:.1f}s")
+
 @app.route('/', methods=['GET'])
 def home():
     return jsonify({
         'name': 'Face Recognition API',
         'version': '1.0',
-        'status': 'healthy' if encodings else 'unhealthy',
+        'status': 'healthy' if gallery is not None else 'unhealthy',
         'endpoints': {
             '/': 'GET - API info',
             '/health': 'GET - Health check',
+            '/metrics': 'GET - Request counts and per-stage latency histograms (Prometheus text format)',
+            '/admin/profiles': 'GET - Collapsed stacks of sampled requests for flame graphs (see PROFILE_SAMPLE_RATE)',
             '/recognize': 'POST - Recognize faces (multipart/form-data with "image" field)',
+            '/recognize/batch': 'POST - Recognize faces in several images (multiple "image" fields or one "archive" zip/tar)',
             '/enroll': 'POST - Enroll face images (multipart/form-data with "name" and "image" fields)',
-            '/train': 'POST - Train model with enrolled images (application/json with "name" field)',
+            '/train': 'POST - Queue training with enrolled images (application/json with "name" field), returns a job id',
+            '/train/<job_id>': 'GET - Training job progress',
+            '/people/<name>': 'DELETE - Remove a person; PUT - Replace a person with their current enrollment images',
             '/logs': 'GET - Retrieve system logs',
+            '/logs/stats': 'GET - Events, errors, latency and sightings per hour/day',
+            '/logs/export': 'GET - Stream logs as NDJSON or CSV (optionally gzip), same filters as /logs',
+            '/analytics/people': 'GET - Sightings, average confidence and last seen per person',
+            '/analytics/people/<name>': 'GET - One person\'s sightings per device and most recent sightings',
+            '/analytics/histogram': 'GET - Sightings per hour, day, hour_of_day or weekday',
             '/pi/command': 'POST/GET - Send or retrieve Pi commands',
             '/pi/status': 'POST/GET - Update or retrieve Pi status',
             '/pi/results': 'POST/GET - Update or retrieve Pi recognition results'
@@ -107,7 +372,8 @@ def home():
 
 @app.route('/health', methods=['GET'])
 def health():
-    if encodings is None:
+    matcher = current_gallery()
+    if matcher is None:
         return jsonify({
             'status': 'unhealthy',
             'error': 'Encodings not loaded'
@@ -115,30 +381,272 @@ def health():
     
     return jsonify({
         'status': 'healthy',
-        'faces_loaded': len(encodings['encodings']),
-        'known_people': list(set(encodings['names']))
+        'faces_loaded': matcher.live_rows,
+        'known_people': matcher.live_people,
+        'gallery_version': gallery_version,
+        'gallery_precision': matcher.precision,
+        'gallery_bytes': matcher.nbytes,
+        'log_writer': logger.writer_stats()
     })
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus metrics of all workers"""
+    if not metrics.METRICS_ENABLED:
+        return jsonify({'error': 'Metrics are disabled (METRICS_ENABLED)'}), 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/admin/profiles', methods=['GET'])
+def get_profiles():
+    """Sampled request profiles of all workers: collapsed stacks (default) or a JSON list"""
+    if ADMIN_TOKEN and request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+        return jsonify({'error': 'Invalid or missing X-Admin-Token'}), 403
+    try:
+        fmt = request.args.get('format', 'collapsed')
+        if fmt not in ('collapsed', 'json'):
+            return jsonify({'error': 'Invalid format. Use one of: collapsed, json'}), 400
+        try:
+            since = logger.normalize_time(request.args.get('since')) or profiler.default_since()
+            until = logger.normalize_time(request.args.get('until'))
+        except ValueError as e:
+            return jsonify({'error': f'Invalid time range: {e}'}), 400
+        
+        found = profiler.profiles(request.args.get('endpoint'), since, until)
+        if fmt == 'json':
+            return jsonify({
+                'since': since,
+                'until': until,
+                'sample_rate': profiler.PROFILE_SAMPLE_RATE,
+                'profiles': found
+            })
+        response = Response(profiler.collapsed(found), mimetype='text/plain')
+        response.headers['X-Profiles'] = str(len(found))
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _gallery_stat(stat):
+    matcher = gallery
+    return stat(matcher) if matcher is not None else None
+
+# Sampled per worker; the gallery is the same everywhere, queues add up
+metrics.Gauge('face_api_gallery_rows', 'Live encodings in the gallery',
+              lambda: _gallery_stat(lambda m: m.live_rows), 'max')
+metrics.Gauge('face_api_gallery_people', 'Live people in the gallery',
+              lambda: _gallery_stat(lambda m: len(m.live_people)), 'max')
+metrics.Gauge('face_api_gallery_bytes', 'Size of the gallery matrix',
+              lambda: _gallery_stat(lambda m: m.nbytes), 'max')
+metrics.Gauge('face_api_gallery_version', 'Published gallery version', lambda: gallery_version, 'max')
+metrics.Gauge('face_api_inference_queue_depth', 'Recognition jobs running or waiting for the inference pool',
+              lambda: inference.depth)
+metrics.Gauge('face_api_log_queue_depth', 'Events waiting for the log writer',
+              lambda: logger.writer_stats()['queued'])
+metrics.Gauge('face_api_log_events_dropped', 'Events dropped by the log writers of the live workers',
+              lambda: logger.writer_stats()['dropped'])
+
+def _observe_detection(endpoint, detection, timing):
+    """Stage histograms of one image that went through the inference pool"""
+    metrics.STAGE_SECONDS.observe(timing['wait_ms'] / 1000, endpoint=endpoint, stage='queue_wait')
+    for stage in ('decode', 'detect', 'encode'):
+        metrics.STAGE_SECONDS.observe(detection['stages'][f'{stage}_ms'] / 1000, endpoint=endpoint, stage=stage)
+    metrics.FACES_PER_IMAGE.observe(len(detection['locations']), endpoint=endpoint)
+
 @app.route('/logs', methods=['GET'])
 def get_logs():
-    """Retrieve system logs"""
+    """Retrieve system logs, newest first; page with `cursor` (the previous page's `next_cursor`)"""
     try:
         limit = int(request.args.get('limit', 50))
         offset = int(request.args.get('offset', 0))
+        cursor = request.args.get('cursor')
         endpoint = request.args.get('endpoint')
         event_type = request.args.get('event_type')
         success = request.args.get('success')
         if success is not None:
             success = success.lower() == 'true'
+        try:
+            cursor = int(cursor) if cursor else None
+            since = logger.normalize_time(request.args.get('since'))
+            until = logger.normalize_time(request.args.get('until'))
+        except ValueError as e:
+            return jsonify({'error': f'Invalid cursor or time range: {e}'}), 400
             
-        result = logger.get_logs(limit, offset, endpoint, event_type, success)
+        result = logger.get_logs(limit, offset, endpoint, event_type, success,
+                                 before_id=cursor, since=since, until=until)
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/logs/stats', methods=['GET'])
+def get_log_stats():
+    """Events, errors, latency and sightings per hour or day, read from the log rollups"""
+    try:
+        period = request.args.get('period')
+        if period and period not in log_maintenance.PERIODS:
+            return jsonify({'error': f'Invalid period. Use one of: {", ".join(log_maintenance.PERIODS)}'}), 400
+        try:
+            since = logger.normalize_time(request.args.get('since'))
+            until = logger.normalize_time(request.args.get('until'))
+        except ValueError as e:
+            return jsonify({'error': f'Invalid time range: {e}'}), 400
+        
+        return jsonify(log_maintenance.get_stats(since, until, period,
+                                                 request.args.get('endpoint'), request.args.get('event_type')))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/logs/export', methods=['GET'])
+def export_logs():
+    """Stream every log matching the filters as NDJSON or CSV, oldest first"""
+    try:
+        fmt = request.args.get('format', 'ndjson')
+        if fmt not in logger.EXPORT_FORMATS:
+            return jsonify({'error': f'Invalid format. Use one of: {", ".join(logger.EXPORT_FORMATS)}'}), 400
+        success = request.args.get('success')
+        if success is not None:
+            success = success.lower() == 'true'
+        # gzip when asked for (?gzip=true) or when the client accepts it
+        compress = (request.args.get('gzip', '').lower() == 'true'
+                    or 'gzip' in request.headers.get('Accept-Encoding', ''))
+        try:
+            after_id = request.args.get('after_id')
+            last_id, chunks = logger.export_logs(fmt, request.args.get('endpoint'), request.args.get('event_type'),
+                                                 success, request.args.get('since'), request.args.get('until'),
+                                                 after_id=int(after_id) if after_id else None, compress=compress)
+        except ValueError as e:
+            return jsonify({'error': f'Invalid after_id or time range: {e}'}), 400
+        
+        response = Response(chunks, mimetype='application/x-ndjson' if fmt == 'ndjson' else 'text/csv')
+        response.headers['Content-Disposition'] = (
+            f'attachment; filename=logs-{datetime.now().strftime("%Y%m%d-%H%M%S")}.{fmt}')
+        response.headers['X-Export-Last-Id'] = str(last_id)
+        if compress:
+            response.headers['Content-Encoding'] = 'gzip'
+            response.headers['Vary'] = 'Accept-Encoding'
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _analytics_filters():
+    """since/until/device/include_unknown query arguments; raises ValueError on bad times"""
+    return {
+        'since': logger.normalize_time(request.args.get('since')),
+        'until': logger.normalize_time(request.args.get('until')),
+        'device': request.args.get('device'),
+    }
+
+@app.route('/analytics/people', methods=['GET'])
+def analytics_people():
+    """Sightings, average confidence and first/last seen of every person"""
+    try:
+        try:
+            filters = _analytics_filters()
+        except ValueError as e:
+            return jsonify({'error': f'Invalid time range: {e}'}), 400
+        include_unknown = request.args.get('include_unknown', '').lower() == 'true'
+        return jsonify(analytics.people(include_unknown=include_unknown, **filters))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/analytics/people/<name>', methods=['GET'])
+def analytics_person(name):
+    """One person's sightings, last seen, per-device counts and most recent sightings"""
+    try:
+        try:
+            filters = _analytics_filters()
+            recent = int(request.args.get('recent', 20))
+        except ValueError as e:
+            return jsonify({'error': f'Invalid request: {e}'}), 400
+        result = analytics.person(name, recent=recent, **filters)
+        if not result['sightings']:
+            return jsonify({'error': f'No sightings of {name}', **result}), 404
         return jsonify(result)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/analytics/histogram', methods=['GET'])
+def analytics_histogram():
+    """Sightings per time bucket, optionally of one person"""
+    try:
+        bucket = request.args.get('bucket', 'hour')
+        if bucket not in analytics.HISTOGRAM_BUCKETS:
+            return jsonify({'error': f'Invalid bucket. Use one of: {", ".join(analytics.HISTOGRAM_BUCKETS)}'}), 400
+        try:
+            filters = _analytics_filters()
+        except ValueError as e:
+            return jsonify({'error': f'Invalid time range: {e}'}), 400
+        include_unknown = request.args.get('include_unknown', '').lower() == 'true'
+        return jsonify(analytics.histogram(bucket, request.args.get('person'),
+                                           include_unknown=include_unknown, **filters))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _device_id():
+    """Device a request came from: its X-Device-Id header, else the client address"""
+    return request.headers.get('X-Device-Id') or request.remote_addr
+
+def _match_options():
+    """Read the optional top_k/mode form fields; raises ValueError on bad input"""
+    top_k = max(1, int(request.form.get('top_k', 1)))
+    match_mode = request.form.get('mode', MATCH_MODE)
+    if match_mode and match_mode not in MATCH_MODES:
+        raise ValueError(f'Invalid mode. Use one of: {", ".join(MATCH_MODES)}')
+    return top_k, match_mode or None
+
+def _effective_mode(matcher, match_mode):
+    """`match_mode`, with prototype mode falling back to exact on galleries with few people"""
+    if match_mode == 'prototype' and matcher.live_person_count < PROTOTYPE_MIN_PEOPLE:
+        return 'exact'
+    return match_mode
+
+def _detect_options():
+    """Read the optional detect_max_dim/full_res_encodings form fields; raises ValueError on bad input"""
+    max_dim = int(request.form.get('detect_max_dim', DETECT_MAX_DIM))
+    if max_dim < 0:
+        raise ValueError('detect_max_dim must be 0 (native resolution) or a positive pixel size')
+    full_res = request.form.get('full_res_encodings')
+    full_res = FULL_RES_ENCODINGS if full_res is None else full_res.lower() in ('1', 'true', 'yes')
+    return max_dim, full_res
+
+def _face_results(face_locations, matches, top_k):
+    """Build the `faces` list of a recognition response"""
+    results = []
+    for (top, right, bottom, left), match in zip(face_locations, matches):
+        name = match['name']
+        confidence = match['confidence']
+        
+        results.append({
+            'name': name,
+            'confidence': float(confidence),
+            'location': {
+                'top': int(top),
+                'right': int(right),
+                'bottom': int(bottom),
+                'left': int(left)
+            }
+        })
+        if top_k > 1:
+            results[-1]['candidates'] = [
+                {'name': c['name'], 'confidence': c['confidence']}
+                for c in match['candidates']
+            ]
+        
+        print(f"  - {name} ({confidence:.1f}%)")
+    return results
+
+def _busy_response(endpoint, error):
+    """503 with Retry-After for a full inference queue"""
+    logger.log_event(endpoint, 'rejected', False, str(error), {'queue_depth': error.depth})
+    response = jsonify({
+        'success': False,
+        'error': 'Server busy, please retry later'
+    })
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
+
 @app.route('/recognize', methods=['POST'])
 def recognize():
-    if encodings is None:
+    matcher = current_gallery()
+    if matcher is None:
         return jsonify({
             'success': False,
             'error': 'Model not loaded'
@@ -154,74 +662,72 @@ def recognize():
             }), 400
         
         image_file = request.files['image']
+        try:
+            top_k, match_mode = _match_options()
+            detect_options = _detect_options()
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
         
-        # Open and convert image
-        image = Image.open(image_file.stream)
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        image_array = np.array(image)
-        
-        print(f"Processing image: {image.width}x{image.height}")
+        # Decode, detect and encode in the inference pool
+        try:
+            detection, timing = inference.run(profiler.pool_job(detect_faces, inference),
+                                              image_file.read(), *detect_options)
+            detection = profiler.unwrap(detection)
+        except QueueFull as e:
+            return _busy_response('/recognize', e)
+        except InferenceTimeout as e:
+            logger.log_event('/recognize', 'error', False, str(e))
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 504
         
-        # Detect faces
-        face_locations = face_recognition.face_locations(image_array, model="hog")
-        face_encodings = face_recognition.face_encodings(image_array, face_locations)
+        image_size = {'width': detection['width'], 'height': detection['height']}
+        face_locations = detection['locations']
+        face_encodings = detection['encodings']
+        timing.update(detection['stages'])
+        _observe_detection('/recognize', detection, timing)
         
+        print(f"Processed image: {image_size['width']}x{image_size['height']} "
+              f"(detected at {detection['detect_size']['width']}x{detection['detect_size']['height']}) "
+              f"(queue depth {timing['queue_depth']}, waited {timing['wait_ms']}ms, "
+              f"service {timing['service_ms']}ms)")
         print(f"Found {len(face_encodings)} face(s)")
         
-        results = []
-        for (top, right, bottom, left), face_encoding in zip(face_locations, face_encodings):
-            # Match faces
-            matches = face_recognition.compare_faces(
-                encodings["encodings"], 
-                face_encoding,
-                tolerance=0.6
-            )
-            
-            name = "Unknown"
-            confidence = 0
-            
-            if True in matches:
-                face_distances = face_recognition.face_distance(
-                    encodings["encodings"], 
-                    face_encoding
-                )
-                best_match_index = np.argmin(face_distances)
-                if matches[best_match_index]:
-                    name = encodings["names"][best_match_index]
-                    confidence = (1 - face_distances[best_match_index]) * 100
-            
-            results.append({
-                'name': name,
-                'confidence': float(confidence),
-                'location': {
-                    'top': int(top),
-                    'right': int(right),
-                    'bottom': int(bottom),
-                    'left': int(left)
-                }
-            })
-            
-            print(f"  - {name} ({confidence:.1f}%)")
+        # Match every face in the image against the gallery in one pass
+        with metrics.STAGE_SECONDS.time(endpoint='/recognize', stage='match'):
+            matches = matcher.match(face_encodings, tolerance=DEFAULT_TOLERANCE,
+                                    top_k=top_k, mode=_effective_mode(matcher, match_mode),
+                                    refine_people=PROTOTYPE_REFINE_PEOPLE)
+        results = _face_results(face_locations, matches, top_k)
         
-        # Log the recognition event
+        # Log the recognition event with a sighting per face; clients that forward the
+        # result (the Pi's /pi/results) send recognition_id back so it is not counted twice
+        recognition_id = uuid.uuid4().hex
         log_msg = f"Recognized {len(results)} face(s)"
-        logger.log_event('/recognize', 'recognition', True, log_msg, {
-            'faces': results,
-            'image_size': {'width': image.width, 'height': image.height},
-            'total_faces': len(results)
-        })
+        with metrics.STAGE_SECONDS.time(endpoint='/recognize', stage='log'):
+            logger.log_event('/recognize', 'recognition', True, log_msg, {
+                'recognition_id': recognition_id,
+                'faces': results,
+                'image_size': image_size,
+                'total_faces': len(results),
+                'timing': timing
+            }, sightings=logger.sightings_of(results, _device_id(), recognition_id))
 
-        return jsonify({
+        response = jsonify({
             'success': True,
+            'recognition_id': recognition_id,
             'faces': results,
             'total_faces': len(results),
-            'image_size': {
-                'width': image.width,
-                'height': image.height
-            }
+            'image_size': image_size
         })
+        response.headers['X-Queue-Depth'] = str(timing['queue_depth'])
+        response.headers['X-Queue-Wait-Ms'] = str(timing['wait_ms'])
+        response.headers['X-Service-Ms'] = str(timing['service_ms'])
+        return response
         
     except Exception as e:
         print(f"Error: {str(e)}")
@@ -231,6 +737,136 @@ def recognize():
             'error': str(e)
         }), 500
 
+def _archive_images(archive_file):
+    """(filename, bytes) for every image in an uploaded zip or tar archive"""
+    data = archive_file.read()
+    images = []
+    if zipfile.is_zipfile(io.BytesIO(data)):
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or not info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                if info.file_size > BATCH_MAX_IMAGE_BYTES:
+                    raise ValueError(f'{info.filename} is larger than {BATCH_MAX_IMAGE_BYTES} bytes')
+                images.append((info.filename, archive.read(info)))
+                if len(images) > BATCH_MAX_IMAGES:
+                    break
+    else:
+        with tarfile.open(fileobj=io.BytesIO(data), mode='r:*') as archive:
+            for member in archive:
+                if not member.isfile() or not member.name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                if member.size > BATCH_MAX_IMAGE_BYTES:
+                    raise ValueError(f'{member.name} is larger than {BATCH_MAX_IMAGE_BYTES} bytes')
+                images.append((member.name, archive.extractfile(member).read()))
+                if len(images) > BATCH_MAX_IMAGES:
+                    break
+    return images
+
+@app.route('/recognize/batch', methods=['POST'])
+def recognize_batch():
+    """Recognize faces in several images: multiple "image" parts or one "archive" (zip/tar)"""
+    matcher = current_gallery()
+    if matcher is None:
+        return jsonify({
+            'success': False,
+            'error': 'Model not loaded'
+        }), 500
+    
+    try:
+        try:
+            top_k, match_mode = _match_options()
+            detect_options = _detect_options()
+            if 'archive' in request.files:
+                images = _archive_images(request.files['archive'])
+            else:
+                images = [(f.filename, f.read()) for f in request.files.getlist('image')]
+        except (ValueError, tarfile.TarError) as e:
+            return jsonify({
+                'success': False,
+                'error': f'Invalid request: {str(e)}'
+            }), 400
+        
+        if not images:
+            logger.log_event('/recognize/batch', 'recognition', False, 'No images provided')
+            return jsonify({
+                'success': False,
+                'error': 'No images provided. Send form-data "image" parts or one "archive" (zip/tar)'
+            }), 400
+        if len(images) > BATCH_MAX_IMAGES:
+            return jsonify({
+                'success': False,
+                'error': f'Too many images (max {BATCH_MAX_IMAGES} per batch)'
+            }), 400
+        
+        # Detect and encode every image in parallel in the inference pool
+        try:
+            outcomes = inference.run_many(profiler.pool_job(detect_faces, inference),
+                                          [(data, *detect_options) for _, data in images])
+            outcomes = [(profiler.unwrap(detection), timing) for detection, timing in outcomes]
+        except QueueFull as e:
+            return _busy_response('/recognize/batch', e)
+        
+        # Match all faces from all images in one vectorized pass
+        all_encodings = [enc for detection, timing in outcomes if timing is not None
+                         for enc in detection['encodings']]
+        with metrics.STAGE_SECONDS.time(endpoint='/recognize/batch', stage='match'):
+            matches = iter(matcher.match(all_encodings, tolerance=DEFAULT_TOLERANCE, top_k=top_k,
+                                         mode=_effective_mode(matcher, match_mode),
+                                         refine_people=PROTOTYPE_REFINE_PEOPLE))
+        
+        image_results = []
+        for (filename, _), (detection, timing) in zip(images, outcomes):
+            if timing is None:
+                image_results.append({'image': filename, 'success': False, 'error': str(detection)})
+                continue
+            image_matches = [next(matches) for _ in detection['encodings']]
+            timing.update(detection['stages'])
+            _observe_detection('/recognize/batch', detection, timing)
+            faces = _face_results(detection['locations'], image_matches, top_k)
+            image_results.append({
+                'image': filename,
+                'success': True,
+                'faces': faces,
+                'total_faces': len(faces),
+                'image_size': {'width': detection['width'], 'height': detection['height']},
+                'timing': timing
+            })
+        
+        total_faces = sum(r.get('total_faces', 0) for r in image_results)
+        failed = sum(1 for r in image_results if not r['success'])
+        print(f"Batch: {len(images)} image(s), {total_faces} face(s), {failed} failed")
+        
+        # One aggregated log row for the whole batch, with a sighting per face
+        recognition_id = uuid.uuid4().hex
+        device = _device_id()
+        with metrics.STAGE_SECONDS.time(endpoint='/recognize/batch', stage='log'):
+            logger.log_event('/recognize/batch', 'recognition', failed < len(images),
+                             f"Recognized {total_faces} face(s) in {len(images)} image(s)", {
+                'recognition_id': recognition_id,
+                'images': [{k: v for k, v in r.items() if k != 'timing'} for r in image_results],
+                'total_images': len(images),
+                'failed_images': failed,
+                'total_faces': total_faces
+            }, sightings=[sighting for r in image_results
+                          for sighting in logger.sightings_of(r.get('faces'), device, recognition_id)])
+        
+        return jsonify({
+            'success': True,
+            'recognition_id': recognition_id,
+            'results': image_results,
+            'total_images': len(images),
+            'total_faces': total_faces
+        })
+        
+    except Exception as e:
+        print(f"Error in batch recognition: {str(e)}")
+        logger.log_event('/recognize/batch', 'error', False, str(e))
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @app.route('/enroll', methods=['POST'])
 def enroll():
     """Receive and store enrollment images temporarily"""
@@ -256,13 +892,12 @@ def enroll():
             }), 400
         
         image_file = request.files['image']
+        image_bytes = image_file.read()
         
         # Validate image and detect face
         try:
-            image = Image.open(image_file.stream)
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            image_array = np.array(image)
+            image = Image.open(io.BytesIO(image_bytes))
+            image.load()
         except Exception as e:
             logger.log_event('/enroll', 'enrollment_error', False, f'Invalid image: {str(e)}', {'name': name})
             return jsonify({
@@ -270,9 +905,22 @@ def enroll():
                 'error': f'Invalid image format: {str(e)}'
             }), 400
         
-        # Detect faces in the image
-        face_locations = face_recognition.face_locations(image_array, model="hog")
-        face_encodings = face_recognition.face_encodings(image_array, face_locations)
+        # Detect faces in the inference pool, at native resolution
+        try:
+            detection, timing = inference.run(profiler.pool_job(detect_faces, inference), image_bytes, 0, False)
+            detection = profiler.unwrap(detection)
+        except QueueFull as e:
+            return _busy_response('/enroll', e)
+        except InferenceTimeout as e:
+            logger.log_event('/enroll', 'error', False, str(e), {'name': name})
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 504
+        timing.update(detection['stages'])
+        _observe_detection('/enroll', detection, timing)
+        face_locations = detection['locations']
+        face_encodings = detection['encodings']
         
         if len(face_encodings) == 0:
             return jsonify({
@@ -286,21 +934,14 @@ def enroll():
                 'error': 'Multiple faces detected. Please capture only one person per image.'
             }), 400
         
-        # Create directory for this person's enrollment
+        # Save the image with timestamp, plus the encoding so /train does not recompute it
         person_dir = os.path.join(temp_enrollments_path, name)
-        os.makedirs(person_dir, exist_ok=True)
-        
-        # Save image with timestamp
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
-        image_filename = f"{timestamp}.jpg"
-        image_path = os.path.join(person_dir, image_filename)
-        
-        # Reset stream and save
-        image_file.stream.seek(0)
-        image.save(image_path, 'JPEG', quality=95)
+        image_filename = enrollments.save_enrollment(person_dir, timestamp, image_bytes, image,
+                                                     face_encodings[0], face_locations[0])
         
         # Count images for this person
-        image_count = len([f for f in os.listdir(person_dir) if f.endswith('.jpg')])
+        image_count = len(enrollments.list_images(person_dir))
         
         print(f"✅ Enrolled image for {name}: {image_filename} (total: {image_count})")
         
@@ -324,9 +965,186 @@ def enroll():
             'error': str(e)
         }), 500
 
+def _train_person(job, report):
+    """Merge a person's enrolled images into the gallery"""
+    name = job['name']
+    person_dir = os.path.join(temp_enrollments_path, name)
+    
+    if job['gallery_version'] is None:
+        image_files = enrollments.list_images(person_dir) if os.path.isdir(person_dir) else []
+        if len(image_files) == 0:
+            raise ValueError(f'No enrollment images found for {name}')
+        
+        print(f"Training model for {name} with {len(image_files)} images...")
+        job.update(images_total=len(image_files), images_processed=0, faces_added=0,
+                   encodings_reused=0, errors=[])
+        new_encodings = []
+        
+        # Encodings computed by /enroll are reused; only older images are processed again
+        to_process = []
+        for image_file in image_files:
+            stored = enrollments.load_encoding(os.path.join(person_dir, image_file))
+            if stored is None:
+                to_process.append(image_file)
+            else:
+                new_encodings.append(stored[0])
+        job['images_processed'] = job['faces_added'] = job['encodings_reused'] = len(new_encodings)
+        report()
+        
+        # The rest in parallel, in the low-priority training pool
+        step = training_inference.capacity
+        for i in range(0, len(to_process), step):
+            chunk = to_process[i:i + step]
+            args = []
+            for image_file in chunk:
+                with open(os.path.join(person_dir, image_file), 'rb') as f:
+                    args.append((f.read(), DETECT_MAX_DIM, True))
+            outcomes = training_inference.run_many(profiler.pool_job(detect_faces, training_inference), args)
+            for image_file, (detection, timing) in zip(chunk, outcomes):
+                detection = profiler.unwrap(detection)
+                if timing is None:
+                    print(f"Warning: Failed to process {image_file}: {str(detection)}")
+                    job['errors'].append({'image': image_file, 'error': str(detection)})
+                else:
+                    # Add each face encoding found in the image
+                    new_encodings.extend(detection['encodings'])
+                    job['faces_added'] += len(detection['encodings'])
+                job['images_processed'] += 1
+            report()
+        
+        if job['faces_added'] == 0:
+            raise ValueError('No valid faces found in enrollment images')
+        
+        with version_segment.lock():
+            current = latest_gallery()
+            replace = bool(job.get('replace'))
+            
+            if PRUNE_MIN_DISTANCE > 0 or PRUNE_MAX_PER_PERSON:
+                # Prune together with the person's existing encodings; if anything goes, replace them all
+                candidates = np.asarray(new_encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+                if not replace:
+                    candidates = np.concatenate([current.person_encodings(name), candidates])
+                keep = prune_person(candidates, PRUNE_MIN_DISTANCE, PRUNE_MAX_PER_PERSON)
+                job['faces_pruned'] = len(candidates) - len(keep)
+                if job['faces_pruned']:
+                    new_encodings = candidates[keep]
+                    replace = True
+            
+            # Replacing a person tombstones the old encodings in the same version
+            deleted = [name] if replace else []
+            
+            # Extend the gallery (and its index) in memory; only the new rows are written out
+            names = [name] * len(new_encodings)
+            updated = ensure_index(current.without(deleted).extended(names, new_encodings))
+            version = publish_segment(updated, names, new_encodings, deleted)
+            # Recorded straight away: a resumed job must not add the same faces twice
+            job.update(gallery_version=version, total_faces=updated.live_rows, processed_files=image_files)
+            report()
+        
+        print(f"✅ Appended {len(new_encodings)} encodings to {gallery_path} "
+              f"({job.get('faces_pruned', 0)} pruned, gallery version {version})")
+        print(f"✅ Total faces: {updated.live_rows} ({job['encodings_reused']} enrollment encoding(s) reused)")
+    
+    # Clean up the processed enrollment files (images enrolled meanwhile are kept)
+    try:
+        for image_file in job.get('processed_files', []):
+            image_path = os.path.join(person_dir, image_file)
+            for path in (image_path, enrollments.sidecar_path(image_path)):
+                if os.path.exists(path):
+                    os.remove(path)
+        if os.path.isdir(person_dir) and not os.listdir(person_dir):
+            os.rmdir(person_dir)
+        print(f"✅ Cleaned up temporary enrollment directory for {name}")
+    except Exception as e:
+        print(f"Warning: Failed to clean up {person_dir}: {str(e)}")
+    
+    logger.log_event('/train', 'training', True, f'Training complete for {name}', {
+        'job_id': job['id'],
+        'name': name,
+        'faces_added': job['faces_added'],
+        'encodings_reused': job['encodings_reused'],
+        'faces_pruned': job.get('faces_pruned', 0),
+        'errors': len(job['errors']),
+        'total_faces': job['total_faces']
+    })
+
+def _run_training_job(job, report):
+    """Runs on the training-jobs thread; raising marks the job failed"""
+    try:
+        with profiler.sampled('/train'):
+            _train_person(job, report)
+    except Exception as e:
+        logger.log_event('/train', 'error', False, str(e), {'job_id': job['id'], 'name': job['name']})
+        raise
+
+training_jobs = TrainingJobs(training_jobs_path, _run_training_job,
+                             keep_finished=int(os.environ.get('TRAIN_JOBS_KEEP', 500)))
+
+@app.before_request
+def _start_background_work():
+    training_jobs.start()
+    log_maintenance.start()
+    metrics.start()
+    g.request_started = time.perf_counter()
+    if request.url_rule is not None:
+        g.profile = profiler.maybe_start(request.url_rule.rule)
+
+@app.after_request
+def _count_request(response):
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    metrics.REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    started = g.get('request_started')
+    if started is not None:
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+    profiler.finish(g.pop('profile', None), response.status_code)
+    return response
+
+@app.teardown_request
+def _finish_profile(error=None):
+    # Requests that ended without a response still stop their sampler
+    profiler.finish(g.pop('profile', None), 'error')
+
+def _queue_training(name, endpoint, replace=False):
+    """Queue a training job for the enrolled images of `name`; 202 with the job id"""
+    person_dir = os.path.join(temp_enrollments_path, name)
+    
+    if not os.path.exists(person_dir):
+        return jsonify({
+            'success': False,
+            'error': f'No enrollment images found for {name}'
+        }), 404
+    
+    # Get all images for this person
+    image_files = enrollments.list_images(person_dir)
+    
+    if len(image_files) == 0:
+        return jsonify({
+            'success': False,
+            'error': f'No images found for {name}'
+        }), 400
+    
+    job, created = training_jobs.submit(name, len(image_files), replace=replace)
+    action = 'Replacement' if replace else 'Training'
+    if created:
+        print(f"📋 Queued {action.lower()} job {job['id']} for {name} ({len(image_files)} images)")
+        logger.log_event(endpoint, 'training_queued', True, f'{action} queued for {name}', {
+            'job_id': job['id'],
+            'name': name,
+            'replace': replace,
+            'images': len(image_files)
+        })
+    
+    return jsonify({
+        'success': True,
+        'message': f'{action} {"queued" if created else "already pending"} for {name}',
+        'job_id': job['id'],
+        'status': job['status'],
+        'status_url': f"/train/{job['id']}"
+    }), 202
+
 @app.route('/train', methods=['POST'])
 def train():
-    """Train model with enrolled images for a specific person"""
+    """Queue a training job for the enrolled images of a specific person"""
     try:
         if not request.is_json:
             return jsonify({
@@ -348,98 +1166,79 @@ def train():
                 'error': 'Name cannot be empty'
             }), 400
         
-        person_dir = os.path.join(temp_enrollments_path, name)
-        
-        if not os.path.exists(person_dir):
-            return jsonify({
-                'success': False,
-                'error': f'No enrollment images found for {name}'
-            }), 404
-        
-        # Get all images for this person
-        image_files = [f for f in os.listdir(person_dir) if f.endswith(('.jpg', '.jpeg', '.png'))]
-        
-        if len(image_files) == 0:
-            return jsonify({
-                'success': False,
-                'error': f'No images found for {name}'
-            }), 400
-        
-        print(f"Training model for {name} with {len(image_files)} images...")
-        
-        # Load existing encodings or create new
-        if encodings is None or not os.path.exists(encodings_path):
-            print("Starting fresh training...")
-            names_list = []
-            encodings_list = []
-        else:
-            names_list = list(encodings['names'])
-            encodings_list = list(encodings['encodings'])
-        
-        faces_added = 0
-        
-        # Process each image
-        for image_file in image_files:
-            image_path = os.path.join(person_dir, image_file)
-            try:
-                img = face_recognition.load_image_file(image_path)
-                face_locations = face_recognition.face_locations(img, model="hog")
-                face_encodings_batch = face_recognition.face_encodings(img, face_locations)
-                
-                # Add each face encoding found in the image
-                for face_encoding in face_encodings_batch:
-                    names_list.append(name)
-                    encodings_list.append(face_encoding)
-                    faces_added += 1
-                    
-            except Exception as e:
-                print(f"Warning: Failed to process {image_file}: {str(e)}")
-                continue
-        
-        if faces_added == 0:
-            return jsonify({
-                'success': False,
-                'error': 'No valid faces found in enrollment images'
-            }), 400
-        
-        # Save updated encodings
-        updated_encodings = {"names": names_list, "encodings": encodings_list}
-        
-        # Ensure directory exists
-        os.makedirs(os.path.dirname(encodings_path), exist_ok=True)
-        
-        with open(encodings_path, "wb") as f:
-            pickle.dump(updated_encodings, f)
-        
-        print(f"✅ Saved updated encodings to {encodings_path}")
-        print(f"✅ Total faces: {len(encodings_list)}")
+        return _queue_training(name, '/train')
         
-        # Hot reload encodings
-        reload_encodings()
-        
-        # Clean up temporary enrollment directory
-        try:
-            shutil.rmtree(person_dir)
-            print(f"✅ Cleaned up temporary enrollment directory for {name}")
-        except Exception as e:
-            print(f"Warning: Failed to clean up {person_dir}: {str(e)}")
+    except Exception as e:
+        print(f"Error in train: {str(e)}")
+        logger.log_event('/train', 'error', False, str(e))
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/train/<job_id>', methods=['GET'])
+def train_status(job_id):
+    """Progress of a training job"""
+    job = training_jobs.load(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': f'Unknown training job {job_id}'
+        }), 404
+    job.pop('processed_files', None)
+    return jsonify({'success': True, 'job': job})
+
+@app.route('/people/<name>', methods=['DELETE'])
+def delete_person(name):
+    """Remove a person's encodings from the gallery (all workers)"""
+    try:
+        started = time.time()
+        with version_segment.lock():
+            current = latest_gallery()
+            if current is None or name not in current.live_people:
+                return jsonify({
+                    'success': False,
+                    'error': f'Unknown person: {name}'
+                }), 404
+            
+            # Tombstone in memory and on disk; the rows go away at the next compaction
+            updated = current.without([name])
+            version = publish_segment(updated, [], [], deleted=[name])
         
-        logger.log_event('/train', 'training', True, f'Training complete for {name}', {
+        faces_removed = current.live_rows - updated.live_rows
+        elapsed_ms = round((time.time() - started) * 1000, 1)
+        print(f"🗑️ Removed {name} ({faces_removed} encodings, gallery version {version}, {elapsed_ms}ms)")
+        logger.log_event('/people', 'person_deleted', True, f'Removed {name}', {
             'name': name,
-            'faces_added': faces_added,
-            'total_faces': len(encodings_list)
+            'faces_removed': faces_removed,
+            'total_faces': updated.live_rows,
+            'gallery_version': version
         })
         
         return jsonify({
             'success': True,
-            'message': f'Training complete for {name}',
-            'faces_added': faces_added,
-            'total_faces': len(encodings_list)
+            'message': f'Removed {name}',
+            'faces_removed': faces_removed,
+            'total_faces': updated.live_rows,
+            'gallery_version': version
         })
         
     except Exception as e:
-        print(f"Error in train: {str(e)}")
-        logger.log_event('/train', 'error', False, str(e))
+        print(f"Error in delete_person: {str(e)}")
+        logger.log_event('/people', 'error', False, str(e))
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/people/<name>', methods=['PUT'])
+def replace_person(name):
+    """Replace a person's encodings with their current enrollment images (background job)"""
+    try:
+        return _queue_training(name.strip(), '/people', replace=True)
+    except Exception as e:
+        print(f"Error in replace_person: {str(e)}")
+        logger.log_event('/people', 'error', False, str(e))
         return jsonify({
             'success': False,
             'error': str(e)
@@ -495,8 +1294,17 @@ def pi_results():
         
         # Log interesting results
         faces = data.get('faces', [])
-        if faces:
-            logger.log_event('/pi/results', 'pi_recognition', True, f"Pi detected {len(faces)} faces", data)
+        if faces and data.get('recognition_id'):
+            # Echo of a /recognize call, whose log row already holds the faces and sightings
+            logger.log_event('/pi/results', 'pi_recognition', True, f"Pi detected {len(faces)} faces", {
+                'recognition_id': data['recognition_id'],
+                'names': [face.get('name') for face in faces],
+                'total_faces': len(faces),
+                'speech_text': data.get('speech_text')
+            })
+        elif faces:
+            logger.log_event('/pi/results', 'pi_recognition', True, f"Pi detected {len(faces)} faces", data,
+                             sightings=logger.sightings_of(faces, _device_id()))
             
         return jsonify({'success': True})
     
@@ -0,0 +1,61 @@
+"""Enrollment images and the encodings computed for them at /enroll time.
+
+Every enrolled image ``<stamp>.jpg`` (or ``.png``) gets a sidecar
+``<stamp>.npz`` holding the face encoding and box that /enroll already had to
+compute to validate the photo, so /train only has to read the sidecars.
+Images without a sidecar (enrolled by an older version) are processed again.
+"""
+
+import os
+import zipfile
+
+import numpy as np
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+SIDECAR_EXTENSION = '.npz'
+
+# Upload formats stored byte-for-byte; anything else is re-encoded as JPEG
+_STORED_FORMATS = {'JPEG': '.jpg', 'PNG': '.png'}
+
+
+def sidecar_path(image_path):
+    return os.path.splitext(image_path)[0] + SIDECAR_EXTENSION
+
+
+def save_enrollment(person_dir, stamp, image_bytes, image, encoding, location):
+    """Store an enrollment image with its encoding; returns the image filename.
+
+    The sidecar is written first, so an image on disk always has either a
+    complete sidecar or none at all.
+    """
+    os.makedirs(person_dir, exist_ok=True)
+    extension = _STORED_FORMATS.get(image.format, '.jpg')
+    image_path = os.path.join(person_dir, stamp + extension)
+
+    tmp_path = os.path.join(person_dir, f'.{stamp}.{os.getpid()}.tmp{SIDECAR_EXTENSION}')
+    np.savez(tmp_path, encoding=np.asarray(encoding, dtype=np.float64),
+             location=np.asarray(location, dtype=np.int32))
+    os.replace(tmp_path, sidecar_path(image_path))
+
+    if image.format in _STORED_FORMATS:
+        # Keep the original upload instead of recompressing it
+        with open(image_path, 'wb') as f:
+            f.write(image_bytes)
+    else:
+        image.convert('RGB').save(image_path, 'JPEG', quality=95)
+    return os.path.basename(image_path)
+
+
+def list_images(person_dir):
+    """Enrollment image filenames of one person, oldest first"""
+    return sorted(f for f in os.listdir(person_dir)
+                  if f.lower().endswith(IMAGE_EXTENSIONS) and not f.startswith('.'))
+
+
+def load_encoding(image_path):
+    """The stored (encoding, location) of an enrollment image, or None without a sidecar"""
+    try:
+        with np.load(sidecar_path(image_path)) as data:
+            return data['encoding'], tuple(int(v) for v in data['location'])
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        return None
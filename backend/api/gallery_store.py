@@ -0,0 +1,465 @@
+"""Binary on-disk gallery format, loaded with np.memmap.
+
+Layout of a ``.gal`` file::
+
+    8 bytes   magic b"IXGALLRY"
+    uint32    format version
+    uint32    header length
+    JSON      header: dim, count, dtype, people table, array offsets
+    dtype     (count, dim) encoding matrix, rows grouped by person
+    int32     (count,) person id of every row (index into the people table)
+    float32   (lists, dim) IVF centroids            -- optional, see ``index``
+    int32     (count,) IVF list of every row         -- optional
+
+The matrix is float32, or since format v2 float16 or int8; an int8 header
+also holds the per-dimension ``scales`` (see ``quantization``). float32
+files are still written as v1 so older readers can load them. A base file
+may also carry the IVF index trained on it (``index`` in the header), so
+workers and later versions extend that index instead of running k-means
+again; readers that do not know it just ignore the extra arrays.
+
+Arrays start on 64-byte boundaries so the matrix can be mapped read-only and
+its pages shared between gunicorn workers by the OS page cache.
+
+A gallery is an immutable base file plus append-only delta segments in
+``<path>.segments/``: each training run writes one small segment file (same
+format, named after its generation) instead of rewriting the base. Loading
+reads every segment newer than the base's generation; ``load_layers()``
+keeps the mapped base apart from the merged segment rows, so the API never
+copies the base, and ``compact()`` folds the segments back into a new base.
+A segment may carry tombstones (``deleted`` people in its header): their rows
+in the base and in earlier segments are dropped before the segment's own rows
+are added.
+"""
+
+import json
+import os
+import pickle
+import struct
+
+import numpy as np
+
+from .ann_index import nearest_centroids
+from .quantization import PRECISIONS, dequantize, precision_of, requantize
+
+MAGIC = b'IXGALLRY'
+FORMAT_VERSION = 2
+ENCODING_DIM = 128
+ALIGNMENT = 64
+# Rows converted to float32 at a time when assigning them to IVF lists
+ASSIGN_BLOCK_ROWS = 1 << 16
+
+_PREAMBLE = struct.Struct('<8sII')
+
+
+class GalleryFormatError(ValueError):
+    """Raised when a file is not a readable gallery"""
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def save_gallery(path, people, person_ids, matrix, extra=None, scales=None, index=None):
+    """Atomically write a gallery file (temp file + fsync + rename).
+
+    A float16 or int8 ``matrix`` is stored as-is (int8 with its ``scales``),
+    anything else as float32. ``index`` is an optional IVF index as
+    (centroids, list of every row).
+    """
+    if precision_of(np.asarray(matrix)) not in PRECISIONS:
+        matrix = np.asarray(matrix, dtype=np.float32)
+    matrix = np.ascontiguousarray(matrix).reshape(-1, ENCODING_DIM)
+    precision = precision_of(matrix)
+    person_ids = np.ascontiguousarray(person_ids, dtype=np.int32)
+    if len(person_ids) != len(matrix):
+        raise ValueError('person_ids and matrix must have the same number of rows')
+
+    header = {
+        'dim': ENCODING_DIM,
+        'count': len(matrix),
+        'dtype': precision,
+        'people': list(people),
+        **(extra or {}),
+    }
+    if scales is not None:
+        header['scales'] = [float(s) for s in scales]
+    if index is not None:
+        centroids = np.ascontiguousarray(index[0], dtype=np.float32).reshape(-1, ENCODING_DIM)
+        assignments = np.ascontiguousarray(index[1], dtype=np.int32)
+        if len(assignments) != len(matrix):
+            raise ValueError('the index must assign every row of matrix')
+        header['index'] = {'lists': len(centroids), 'centroids_offset': 0, 'assignments_offset': 0}
+    # Offsets depend on the header size, which depends on the offsets: reserve room first
+    header['matrix_offset'] = header['person_ids_offset'] = 0
+    header_len = len(json.dumps(header).encode()) + 128
+    header['matrix_offset'] = _align(_PREAMBLE.size + header_len)
+    header['person_ids_offset'] = _align(header['matrix_offset'] + matrix.nbytes)
+    if index is not None:
+        header['index']['centroids_offset'] = _align(header['person_ids_offset'] + person_ids.nbytes)
+        header['index']['assignments_offset'] = _align(header['index']['centroids_offset'] + centroids.nbytes)
+    header_bytes = json.dumps(header).encode().ljust(header_len)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_PREAMBLE.pack(MAGIC, 1 if precision == 'float32' else FORMAT_VERSION, header_len))
+        f.write(header_bytes)
+        f.seek(header['matrix_offset'])
+        f.write(matrix.tobytes())
+        f.seek(header['person_ids_offset'])
+        f.write(person_ids.tobytes())
+        if index is not None:
+            f.seek(header['index']['centroids_offset'])
+            f.write(centroids.tobytes())
+            f.seek(header['index']['assignments_offset'])
+            f.write(assignments.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_header(path):
+    """Return the JSON header of a gallery file"""
+    with open(path, 'rb') as f:
+        preamble = f.read(_PREAMBLE.size)
+        if len(preamble) < _PREAMBLE.size:
+            raise GalleryFormatError(f'{path} is too short to be a gallery file')
+        magic, version, header_len = _PREAMBLE.unpack(preamble)
+        if magic != MAGIC:
+            raise GalleryFormatError(f'{path} is not a gallery file')
+        if version > FORMAT_VERSION:
+            raise GalleryFormatError(f'{path} uses gallery format v{version}, newest supported is v{FORMAT_VERSION}')
+        header = json.loads(f.read(header_len))
+    header['version'] = version
+    return header
+
+
+def header_scales(header):
+    """Per-dimension scales of an int8 gallery (None for float galleries)"""
+    return np.asarray(header['scales'], dtype=np.float32) if 'scales' in header else None
+
+
+def load_gallery(path):
+    """Map a gallery file read-only; returns (people, person_ids, matrix, header).
+
+    The matrix keeps the stored precision; see ``header_scales``.
+    """
+    header = read_header(path)
+    count = header['count']
+    if count == 0:
+        return header['people'], np.zeros(0, dtype=np.int32), np.zeros((0, header['dim']), dtype=header['dtype']), header
+
+    matrix = np.memmap(path, dtype=header['dtype'], mode='r', offset=header['matrix_offset'],
+                       shape=(count, header['dim']))
+    person_ids = np.memmap(path, dtype=np.int32, mode='r', offset=header['person_ids_offset'],
+                           shape=(count,))
+    return header['people'], person_ids, matrix, header
+
+
+def load_index(path, header):
+    """(centroids, list of every row) of the IVF index stored in a gallery file, or None"""
+    index = header.get('index')
+    if not index or not header['count']:
+        return None
+    centroids = np.fromfile(path, dtype=np.float32, count=index['lists'] * header['dim'],
+                            offset=index['centroids_offset']).reshape(-1, header['dim'])
+    assignments = np.memmap(path, dtype=np.int32, mode='r', offset=index['assignments_offset'],
+                            shape=(header['count'],))
+    return centroids, assignments
+
+
+def load_pickle(path):
+    """Read a legacy encodings.pkl; returns (people, person_ids, matrix)"""
+    with open(path, 'rb') as f:
+        data = pickle.load(f)
+    people, person_ids = np.unique(np.array(data['names'], dtype=str), return_inverse=True)
+    matrix = np.asarray(data['encodings'], dtype=np.float32).reshape(-1, ENCODING_DIM)
+    return [str(p) for p in people], person_ids.astype(np.int32), matrix
+
+
+def gallery_path_for(pickle_path):
+    """The .gal file that sits next to a legacy .pkl"""
+    return os.path.splitext(pickle_path)[0] + '.gal'
+
+
+def is_gallery_file(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def segments_dir(path):
+    return f'{path}.segments'
+
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def segment_paths(path, after=0):
+    """(generation, path) of every delta segment newer than ``after``, oldest first"""
+    directory = segments_dir(path)
+    if not os.path.isdir(directory):
+        return []
+    segments = []
+    for name in os.listdir(directory):
+        stem, extension = os.path.splitext(name)
+        if extension == '.gal' and stem.isdigit() and int(stem) > after:
+            segments.append((int(stem), os.path.join(directory, name)))
+    return sorted(segments)
+
+
+def base_precision(path):
+    """Storage precision of the base file (None without one)"""
+    if not os.path.exists(path):
+        return None
+    return read_header(path)['dtype']
+
+
+def base_indexed(path):
+    """Whether the base file carries an IVF index"""
+    return os.path.exists(path) and 'index' in read_header(path)
+
+
+def base_generation(path):
+    """Generation recorded in the base file (0 without one)"""
+    if not os.path.exists(path):
+        return 0
+    return read_header(path).get('generation', 0)
+
+
+def latest_generation(path):
+    """Newest generation of a gallery, counting its delta segments"""
+    generation = base_generation(path)
+    segments = segment_paths(path, after=generation)
+    return segments[-1][0] if segments else generation
+
+
+def gallery_state(path):
+    """Changes whenever the base file is replaced or a segment is added or removed"""
+    state = []
+    for p in (path, segments_dir(path)):
+        try:
+            st = os.stat(p)
+            state.append((st.st_ino, st.st_mtime_ns))
+        except OSError:
+            state.append(None)
+    return tuple(state) if state[0] or state[1] else None
+
+
+def write_base(path, people, person_ids, matrix, generation, scales=None, index=None):
+    """Replace the base file and drop the delta segments it now contains"""
+    save_grouped(path, people, person_ids, matrix, extra={'generation': generation}, scales=scales, index=index)
+    for segment_generation, segment in segment_paths(path):
+        if segment_generation <= generation:
+            os.remove(segment)
+
+
+def append_segment(path, people, person_ids, matrix, generation, deleted=()):
+    """Durably add a delta segment; costs I/O proportional to the new rows only.
+
+    ``deleted`` people lose all the encodings they had before this segment.
+    """
+    directory = segments_dir(path)
+    os.makedirs(directory, exist_ok=True)
+    save_grouped(os.path.join(directory, f'{generation:010d}.gal'), people, person_ids, matrix,
+                 extra={'generation': generation, 'deleted': sorted(deleted)})
+    _fsync_dir(directory)
+
+
+def load_layers(path):
+    """Base gallery and its delta segments, kept apart.
+
+    Returns (base, delta, info). ``base`` is (people, person_ids, matrix),
+    the read-only memmaps of the base file; ``delta`` holds the rows of the
+    segments that are still live, merged in memory and converted to the
+    precision (and int8 scales) of the base. ``info`` has the newest
+    ``generation``, the number of ``segments`` and ``segment_rows`` read,
+    the int8 ``scales``, ``deleted``: the people whose base rows a
+    segment tombstoned, and the ``index`` stored with the base (see
+    ``load_index``).
+    """
+    if os.path.exists(path):
+        people, person_ids, matrix, header = load_gallery(path)
+        generation = header.get('generation', 0)
+        scales = header_scales(header)
+        index = load_index(path, header)
+    else:
+        people, person_ids = [], np.zeros(0, dtype=np.int32)
+        matrix = np.zeros((0, ENCODING_DIM), dtype=np.float32)
+        generation, scales, index = 0, None, None
+
+    segments = [load_gallery(segment) for _, segment in segment_paths(path, after=generation)]
+    if segments and not len(matrix):
+        # Nothing to take int8 scales from yet: merge in float32
+        matrix, scales = matrix.astype(np.float32), None
+    info = {'generation': generation, 'segments': len(segments),
+            'segment_rows': sum(header['count'] for *_, header in segments), 'scales': scales,
+            'deleted': [], 'index': index}
+
+    parts = []
+    deleted = set()
+    for p, ids, m, header in segments:
+        if header.get('deleted'):
+            deleted.update(header['deleted'])
+            parts = [_drop_people(part, header['deleted']) for part in parts]
+        m, _ = requantize(m, header_scales(header), precision_of(matrix), scales)
+        parts.append((p, ids, m))
+    if segments:
+        info['generation'] = segments[-1][3]['generation']
+        info['deleted'] = sorted(deleted)
+    return (people, person_ids, matrix), _merge(parts, matrix.dtype), info
+
+
+def load_segmented(path):
+    """Base gallery merged with its delta segments.
+
+    Returns (people, person_ids, matrix, info) like ``load_layers``. The
+    matrix has the precision of the base; without segments the arrays are
+    the read-only memmaps of the base, otherwise an in-memory copy.
+    """
+    base, delta, info = load_layers(path)
+    if not info['segments']:
+        return (*base, info)
+    people, person_ids, matrix = _merge([_drop_people(base, info['deleted']), delta], base[2].dtype)
+    return people, person_ids, matrix, info
+
+
+def _merge(parts, dtype):
+    """One (people, person_ids, matrix) from several, without people left with no rows"""
+    if not parts:
+        return [], np.zeros(0, dtype=np.int32), np.zeros((0, ENCODING_DIM), dtype=dtype)
+    merged = sorted(set().union(*(p for p, _, _ in parts)))
+    lookup = {person: i for i, person in enumerate(merged)}
+    person_ids = np.concatenate([np.array([lookup[person] for person in p], dtype=np.int32)[ids]
+                                 for p, ids, _ in parts])
+    matrix = np.concatenate([m for _, _, m in parts]).reshape(-1, ENCODING_DIM)
+    # People whose rows were all deleted leave the table
+    used = np.unique(person_ids)
+    merged = [merged[i] for i in used]
+    person_ids = np.searchsorted(used, person_ids).astype(np.int32)
+    return merged, person_ids, matrix
+
+
+def _drop_people(part, names):
+    """A (people, person_ids, matrix) part without the rows of ``names``"""
+    people, person_ids, matrix = part
+    dropped = np.isin(np.asarray(people, dtype=str), list(names))
+    if not dropped.any() or not len(person_ids):
+        return part
+    keep = ~dropped[person_ids]
+    return people, person_ids[keep], matrix[keep]
+
+
+def compact(path, precision=None, centroids=None):
+    """Fold all delta segments into a new base file; returns the number merged.
+
+    With ``precision`` the base is also rewritten if it is stored differently.
+    The IVF index stored with the base is carried over, segment rows going to
+    their nearest list; ``centroids`` (trained elsewhere) index a base that
+    has none.
+    """
+    (people, person_ids, matrix), delta, info = load_layers(path)
+    scales = info['scales']
+    converted = precision is not None and precision_of(matrix) != precision
+    add_index = info['index'] is None and centroids is not None
+    if not (info['segments'] or converted or add_index):
+        return 0
+
+    keep = ~np.isin(np.asarray(people, dtype=str), info['deleted'])[person_ids] if info['deleted'] \
+        else np.ones(len(person_ids), dtype=bool)
+    people, person_ids, matrix = _merge([(people, person_ids[keep], matrix[keep]), delta], matrix.dtype)
+    index = None
+    if info['index'] is not None:
+        centroids, assignments = info['index']
+        added = _assign(delta[2], scales, centroids)
+        index = (centroids, np.concatenate([np.asarray(assignments)[keep], added]))
+    elif centroids is not None:
+        index = (centroids, _assign(matrix, scales, centroids))
+    if converted:
+        matrix, scales = requantize(matrix, scales, precision)
+    write_base(path, people, person_ids, matrix, info['generation'], scales, index)
+    return info['segments']
+
+
+def _assign(matrix, scales, centroids):
+    """IVF list of every stored row, converting ``ASSIGN_BLOCK_ROWS`` rows at a time"""
+    return np.concatenate([np.zeros(0, dtype=np.int32)] + [
+        nearest_centroids(dequantize(matrix[i:i + ASSIGN_BLOCK_ROWS], scales), centroids).astype(np.int32)
+        for i in range(0, len(matrix), ASSIGN_BLOCK_ROWS)])
+
+
+def load_any(path):
+    """Load either format; a .pkl is superseded by an up-to-date .gal next to it.
+
+    Delta segments of a .gal are included.
+
+    Returns (people, person_ids, matrix).
+    """
+    if not os.path.exists(path):
+        path = gallery_path_for(path)
+    if not is_gallery_file(path):
+        sibling = gallery_path_for(path)
+        if not (os.path.exists(sibling) and os.path.getmtime(sibling) >= os.path.getmtime(path)):
+            return load_pickle(path)
+        path = sibling
+    people, person_ids, matrix, info = load_segmented(path)
+    return people, person_ids, dequantize(matrix, info['scales'])
+
+
+def load_names_and_encodings(path):
+    """Load either format as the classic (names, encodings) pair used by the scripts"""
+    people, person_ids, matrix = load_any(path)
+    return [people[i] for i in person_ids], matrix
+
+
+def save_grouped(path, people, person_ids, matrix, extra=None, scales=None, index=None):
+    """Write a gallery with its rows (and their IVF lists) regrouped by person"""
+    order = np.argsort(person_ids, kind='stable')
+    if index is not None:
+        index = (index[0], np.asarray(index[1])[order])
+    save_gallery(path, people, np.asarray(person_ids)[order], np.asarray(matrix)[order], extra, scales, index)
+
+
+def _people_and_ids(names):
+    people, person_ids = np.unique(np.array(list(names), dtype=str), return_inverse=True)
+    return [str(p) for p in people], person_ids.astype(np.int32)
+
+
+def save_names_and_encodings(path, names, encodings, generation=0):
+    """Write the classic (names, encodings) pair used by the scripts as a new base gallery"""
+    people, person_ids = _people_and_ids(names)
+    matrix = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+    write_base(path, people, person_ids, matrix, generation)
+
+
+def append_names_and_encodings(path, names, encodings, generation, deleted=()):
+    """Add (names, encodings) to a gallery as one delta segment, after removing ``deleted`` people"""
+    people, person_ids = _people_and_ids(names)
+    matrix = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+    append_segment(path, people, person_ids, matrix, generation, deleted)
+
+
+def convert_pickle(pickle_path, gallery_path=None, precision='float32'):
+    """Write the .gal equivalent of a legacy pickle (replacing any delta segments)"""
+    gallery_path = gallery_path or gallery_path_for(pickle_path)
+    people, person_ids, matrix = load_pickle(pickle_path)
+    matrix, scales = requantize(matrix, None, precision)
+    write_base(gallery_path, people, person_ids, matrix, latest_generation(gallery_path) + 1, scales)
+    return gallery_path, len(matrix), len(people)
+
+
+def export_pickle(gallery_path, pickle_path):
+    """Write a legacy pickle (names + list of float64 arrays) from a gallery and its segments"""
+    people, person_ids, matrix, info = load_segmented(gallery_path)
+    matrix = dequantize(matrix, info['scales'])
+    data = {
+        'names': [people[i] for i in person_ids],
+        'encodings': [np.asarray(row, dtype=np.float64) for row in matrix],
+    }
+    with open(pickle_path, 'wb') as f:
+        pickle.dump(data, f)
+    return len(matrix)
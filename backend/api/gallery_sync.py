@@ -0,0 +1,91 @@
+"""Cross-worker gallery versioning.
+
+The gallery file itself is replaced atomically (see ``gallery_store``) and
+mapped read-only by every worker. What workers need to share is *which*
+version is current: a tiny shared-memory segment holds that number. A worker
+publishing a new gallery bumps it under an exclusive lock; every other worker
+notices the change and swaps its matcher reference.
+"""
+
+import contextlib
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+
+SHM_DIR = '/dev/shm'
+
+_VERSION = struct.Struct('<q')
+SEGMENT_SIZE = mmap.PAGESIZE
+
+
+def default_segment_path(gallery_path):
+    """Per-gallery segment in /dev/shm (next to the gallery if there is no /dev/shm)"""
+    if os.path.isdir(SHM_DIR):
+        digest = hashlib.sha1(os.path.abspath(gallery_path).encode()).hexdigest()[:12]
+        return os.path.join(SHM_DIR, f'infineon-x-gallery-{digest}.ver')
+    return f'{gallery_path}.ver'
+
+
+def default_shared_dir(name):
+    """Per-installation directory shared by the workers, in /dev/shm if there is one"""
+    app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if os.path.isdir(SHM_DIR):
+        digest = hashlib.sha1(app_dir.encode()).hexdigest()[:12]
+        return os.path.join(SHM_DIR, f'infineon-x-{name}-{digest}')
+    return os.path.join(app_dir, f'.{name}')
+
+
+class VersionSegment:
+    """Gallery version number in a shared-memory segment.
+
+    The segment is (re)opened lazily in every process: after a fork the file
+    lock must not be shared with the parent's open file description.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._pid = None
+        self._fd = None
+        self._map = None
+        self._thread_lock = threading.Lock()
+
+    def _open(self):
+        if self._pid == os.getpid():
+            return
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(fd).st_size < SEGMENT_SIZE:
+            os.ftruncate(fd, SEGMENT_SIZE)
+        self._fd = fd
+        self._map = mmap.mmap(fd, SEGMENT_SIZE)
+        self._thread_lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def read(self):
+        """Current published version (a single aligned 8-byte load)"""
+        self._open()
+        return _VERSION.unpack_from(self._map, 0)[0]
+
+    def write(self, version):
+        """Publish ``version``; call while holding ``lock()``"""
+        self._open()
+        _VERSION.pack_into(self._map, 0, version)
+
+    @contextlib.contextmanager
+    def lock(self):
+        """Exclusive publish lock across threads and worker processes"""
+        self._open()
+        with self._thread_lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def ensure_at_least(self, version):
+        """Raise the counter to ``version`` (e.g. after /dev/shm was cleared by a reboot)"""
+        with self.lock():
+            if self.read() < version:
+                self.write(version)
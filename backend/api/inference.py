@@ -0,0 +1,357 @@
+"""Face detection/encoding executor with a bounded queue.
+
+dlib work runs in a small process pool. With the forkserver start method the
+fork server imports face_recognition (and so loads the dlib models) once, and
+the pool processes forked from it share those pages. Admission is bounded: when
+every worker is busy and the queue is full, ``run()`` raises ``QueueFull``
+straight away so the request can be answered with 503 instead of timing out.
+"""
+
+import io
+import itertools
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, TimeoutError as FutureTimeout, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+from PIL import Image
+
+
+class QueueFull(Exception):
+    """No free slot in the inference queue"""
+
+    def __init__(self, depth, retry_after):
+        super().__init__(f'Inference queue full ({depth} requests in flight)')
+        self.depth = depth
+        self.retry_after = retry_after
+
+
+class InferenceTimeout(Exception):
+    """A job did not finish within the executor's timeout"""
+
+
+def _warm_up(niceness=0):
+    """Pool initializer: load the dlib models before the first request arrives"""
+    if niceness:
+        os.nice(niceness)
+    import face_recognition
+    blank = np.zeros((64, 64, 3), dtype=np.uint8)
+    face_recognition.face_locations(blank, model="hog")
+
+
+def _timed(fn, args):
+    started = time.time()
+    result = fn(*args)
+    return result, started, time.time()
+
+
+def decode_image(image_bytes, max_dim=0):
+    """Decode an image with its long side reduced to at most ``max_dim`` pixels.
+
+    JPEGs are decoded straight at 1/2, 1/4 or 1/8 scale (PIL draft mode), so a
+    large photo is never expanded to full size. Returns (image, original size).
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    size = image.size
+    if max_dim and max(size) > max_dim:
+        scale = max_dim / max(size)
+        target = (max(1, round(size[0] * scale)), max(1, round(size[1] * scale)))
+        image.draft('RGB', target)
+        if image.size != target:
+            image = image.resize(target, Image.BILINEAR)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image, size
+
+
+def _scale_locations(locations, from_size, to_size):
+    """Map (top, right, bottom, left) boxes between two resolutions of the same image"""
+    sx = to_size[0] / from_size[0]
+    sy = to_size[1] / from_size[1]
+    return [(max(0, round(top * sy)), min(to_size[0], round(right * sx)),
+             min(to_size[1], round(bottom * sy)), max(0, round(left * sx)))
+            for top, right, bottom, left in locations]
+
+
+def _full_res_encodings(image_bytes, locations):
+    """Encode every face from a crop of the full-resolution image"""
+    import face_recognition
+
+    image = Image.open(io.BytesIO(image_bytes))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    encodings = []
+    for top, right, bottom, left in locations:
+        # Keep a margin around the box so the landmark model sees the whole face
+        margin = (bottom - top) // 2
+        box = (max(0, left - margin), max(0, top - margin),
+               min(image.width, right + margin), min(image.height, bottom + margin))
+        crop = np.array(image.crop(box))
+        location = (top - box[1], right - box[0], bottom - box[1], left - box[0])
+        encodings.extend(face_recognition.face_encodings(crop, [location]))
+    return encodings
+
+
+def detect_faces(image_bytes, max_dim=0, full_res_encodings=False):
+    """Decode an image and return its size, face boxes and encodings.
+
+    Detection runs on a copy whose long side is at most ``max_dim`` pixels
+    (0 = native resolution); boxes are reported in original coordinates.
+    Encodings come from the detection image, or from full-resolution crops
+    when ``full_res_encodings`` is set.
+    """
+    import face_recognition
+
+    started = time.time()
+    image, size = decode_image(image_bytes, max_dim)
+    image_array = np.array(image)
+    decoded = time.time()
+
+    face_locations = face_recognition.face_locations(image_array, model="hog")
+    detected = time.time()
+
+    if image.size == size:
+        face_encodings = face_recognition.face_encodings(image_array, face_locations)
+        face_locations = [tuple(int(v) for v in box) for box in face_locations]
+    else:
+        scaled = _scale_locations(face_locations, image.size, size)
+        if full_res_encodings:
+            face_encodings = _full_res_encodings(image_bytes, scaled)
+        else:
+            face_encodings = face_recognition.face_encodings(image_array, face_locations)
+        face_locations = scaled
+    encoded = time.time()
+
+    return {
+        'width': size[0],
+        'height': size[1],
+        'detect_size': {'width': image.width, 'height': image.height},
+        'locations': face_locations,
+        'encodings': face_encodings,
+        'stages': {
+            'decode_ms': round((decoded - started) * 1000, 1),
+            'detect_ms': round((detected - decoded) * 1000, 1),
+            'encode_ms': round((encoded - detected) * 1000, 1),
+        },
+    }
+
+
+class InferenceExecutor:
+    """Runs inference jobs in a process pool (or inline when ``workers`` is 0).
+
+    At most ``workers + queue_size`` jobs are admitted at once per server
+    process; a job that timed out keeps its slot until its process is free.
+    The pool is created lazily so that it belongs to the process that uses
+    it, even when the app was imported before gunicorn forked, and replaced
+    when one of its processes died (e.g. killed for memory).
+    A positive ``niceness`` lowers the CPU priority of the pool processes.
+    """
+
+    def __init__(self, workers=1, queue_size=4, timeout=100, start_method='forkserver', niceness=0):
+        self.workers = workers
+        self.niceness = niceness
+        self.capacity = max(1, workers) + queue_size
+        self.timeout = timeout
+        self.start_method = start_method
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self._depth = 0
+        self._service_ewma = None
+        self._pool = None
+        self._pid = None
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                context = multiprocessing.get_context(self.start_method)
+                if self.start_method == 'forkserver':
+                    # The fork server loads the models once; pool processes forked from it share them
+                    context.set_forkserver_preload(['face_recognition'])
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=context,
+                    initializer=_warm_up,
+                    initargs=(self.niceness,),
+                )
+                self._pid = os.getpid()
+            return self._pool
+
+    def _discard_pool(self, pool):
+        """Drop a broken pool; the next job starts a new one"""
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        # Its pending jobs have already failed with BrokenProcessPool
+        pool.shutdown(wait=False)
+
+    def _submit(self, fn, args):
+        """(pool, future) of a job; a pool found broken is replaced once"""
+        pool = self._get_pool()
+        try:
+            return pool, pool.submit(_timed, fn, args)
+        except BrokenProcessPool:
+            self._discard_pool(pool)
+            pool = self._get_pool()
+            return pool, pool.submit(_timed, fn, args)
+
+    def _release(self, count=1):
+        with self._lock:
+            self._depth -= count
+        for _ in range(count):
+            self._slots.release()
+
+    def _hold_slot(self, future):
+        """Keep a timed-out job's slot until it finishes: a running job cannot be
+        cancelled, and its process takes no other work until then"""
+        future.add_done_callback(lambda _: self._release())
+
+    def warm_up(self, fn, *args):
+        """Start the pool and run ``fn(*args)`` once per worker, so no request waits for
+        process start-up or model loading; returns the seconds it took"""
+        started = time.time()
+        if self.workers == 0:
+            fn(*args)
+        else:
+            # Processes are started on demand, one per job that finds no idle worker
+            pool = self._get_pool()
+            for future in [pool.submit(fn, *args) for _ in range(self.workers)]:
+                future.result(timeout=self.timeout)
+        return time.time() - started
+
+    @property
+    def depth(self):
+        """Jobs currently admitted (running or waiting)"""
+        return self._depth
+
+    def retry_after(self):
+        """Seconds a rejected client should wait: time to drain the current queue"""
+        service = self._service_ewma or 1.0
+        return max(1, math.ceil(service * self.capacity / max(1, self.workers)))
+
+    def run(self, fn, *args):
+        """Run ``fn(*args)``; returns (result, timing) or raises ``QueueFull``.
+
+        ``timing`` holds the queue depth seen on admission, the time spent
+        waiting for a worker and the service time, in milliseconds.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise QueueFull(self._depth, self.retry_after())
+        with self._lock:
+            self._depth += 1
+            depth = self._depth
+
+        submitted = time.time()
+        held = False
+        try:
+            if self.workers == 0:
+                result, started, finished = _timed(fn, args)
+            else:
+                pool, future = self._submit(fn, args)
+                try:
+                    result, started, finished = future.result(timeout=self.timeout)
+                except FutureTimeout:
+                    if not future.cancel():
+                        held = True
+                        self._hold_slot(future)
+                    raise self._timeout_error()
+                except BrokenProcessPool:
+                    self._discard_pool(pool)
+                    raise
+        finally:
+            if not held:
+                self._release()
+
+        return result, self._timing(submitted, started, finished, depth)
+
+    def run_many(self, fn, args_list):
+        """Run ``fn`` over every argument tuple in parallel.
+
+        Admission is all-or-nothing: the batch takes up to ``capacity`` slots
+        at once (or raises ``QueueFull``) and keeps at most that many jobs in
+        the pool. Every job gets ``timeout`` seconds from its own submission,
+        so a batch larger than its slots is not cut short by one deadline.
+        Returns one ``(result, timing)`` per job, in order; a job that failed
+        or timed out has its exception in place of the result.
+        """
+        slots = min(len(args_list), self.capacity)
+        acquired = 0
+        while acquired < slots and self._slots.acquire(blocking=False):
+            acquired += 1
+        if acquired < slots:
+            for _ in range(acquired):
+                self._slots.release()
+            raise QueueFull(self._depth, self.retry_after())
+        with self._lock:
+            self._depth += slots
+            depth = self._depth
+
+        outcomes = [None] * len(args_list)
+        held = 0  # slots handed to timed-out jobs that are still running
+        try:
+            if self.workers == 0:
+                for i, args in enumerate(args_list):
+                    outcomes[i] = self._outcome(lambda: _timed(fn, args), time.time(), depth)
+            else:
+                pending = iter(enumerate(args_list))
+                in_flight = {}  # future -> (index, submission time, pool)
+                for i, args in itertools.islice(pending, slots):
+                    pool, future = self._submit(fn, args)
+                    in_flight[future] = (i, time.time(), pool)
+                while in_flight:
+                    oldest = min(queued for _, queued, _ in in_flight.values())
+                    done, _ = wait(in_flight, timeout=max(0, oldest + self.timeout - time.time()),
+                                   return_when=FIRST_COMPLETED)
+                    freed = 0
+                    for future in done:
+                        i, queued, pool = in_flight.pop(future)
+                        if isinstance(future.exception(), BrokenProcessPool):
+                            self._discard_pool(pool)
+                        outcomes[i] = self._outcome(future.result, queued, depth)
+                        freed += 1
+                    now = time.time()
+                    for future, (i, queued, _) in list(in_flight.items()):
+                        if now - queued >= self.timeout:
+                            del in_flight[future]
+                            outcomes[i] = (self._timeout_error(), None)
+                            if future.cancel():
+                                freed += 1
+                            else:
+                                held += 1
+                                self._hold_slot(future)
+                    for i, args in itertools.islice(pending, freed):
+                        pool, future = self._submit(fn, args)
+                        in_flight[future] = (i, time.time(), pool)
+        finally:
+            self._release(slots - held)
+        # Jobs that were never submitted (e.g. after a pool error) still get an outcome
+        return [outcome or (self._timeout_error(), None) for outcome in outcomes]
+
+    def _timeout_error(self):
+        return InferenceTimeout(f'Inference did not finish within {self.timeout:g}s')
+
+    def _outcome(self, get, submitted, depth):
+        """(result, timing) for one finished job, or (exception, None)"""
+        try:
+            result, started, finished = get()
+        except Exception as e:
+            return e, None
+        return result, self._timing(submitted, started, finished, depth)
+
+    def _timing(self, submitted, started, finished, depth):
+        """Per-job timing report; also feeds the service-time estimate behind Retry-After"""
+        service = finished - started
+        self._service_ewma = service if self._service_ewma is None else 0.8 * self._service_ewma + 0.2 * service
+        return {
+            'queue_depth': depth,
+            'wait_ms': round(max(0.0, started - submitted) * 1000, 1),
+            'service_ms': round(service * 1000, 1),
+        }
+
+    def shutdown(self):
+        if self._pool is not None and self._pid == os.getpid():
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,324 @@
+"""Retention, rollups and backups of the event log.
+
+A background thread in every worker runs a maintenance pass every
+LOG_MAINTENANCE_INTERVAL seconds; an flock makes sure only one process runs it
+at a time. A pass
+
+- backfills the ``sightings`` table from the faces in rows logged before it
+  existed (once, in chunks),
+- folds the raw rows logged since the previous pass into the per-hour and
+  per-day ``log_rollups`` (events, errors, latency per endpoint/event type)
+  and ``person_rollups`` (sightings per person) tables,
+- deletes raw rows older than LOG_RETENTION_DAYS (only once they are rolled
+  up), sightings older than LOG_SIGHTING_RETENTION_DAYS and hourly rollups
+  older than LOG_ROLLUP_RETENTION_DAYS; daily rollups are kept,
+- takes an online backup when the last one is LOG_BACKUP_INTERVAL old.
+
+Rows get ascending ids as they are committed, so "rolled up" is a single id
+watermark and the oldest rows are always the low end of the id range.
+"""
+
+import fcntl
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from . import logger
+
+# Raw rows are kept this many days (0 = forever); hourly rollups LOG_ROLLUP_RETENTION_DAYS
+LOG_RETENTION_DAYS = float(os.environ.get('LOG_RETENTION_DAYS', 90))
+LOG_ROLLUP_RETENTION_DAYS = float(os.environ.get('LOG_ROLLUP_RETENTION_DAYS', 400))
+LOG_SIGHTING_RETENTION_DAYS = float(os.environ.get('LOG_SIGHTING_RETENTION_DAYS', 400))
+LOG_MAINTENANCE_INTERVAL = float(os.environ.get('LOG_MAINTENANCE_INTERVAL', 300))
+
+# Raw rows rolled up / deleted per transaction, so writers are never blocked for long
+ROLLUP_CHUNK_ROWS = 50000
+RETENTION_BATCH_ROWS = 10000
+
+# period -> (bucket length as a timestamp prefix, suffix that completes the bucket start)
+PERIODS = {'hour': (13, ':00:00'), 'day': (10, 'T00:00:00')}
+
+# Latency of an event: queue wait + service time recorded by /recognize
+_LATENCY = ("CASE WHEN json_valid(details_json) THEN json_extract(details_json, '$.timing.wait_ms') "
+            "+ json_extract(details_json, '$.timing.service_ms') END")
+
+_maintenance_pid = None
+_maintenance_lock = threading.Lock()
+
+
+def _event_aggregate(length, since_id):
+    """SELECT of per-bucket event aggregates over the rows with ``id > since_id`` (an SQL expression)"""
+    return f'''
+    SELECT substr(timestamp, 1, {length}) AS bucket, COALESCE(endpoint, '') AS endpoint,
+           COALESCE(event_type, '') AS event_type, COUNT(*) AS events, SUM(success = 0) AS errors,
+           COALESCE(SUM(latency), 0) AS latency_ms_sum, COUNT(latency) AS latency_count,
+           MAX(latency) AS latency_ms_max
+    FROM (SELECT timestamp, endpoint, event_type, success, {_LATENCY} AS latency
+          FROM logs WHERE id > {since_id} AND id <= ?)
+    GROUP BY 1, 2, 3'''
+
+
+def _person_aggregate(length, since_id):
+    """SELECT of per-bucket sightings per person of the rows with ``id > since_id``"""
+    return f'''
+    SELECT substr(s.timestamp, 1, {length}) AS bucket, s.person AS person,
+           COALESCE(l.endpoint, '') AS endpoint, COUNT(*) AS sightings,
+           COALESCE(SUM(s.confidence), 0) AS confidence_sum
+    FROM sightings s LEFT JOIN logs l ON l.id = s.log_id
+    WHERE s.log_id > {since_id} AND s.log_id <= ?
+    GROUP BY 1, 2, 3'''
+
+
+# Faces of rows logged before the sightings table existed: /recognize rows list them
+# under "faces", /recognize/batch rows under "images"[]."faces". /pi/results rows
+# are echoes of a /recognize call and are skipped.
+_LEGACY_FACES = [
+    "json_each(l.details_json, '$.faces') f",
+    "json_each(l.details_json, '$.images') i, json_each(i.value, '$.faces') f",
+]
+
+
+def backfill_sightings(conn):
+    """Fill ``sightings`` from the details of rows logged before it existed; returns the sightings added"""
+    row = conn.execute("SELECT value FROM log_state WHERE name = 'sightings_backfill_to'").fetchone()
+    high = int(row[0]) if row else 0
+    row = conn.execute("SELECT value FROM log_state WHERE name = 'sightings_backfilled_id'").fetchone()
+    low = int(row[0]) if row else 0
+    added = 0
+    while low < high:
+        upto = min(low + ROLLUP_CHUNK_ROWS, high)
+        with conn:
+            for source in _LEGACY_FACES:
+                added += conn.execute(f'''
+                INSERT INTO sightings (timestamp, log_id, person, confidence,
+                                       box_top, box_right, box_bottom, box_left)
+                SELECT l.timestamp, l.id, json_extract(f.value, '$.name'), json_extract(f.value, '$.confidence'),
+                       json_extract(f.value, '$.location.top'), json_extract(f.value, '$.location.right'),
+                       json_extract(f.value, '$.location.bottom'), json_extract(f.value, '$.location.left')
+                FROM logs l, {source}
+                WHERE l.id > ? AND l.id <= ? AND json_valid(l.details_json)
+                  AND l.endpoint IN ('/recognize', '/recognize/batch')
+                  AND json_extract(f.value, '$.name') IS NOT NULL
+                ''', (low, upto)).rowcount
+            conn.execute("INSERT OR REPLACE INTO log_state (name, value) VALUES ('sightings_backfilled_id', ?)",
+                         (str(upto),))
+        low = upto
+    return added
+
+
+def _rolled_up_id(conn):
+    row = conn.execute("SELECT value FROM log_state WHERE name = 'rolled_up_id'").fetchone()
+    return int(row[0]) if row else 0
+
+
+# Rows not rolled up yet, as used by the stats queries (evaluated in the same statement)
+_ROLLED_UP_ID = "COALESCE((SELECT CAST(value AS INTEGER) FROM log_state WHERE name = 'rolled_up_id'), 0)"
+
+
+def roll_up(conn):
+    """Fold the rows logged since the last call into the rollup tables; returns the rows rolled up"""
+    low = _rolled_up_id(conn)
+    high = conn.execute("SELECT MAX(id) FROM logs").fetchone()[0] or 0
+    rolled = 0
+    while low < high:
+        upto = min(low + ROLLUP_CHUNK_ROWS, high)
+        with conn:
+            for period, (length, _) in PERIODS.items():
+                conn.execute(f'''
+                INSERT INTO log_rollups (period, bucket, endpoint, event_type, events, errors,
+                                         latency_ms_sum, latency_count, latency_ms_max)
+                SELECT ?, * FROM ({_event_aggregate(length, low)}) WHERE true
+                ON CONFLICT (period, bucket, endpoint, event_type) DO UPDATE SET
+                    events = events + excluded.events,
+                    errors = errors + excluded.errors,
+                    latency_ms_sum = latency_ms_sum + excluded.latency_ms_sum,
+                    latency_count = latency_count + excluded.latency_count,
+                    latency_ms_max = CASE WHEN latency_ms_max IS NULL OR excluded.latency_ms_max > latency_ms_max
+                                          THEN excluded.latency_ms_max ELSE latency_ms_max END
+                ''', (period, upto))
+                conn.execute(f'''
+                INSERT INTO person_rollups (period, bucket, person, endpoint, sightings, confidence_sum)
+                SELECT ?, * FROM ({_person_aggregate(length, low)}) WHERE true
+                ON CONFLICT (period, bucket, person, endpoint) DO UPDATE SET
+                    sightings = sightings + excluded.sightings,
+                    confidence_sum = confidence_sum + excluded.confidence_sum
+                ''', (period, upto))
+            rolled += conn.execute("SELECT COUNT(*) FROM logs WHERE id > ? AND id <= ?", (low, upto)).fetchone()[0]
+            conn.execute("INSERT OR REPLACE INTO log_state (name, value) VALUES ('rolled_up_id', ?)", (str(upto),))
+        low = upto
+    return rolled
+
+
+def apply_retention(conn, now=None):
+    """Delete raw rows, sightings and hourly rollups past their retention; returns the raw rows deleted"""
+    now = now or datetime.now()
+    deleted = sightings_deleted = 0
+    if LOG_RETENTION_DAYS > 0:
+        cutoff = (now - timedelta(days=LOG_RETENTION_DAYS)).isoformat()
+        rolled_up = _rolled_up_id(conn)
+        while True:
+            with conn:
+                count = conn.execute('''
+                DELETE FROM logs WHERE id IN (
+                    SELECT id FROM logs WHERE timestamp < ? AND id <= ? LIMIT ?)
+                ''', (cutoff, rolled_up, RETENTION_BATCH_ROWS)).rowcount
+            deleted += count
+            if count < RETENTION_BATCH_ROWS:
+                break
+    if LOG_SIGHTING_RETENTION_DAYS > 0:
+        cutoff = (now - timedelta(days=LOG_SIGHTING_RETENTION_DAYS)).isoformat()
+        rolled_up = _rolled_up_id(conn)
+        while True:
+            with conn:
+                count = conn.execute('''
+                DELETE FROM sightings WHERE id IN (
+                    SELECT id FROM sightings WHERE timestamp < ? AND log_id <= ? LIMIT ?)
+                ''', (cutoff, rolled_up, RETENTION_BATCH_ROWS)).rowcount
+            sightings_deleted += count
+            if count < RETENTION_BATCH_ROWS:
+                break
+    if LOG_ROLLUP_RETENTION_DAYS > 0:
+        cutoff = (now - timedelta(days=LOG_ROLLUP_RETENTION_DAYS)).isoformat()[:PERIODS['hour'][0]]
+        with conn:
+            conn.execute("DELETE FROM log_rollups WHERE period = 'hour' AND bucket < ?", (cutoff,))
+            conn.execute("DELETE FROM person_rollups WHERE period = 'hour' AND bucket < ?", (cutoff,))
+    if deleted or sightings_deleted:
+        conn.execute('PRAGMA incremental_vacuum')
+    return deleted
+
+
+def _backup_due(conn):
+    row = conn.execute("SELECT value FROM log_state WHERE name = 'last_backup'").fetchone()
+    return row is None or time.time() - float(row[0]) >= logger.LOG_BACKUP_INTERVAL
+
+
+def run_maintenance(backup=None):
+    """One maintenance pass; returns what it did, or None if another process is running one.
+
+    ``backup`` forces (True) or skips (False) the backup; by default it runs when due.
+    """
+    fd = os.open(logger.DB_FILE + '.maintenance.lock', os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+        conn = logger._connect()
+        try:
+            # Backfilled sightings must exist before their rows are rolled up
+            report = {'backfilled': backfill_sightings(conn), 'rolled_up': roll_up(conn),
+                      'deleted': apply_retention(conn), 'backup': None}
+            if backup or (backup is None and _backup_due(conn)):
+                report['backup'] = logger.backup_db()
+                if report['backup']:
+                    with conn:
+                        conn.execute("INSERT OR REPLACE INTO log_state (name, value) VALUES ('last_backup', ?)",
+                                     (str(time.time()),))
+        finally:
+            conn.close()
+        if report['deleted']:
+            print(f"🗑️ Log retention removed {report['deleted']} event(s) older than {LOG_RETENTION_DAYS:g} days")
+        return report
+    except Exception as e:
+        print(f"⚠️ Log maintenance failed: {e}")
+        return None
+    finally:
+        os.close(fd)
+
+
+def start():
+    """Start this process's maintenance thread (once per process, also after a fork)"""
+    global _maintenance_pid
+    with _maintenance_lock:
+        if _maintenance_pid == os.getpid():
+            return
+        _maintenance_pid = os.getpid()
+        threading.Thread(target=_loop, daemon=True, name='log-maintenance').start()
+
+
+def _loop():
+    while True:
+        run_maintenance()
+        time.sleep(LOG_MAINTENANCE_INTERVAL)
+
+
+def _auto_period(since, until):
+    """Hourly buckets for windows up to two days, daily beyond"""
+    if since is None:
+        return 'day'
+    end = datetime.fromisoformat(until) if until else datetime.now()
+    return 'hour' if end - datetime.fromisoformat(since) <= timedelta(days=2) else 'day'
+
+
+def get_stats(since=None, until=None, period=None, endpoint=None, event_type=None):
+    """Events, errors and latency per time bucket plus sightings per person.
+
+    Read from the rollup tables (and the few raw rows logged since the last
+    maintenance pass), so long windows never scan the raw log. Buckets that
+    overlap [since, until) are included whole; times are normalized ISO strings.
+    """
+    period = period or _auto_period(since, until)
+    if period not in PERIODS:
+        raise ValueError(f'period must be one of: {", ".join(PERIODS)}')
+    length, suffix = PERIODS[period]
+
+    clauses, params = [], []
+    if since:
+        clauses.append("bucket >= ?")
+        params.append(since[:length])
+    if until:
+        clauses.append("bucket || ? < ?")
+        params += [suffix, until]
+    event_clauses, event_params = list(clauses), list(params)
+    if endpoint:
+        event_clauses.append("endpoint = ?")
+        event_params.append(endpoint)
+        clauses.append("endpoint = ?")
+        params.append(endpoint)
+    if event_type:
+        event_clauses.append("event_type = ?")
+        event_params.append(event_type)
+
+    def where(conditions):
+        return (" WHERE " + " AND ".join(conditions)) if conditions else ""
+
+    conn = logger._reader()
+    high = conn.execute("SELECT MAX(id) FROM logs").fetchone()[0] or 0
+    buckets = conn.execute(f'''
+    SELECT bucket, SUM(events), SUM(errors), SUM(latency_ms_sum), SUM(latency_count), MAX(latency_ms_max)
+    FROM (SELECT bucket, endpoint, event_type, events, errors, latency_ms_sum, latency_count, latency_ms_max
+          FROM log_rollups WHERE period = ?
+          UNION ALL {_event_aggregate(length, _ROLLED_UP_ID)})
+    {where(event_clauses)}
+    GROUP BY bucket ORDER BY bucket
+    ''', [period, high] + event_params).fetchall()
+    people = conn.execute(f'''
+    SELECT person, SUM(sightings), SUM(confidence_sum), MIN(bucket), MAX(bucket)
+    FROM (SELECT bucket, person, endpoint, sightings, confidence_sum FROM person_rollups WHERE period = ?
+          UNION ALL {_person_aggregate(length, _ROLLED_UP_ID)})
+    {where(clauses)}
+    GROUP BY person ORDER BY SUM(sightings) DESC
+    ''', [period, high] + params).fetchall()
+
+    return {
+        'period': period,
+        'since': since,
+        'until': until,
+        'buckets': [{
+            'bucket': bucket,
+            'events': events,
+            'errors': errors,
+            'avg_latency_ms': round(latency_sum / latency_count, 1) if latency_count else None,
+            'max_latency_ms': latency_max,
+        } for bucket, events, errors, latency_sum, latency_count, latency_max in buckets],
+        'people': [{
+            'name': person,
+            'sightings': sightings,
+            'avg_confidence': round(confidence_sum / sightings, 1),
+            'first_bucket': first,
+            'last_bucket': last,
+        } for person, sightings, confidence_sum, first, last in people],
+        'total_events': sum(row[1] for row in buckets),
+        'total_errors': sum(row[2] for row in buckets),
+    }
@@ -1,135 +1,459 @@
 import sqlite3
+import csv
+import io
 import json
+import zlib
 import os
-import shutil
+import queue
+import threading
+import atexit
 from datetime import datetime
 import time
 from pathlib import Path
 
 # Configuration
-DB_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'face_recognition_logs.db')
-BACKUP_DIR = os.path.expanduser('~/.backup_infineon-x')
+DB_FILE = os.environ.get('LOG_DB_FILE') or os.path.join(os.path.dirname(os.path.dirname(__file__)), 'face_recognition_logs.db')
+BACKUP_DIR = os.environ.get('LOG_BACKUP_DIR') or os.path.expanduser('~/.backup_infineon-x')
+
+# Events are queued and written by one background thread per process, in batched
+# transactions of up to LOG_BATCH_SIZE events or every LOG_FLUSH_INTERVAL seconds.
+# Events are dropped (and counted) while LOG_QUEUE_SIZE events are waiting.
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+LOG_BATCH_SIZE = int(os.environ.get('LOG_BATCH_SIZE', 500))
+LOG_FLUSH_INTERVAL = float(os.environ.get('LOG_FLUSH_INTERVAL', 0.5))
+
+# Online backups every LOG_BACKUP_INTERVAL seconds (run by log_maintenance); the newest
+# LOG_BACKUP_KEEP are kept
+LOG_BACKUP_INTERVAL = float(os.environ.get('LOG_BACKUP_INTERVAL', 24 * 3600))
+LOG_BACKUP_KEEP = int(os.environ.get('LOG_BACKUP_KEEP', 7))
+
+# /logs: largest page, and how long filtered totals are cached
+LOG_PAGE_MAX = 1000
+LOG_COUNT_CACHE_TTL = float(os.environ.get('LOG_COUNT_CACHE_TTL', 30))
+
+# /logs/export reads this many rows per query; every chunk is a separate short read,
+# so an export holds one chunk in memory and never pins an old WAL snapshot
+LOG_EXPORT_CHUNK_ROWS = int(os.environ.get('LOG_EXPORT_CHUNK_ROWS', 5000))
+EXPORT_FORMATS = ('ndjson', 'csv')
+EXPORT_COLUMNS = ('id', 'timestamp', 'endpoint', 'event_type', 'success', 'message', 'details_json')
+
+LOG_INDEXES = {
+    'idx_logs_timestamp': 'timestamp',
+    'idx_logs_endpoint': 'endpoint, id',
+    'idx_logs_event_type': 'event_type, id',
+    'idx_logs_success': 'success, id',
+}
+
+# The analytics queries (per person, or per time range) are answered from the first
+# two indexes alone, without visiting the table
+SIGHTING_INDEXES = {
+    'idx_sightings_person': 'person, timestamp, device, confidence',
+    'idx_sightings_timestamp': 'timestamp, person, device, confidence',
+    'idx_sightings_device': 'device, timestamp',
+    'idx_sightings_log': 'log_id',
+}
+
+_STOP = None  # Queue marker: write what is queued, then end the writer thread
+
+_queue = None
+_writer = None
+_writer_pid = None
+_writer_lock = threading.Lock()
+_stats = {'written': 0, 'dropped': 0, 'failed': 0, 'batches': 0}
+_count_cache = {}  # filter key -> (monotonic time, total)
+_readers = threading.local()
+
+def _connect():
+    """Connection in WAL mode: readers never block the writer and commits skip most fsyncs"""
+    conn = sqlite3.connect(DB_FILE, timeout=10)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+def create_schema(conn):
+    """Create the logs, rollup and state tables and their indexes if missing"""
+    cursor = conn.cursor()
+    # Lets retention hand freed pages back to the filesystem (only takes effect on a new database)
+    cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT NOT NULL,
+        endpoint TEXT,
+        event_type TEXT,
+        success INTEGER,
+        message TEXT,
+        details_json TEXT
+    )
+    ''')
+    
+    # Filters are served from these indexes; trailing id keeps each filter's rows in
+    # id order, so a keyset page is an index range scan
+    for name, columns in LOG_INDEXES.items():
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON logs ({columns})")
+    
+    # Per-hour and per-day aggregates of the logs (see log_maintenance); bucket is the
+    # timestamp prefix of the hour ("2025-12-01T13") or day ("2025-12-01")
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS log_rollups (
+        period TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        endpoint TEXT NOT NULL,
+        event_type TEXT NOT NULL,
+        events INTEGER NOT NULL,
+        errors INTEGER NOT NULL,
+        latency_ms_sum REAL NOT NULL,
+        latency_count INTEGER NOT NULL,
+        latency_ms_max REAL,
+        PRIMARY KEY (period, bucket, endpoint, event_type)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS person_rollups (
+        period TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        person TEXT NOT NULL,
+        endpoint TEXT NOT NULL,
+        sightings INTEGER NOT NULL,
+        confidence_sum REAL NOT NULL,
+        PRIMARY KEY (period, bucket, person, endpoint)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS log_state (
+        name TEXT PRIMARY KEY,
+        value TEXT
+    )
+    ''')
+    
+    # One row per recognized face, written in the same transaction as its log row
+    # (log_id); the analytics endpoints aggregate these instead of parsing details_json
+    new_sightings = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sightings'").fetchone() is None
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS sightings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT NOT NULL,
+        log_id INTEGER NOT NULL,
+        recognition_id TEXT,
+        device TEXT,
+        person TEXT NOT NULL,
+        confidence REAL,
+        box_top INTEGER,
+        box_right INTEGER,
+        box_bottom INTEGER,
+        box_left INTEGER
+    )
+    ''')
+    for name, columns in SIGHTING_INDEXES.items():
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON sightings ({columns})")
+    if new_sightings:
+        # Rows logged before the table existed are backfilled by log_maintenance
+        cursor.execute('''
+        INSERT OR REPLACE INTO log_state (name, value)
+        SELECT 'sightings_backfill_to', CAST(COALESCE(MAX(id), 0) AS TEXT) FROM logs
+        ''')
+    # Refresh planner statistics (cheap: bounded sampling, skipped when still current)
+    cursor.execute('PRAGMA analysis_limit=1000')
+    cursor.execute('PRAGMA optimize')
+    conn.commit()
 
 def init_db():
     """Initialize the SQLite database and create table if not exists"""
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT NOT NULL,
-            endpoint TEXT,
-            event_type TEXT,
-            success INTEGER,
-            message TEXT,
-            details_json TEXT
-        )
-        ''')
-        
-        conn.commit()
+        conn = _connect()
+        create_schema(conn)
         conn.close()
         print(f"✅ Database initialized at {DB_FILE}")
         
-        # Run backup check on init
-        backup_db()
-        
     except Exception as e:
         print(f"❌ Database initialization failed: {e}")
 
-def backup_db():
-    """Perform a daily backup of the database"""
+def backup_db(step_pages=1024):
+    """Back the database up with SQLite's online backup API; returns the backup path.
+
+    The copy is a consistent snapshot even while workers write, taken in steps
+    of `step_pages` pages so writers are never blocked for long. It is written
+    to a temp file and renamed, so a backup file is never torn.
+    """
     try:
         if not os.path.exists(DB_FILE):
-            return
+            return None
 
         os.makedirs(BACKUP_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y-%m-%d_%H%M%S')
+        backup_path = os.path.join(BACKUP_DIR, f"face_recognition_logs_{stamp}.db")
+        tmp_path = f"{backup_path}.{os.getpid()}.tmp"
         
-        # Check existing backups
-        today_str = datetime.now().strftime('%Y-%m-%d')
-        backup_path = os.path.join(BACKUP_DIR, f"face_recognition_logs_{today_str}.db")
+        print(f"📦 Creating backup at {backup_path}...")
+        source = sqlite3.connect(DB_FILE, timeout=10)
+        target = sqlite3.connect(tmp_path)
+        try:
+            source.backup(target, pages=step_pages, sleep=0.005)
+        finally:
+            target.close()
+            source.close()
+        os.replace(tmp_path, backup_path)
+        print("✅ Backup complete")
         
-        if not os.path.exists(backup_path):
-            print(f"📦 Creating backup at {backup_path}...")
-            shutil.copy2(DB_FILE, backup_path)
-            print("✅ Backup complete")
-            
-            # Optional: Cleanup old backups (keep last 7 days)
-            cleanup_old_backups()
-        else:
-            # Backup for today already exists
-            pass
+        cleanup_old_backups()
+        return backup_path
             
     except Exception as e:
         print(f"⚠️ Database backup failed: {e}")
+        return None
 
-def cleanup_old_backups():
-    """Keep only the last 7 days of backups"""
+def cleanup_old_backups(keep=None):
+    """Keep only the newest `keep` (LOG_BACKUP_KEEP) backups"""
+    keep = keep or LOG_BACKUP_KEEP
     try:
         files = sorted(Path(BACKUP_DIR).glob('face_recognition_logs_*.db'))
-        if len(files) > 7:
-            for f in files[:-7]:
+        if len(files) > keep:
+            for f in files[:-keep]:
                 os.remove(f)
                 print(f"🗑️ Removed old backup: {f.name}")
     except Exception as e:
         print(f"⚠️ Cleanup failed: {e}")
 
-def log_event(endpoint, event_type, success, message, details=None):
-    """Log an event to the database"""
+def sightings_of(faces, device=None, recognition_id=None):
+    """Sighting rows for the `faces` of a recognition response, as log_event() takes them"""
+    rows = []
+    for face in faces or []:
+        if not face.get('name'):
+            continue
+        box = face.get('location') or {}
+        rows.append((recognition_id, device, face['name'], face.get('confidence'),
+                     box.get('top'), box.get('right'), box.get('bottom'), box.get('left')))
+    return rows
+
+def log_event(endpoint, event_type, success, message, details=None, sightings=None):
+    """Queue an event for the database; never blocks the request.
+
+    `sightings` (from sightings_of()) are stored with the event's timestamp and id.
+    """
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
         timestamp = datetime.now().isoformat()
         details_json = json.dumps(details) if details else '{}'
         success_int = 1 if success else 0
         
-        cursor.execute('''
-        INSERT INTO logs (timestamp, endpoint, event_type, success, message, details_json)
-        VALUES (?, ?, ?, ?, ?, ?)
-        ''', (timestamp, endpoint, event_type, success_int, message, details_json))
-        
-        conn.commit()
-        conn.close()
+        _start_writer()
+        _queue.put_nowait((timestamp, endpoint, event_type, success_int, message, details_json,
+                           sightings or None))
         
+    except queue.Full:
+        _stats['dropped'] += 1
+        if _stats['dropped'] == 1 or _stats['dropped'] % 1000 == 0:
+            print(f"⚠️ Log queue full, {_stats['dropped']} event(s) dropped so far")
     except Exception as e:
         # Don't crash the app if logging fails, just print error
         print(f"❌ Logging failed: {e}")
 
-def get_logs(limit=50, offset=0, endpoint=None, event_type=None, success=None):
-    """Retrieve logs with filtering"""
-    try:
-        conn = sqlite3.connect(DB_FILE)
-        conn.row_factory = sqlite3.Row  # Allow accessing columns by name
-        cursor = conn.cursor()
+def _start_writer():
+    """Start this process's writer thread (once per process, also after a fork)"""
+    global _queue, _writer, _writer_pid
+    if _writer_pid == os.getpid() and _writer.is_alive():
+        return
+    with _writer_lock:
+        if _writer_pid == os.getpid() and _writer.is_alive():
+            return
+        if _writer_pid != os.getpid():
+            # Events queued in the parent before a fork are the parent's to write
+            _queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+            _stats.update(written=0, dropped=0, failed=0, batches=0)
+        _writer_pid = os.getpid()
+        _writer = threading.Thread(target=_write_loop, args=(_queue,), name='log-writer', daemon=True)
+        _writer.start()
+
+def _write_loop(events):
+    """Writer thread: drain the queue in batched transactions on one persistent connection"""
+    conn = None
+    while True:
+        batch = [events.get()]
+        deadline = time.monotonic() + LOG_FLUSH_INTERVAL
+        # Collect until the batch is full, the interval is over or a flush/stop marker arrives
+        while isinstance(batch[-1], tuple) and len(batch) < LOG_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(events.get(timeout=remaining))
+            except queue.Empty:
+                break
         
-        query = "SELECT * FROM logs WHERE 1=1"
-        params = []
+        rows = [item for item in batch if isinstance(item, tuple)]
+        if rows:
+            try:
+                if conn is None:
+                    conn = _connect()
+                with conn:
+                    _insert(conn, rows)
+                _stats['written'] += len(rows)
+                _stats['batches'] += 1
+            except Exception as e:
+                _stats['failed'] += len(rows)
+                print(f"❌ Logging failed, {len(rows)} event(s) lost: {e}")
+                if conn is not None:
+                    conn.close()
+                    conn = None
         
-        if endpoint:
-            query += " AND endpoint = ?"
-            params.append(endpoint)
-            
-        if event_type:
-            query += " AND event_type = ?"
-            params.append(event_type)
-            
-        if success is not None:
-            query += " AND success = ?"
-            params.append(1 if success else 0)
-            
-        # Get total count for pagination
-        count_query = query.replace("SELECT *", "SELECT COUNT(*)", 1)
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()[0]
+        for item in batch:
+            if isinstance(item, threading.Event):
+                item.set()
+        if batch[-1] is _STOP:
+            if conn is not None:
+                conn.close()
+            return
+
+_INSERT_LOG = '''
+INSERT INTO logs (timestamp, endpoint, event_type, success, message, details_json)
+VALUES (?, ?, ?, ?, ?, ?)
+'''
+_INSERT_SIGHTING = '''
+INSERT INTO sightings (timestamp, log_id, recognition_id, device, person, confidence,
+                       box_top, box_right, box_bottom, box_left)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+def _insert(conn, rows):
+    """Insert queued events; runs without sightings go in one executemany"""
+    plain = []
+    for row in rows:
+        if row[6] is None:
+            plain.append(row[:6])
+            continue
+        if plain:
+            conn.executemany(_INSERT_LOG, plain)
+            plain = []
+        # The sightings need the event's id
+        log_id = conn.execute(_INSERT_LOG, row[:6]).lastrowid
+        conn.executemany(_INSERT_SIGHTING, [(row[0], log_id, *sighting) for sighting in row[6]])
+    if plain:
+        conn.executemany(_INSERT_LOG, plain)
+
+def flush(timeout=5.0):
+    """Wait until every event this process logged so far is written; False on timeout"""
+    if _writer_pid != os.getpid() or not _writer.is_alive():
+        return True
+    done = threading.Event()
+    try:
+        _queue.put(done, timeout=timeout)
+    except queue.Full:
+        return False
+    return done.wait(timeout)
+
+def shutdown(timeout=5.0):
+    """Write the queued events and stop the writer thread (runs at interpreter exit)"""
+    if _writer_pid != os.getpid() or not _writer.is_alive():
+        return
+    try:
+        _queue.put(_STOP, timeout=timeout)
+    except queue.Full:
+        print(f"⚠️ Log writer did not drain in time, {_queue.qsize()} event(s) lost")
+        return
+    _writer.join(timeout)
+
+atexit.register(shutdown)
+
+def writer_stats():
+    """Counters of this process's log writer"""
+    running = _writer_pid == os.getpid() and _writer.is_alive()
+    return {
+        'running': running,
+        'queued': _queue.qsize() if running else 0,
+        'queue_size': LOG_QUEUE_SIZE,
+        **_stats,
+    }
+
+def _reader():
+    """This thread's read connection (kept open; WAL readers do not block the writer)"""
+    conn = getattr(_readers, 'conn', None)
+    if conn is None or getattr(_readers, 'pid', None) != os.getpid():
+        conn = sqlite3.connect(DB_FILE, timeout=10)
+        conn.row_factory = sqlite3.Row  # Allow accessing columns by name
+        _readers.conn, _readers.pid = conn, os.getpid()
+    return conn
+
+def normalize_time(value):
+    """ISO-8601 time as stored in `timestamp` (naive local time); raises ValueError"""
+    if value is None or value == '':
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed.isoformat()
+
+def _filters(endpoint=None, event_type=None, success=None, since=None, until=None, time_index=True):
+    """WHERE clause and parameters for the log filters (times already normalized).
+
+    With `time_index=False` the time bounds are written so the planner cannot
+    use the timestamp index, which keeps rows in id order (for exports).
+    """
+    column = "timestamp" if time_index else "+timestamp"
+    clauses, params = [], []
+    if endpoint:
+        clauses.append("endpoint = ?")
+        params.append(endpoint)
+    if event_type:
+        clauses.append("event_type = ?")
+        params.append(event_type)
+    if success is not None:
+        clauses.append("success = ?")
+        params.append(1 if success else 0)
+    if since:
+        clauses.append(f"{column} >= ?")
+        params.append(since)
+    if until:
+        clauses.append(f"{column} < ?")
+        params.append(until)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+def _count(conn, where, params):
+    """(total, estimated) for a filter.
+
+    Unfiltered totals come from the id range (ids only have gaps where rows were
+    deleted); filtered totals are counted on the indexes and cached for
+    LOG_COUNT_CACHE_TTL seconds.
+    """
+    if not where:
+        low, high = conn.execute("SELECT (SELECT MIN(id) FROM logs), (SELECT MAX(id) FROM logs)").fetchone()
+        return (high - low + 1 if high is not None else 0), True
+    
+    key = (where, tuple(params))
+    cached = _count_cache.get(key)
+    now = time.monotonic()
+    if cached and now - cached[0] < LOG_COUNT_CACHE_TTL:
+        return cached[1], True
+    total = conn.execute(f"SELECT COUNT(*) FROM logs{where}", params).fetchone()[0]
+    if len(_count_cache) > 256:
+        _count_cache.clear()
+    _count_cache[key] = (now, total)
+    return total, False
+
+def get_logs(limit=50, offset=0, endpoint=None, event_type=None, success=None,
+             before_id=None, since=None, until=None):
+    """Retrieve logs with filtering, newest first.
+
+    Pass the previous page's `next_cursor` as `before_id` to page in constant
+    time; `offset` still works but costs a scan over the skipped rows.
+    `since`/`until` bound the timestamp (ISO-8601, `until` exclusive).
+    """
+    try:
+        conn = _reader()
+        limit = max(1, min(int(limit), LOG_PAGE_MAX))
+        where, params = _filters(endpoint, event_type, success, normalize_time(since), normalize_time(until))
+        total, estimated = _count(conn, where, params)
         
-        # Get data
-        query += " ORDER BY id DESC LIMIT ? OFFSET ?"
-        params.extend([limit, offset])
+        query = f"SELECT * FROM logs{where}"
+        if before_id is not None:
+            query += (" AND" if where else " WHERE") + " id < ?"
+            params = params + [int(before_id)]
+        query += " ORDER BY id DESC LIMIT ?"
+        params = params + [limit]
+        if offset and before_id is None:
+            query += " OFFSET ?"
+            params.append(offset)
         
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
+        rows = conn.execute(query, params).fetchall()
         
         logs = []
         for row in rows:
@@ -141,16 +465,81 @@ def get_logs(limit=50, offset=0, endpoint=None, event_type=None, success=None):
                 log['details'] = {}
             del log['details_json'] # Remove string version
             logs.append(log)
-            
-        conn.close()
         
         return {
             'logs': logs,
             'total': total,
+            'total_estimated': estimated,
             'limit': limit,
-            'offset': offset
+            'offset': offset,
+            'next_cursor': logs[-1]['id'] if len(logs) == limit else None
         }
         
     except Exception as e:
         print(f"❌ Error retrieving logs: {e}")
         return {'logs': [], 'total': 0, 'error': str(e)}
+
+def export_logs(fmt='ndjson', endpoint=None, event_type=None, success=None, since=None, until=None,
+                after_id=None, compress=False):
+    """Stream the logs matching the filters, oldest first; returns (last_id, chunks).
+
+    `chunks` yields NDJSON lines (one event per line, `details` as an object) or
+    CSV (with a header row), gzip-compressed if `compress`. Rows are read in
+    keyset chunks of LOG_EXPORT_CHUNK_ROWS, so memory stays constant whatever
+    the range. The export stops at `last_id`, the newest row when it started;
+    pass it as `after_id` to export only what was logged since.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f'format must be one of: {", ".join(EXPORT_FORMATS)}')
+    where, params = _filters(endpoint, event_type, success, normalize_time(since), normalize_time(until),
+                             time_index=False)
+    low = int(after_id) if after_id is not None else 0
+    conn = _connect()
+    try:
+        last_id = conn.execute("SELECT MAX(id) FROM logs").fetchone()[0] or 0
+    except Exception:
+        conn.close()
+        raise
+    
+    if fmt == 'ndjson':
+        # SQLite builds each line, so details_json is never parsed in Python
+        columns = ("json_object('id', id, 'timestamp', timestamp, 'endpoint', endpoint, "
+                   "'event_type', event_type, 'success', success, 'message', message, 'details', "
+                   "CASE WHEN json_valid(details_json) THEN json(details_json) ELSE json('{}') END)")
+    else:
+        columns = ", ".join(EXPORT_COLUMNS)
+    query = (f"SELECT id, {columns} FROM logs{where}{' AND' if where else ' WHERE'} id > ? AND id <= ? "
+             f"ORDER BY id LIMIT {LOG_EXPORT_CHUNK_ROWS}")
+    
+    def text_chunks():
+        cursor = low
+        if fmt == 'csv':
+            yield ",".join(EXPORT_COLUMNS) + "\r\n"
+        while cursor < last_id:
+            rows = conn.execute(query, params + [cursor, last_id]).fetchall()
+            if not rows:
+                return
+            cursor = rows[-1][0]
+            if fmt == 'ndjson':
+                yield "\n".join(row[1] for row in rows) + "\n"
+            else:
+                out = io.StringIO()
+                csv.writer(out).writerows(row[1:] for row in rows)
+                yield out.getvalue()
+    
+    def chunks():
+        try:
+            if not compress:
+                for text in text_chunks():
+                    yield text.encode('utf-8')
+                return
+            gzip = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+            for text in text_chunks():
+                data = gzip.compress(text.encode('utf-8'))
+                if data:
+                    yield data
+            yield gzip.flush()
+        finally:
+            conn.close()
+    
+    return last_id, chunks()
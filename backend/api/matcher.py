@@ -0,0 +1,542 @@
+"""Vectorized face matching against the in-memory gallery"""
+
+import copy
+
+import numpy as np
+
+from .ann_index import IVFIndex
+from .quantization import PRECISIONS, dequantize, precision_of, quantize, requantize
+
+ENCODING_DIM = 128
+DEFAULT_TOLERANCE = 0.6
+DEFAULT_REFINE_PEOPLE = 5
+
+MATCH_MODES = ('exact', 'ann', 'prototype')
+
+# Upper bound on the (probes x gallery) distance block computed at once (~64MB of float32)
+MAX_BLOCK_ELEMENTS = 1 << 24
+# Rows of a float16/int8 gallery converted to float32 at a time (512KB, so a block is
+# still in cache when it is multiplied)
+DEQUANTIZE_BLOCK_ROWS = 1 << 10
+
+# float16 bits shifted into the float32 exponent/mantissa positions are the same value
+# times 2**-112 (subnormals included); probes are scaled by 2**112 to make up for it
+_FLOAT16_WIDENING = np.float32(2.0 ** 112)
+_FLOAT16_WIDENING_MASK = np.int32(-0x70000001)  # 0x8FFFFFFF: sign + 27 low bits
+
+
+class GalleryLayer:
+    """One encoding matrix with rows grouped by person, and what matching derives from it.
+
+    A person owns one contiguous run of rows per layer. Squared norms and
+    per-run sums (for prototypes) are computed once, so the mapped base of a
+    gallery file keeps its layer across versions and only the rows added
+    since are indexed again.
+    """
+
+    def __init__(self, people, person_ids, matrix, scales=None):
+        if precision_of(np.asarray(matrix)) not in PRECISIONS:
+            matrix = np.asarray(matrix, dtype=np.float32)
+        self.people = list(people)
+        self.person_ids = np.asarray(person_ids)
+        self.matrix = matrix
+        self.scales = scales
+
+        ids = self.person_ids
+        self.run_starts = np.flatnonzero(np.concatenate([[True], ids[1:] != ids[:-1]])) if len(ids) \
+            else np.zeros(0, dtype=np.int64)
+        self.run_people = ids[self.run_starts].astype(np.int32)
+        self.sq_norms = np.empty(len(ids), dtype=np.float32)
+        self.run_sums = np.zeros((len(self.run_starts), ENCODING_DIM), dtype=np.float32)
+        for start, block in self.blocks():
+            stop = start + len(block)
+            self.sq_norms[start:stop] = np.einsum('ij,ij->i', block, block)
+            # Runs overlapping the block, clipped to it
+            first = np.searchsorted(self.run_starts, start, side='right') - 1
+            last = np.searchsorted(self.run_starts, stop)
+            bounds = np.maximum(self.run_starts[first:last], start) - start
+            self.run_sums[first:last] += np.add.reduceat(block, bounds, axis=0)
+
+    @classmethod
+    def grouped(cls, people, person_ids, matrix, scales=None):
+        """Layer over rows in any order; returns (layer, input position of every stored row).
+
+        Rows already grouped by person (as written by ``gallery_store``) are
+        used as-is, so a read-only memmap stays shared instead of being copied.
+        """
+        person_ids = np.asarray(person_ids)
+        if len(person_ids) and np.any(person_ids[1:] < person_ids[:-1]):
+            order = np.argsort(person_ids, kind='stable')
+            matrix = np.ascontiguousarray(np.asarray(matrix)[order])
+            person_ids = person_ids[order]
+        else:
+            order = np.arange(len(person_ids))
+        return cls(people, person_ids, matrix, scales), order
+
+    def __len__(self):
+        return len(self.matrix)
+
+    @property
+    def precision(self):
+        """Storage precision of the matrix ("float32", "float16" or "int8")"""
+        return precision_of(self.matrix)
+
+    def blocks(self):
+        """(first row, float32 rows) over the layer; one block if stored as float32"""
+        if self.precision == 'float32':
+            if len(self.matrix):
+                yield 0, self.matrix
+            return
+        for start in range(0, len(self.matrix), DEQUANTIZE_BLOCK_ROWS):
+            yield start, dequantize(self.matrix[start:start + DEQUANTIZE_BLOCK_ROWS], self.scales)
+
+
+class GalleryMatcher:
+    """Known face encodings, matched against a batch of probes in one pass.
+
+    Encodings are held in layers: the base (typically the read-only memmap
+    of the gallery file, whose pages every worker shares) and the rows added
+    since, which are the only ones kept in private memory. Rows are grouped
+    by person within a layer, so per-person minimum distances are taken with
+    one ``np.minimum.reduceat`` over the runs of the distance matrix, then
+    across the (at most one per layer) runs of every person.
+    An optional ANN ``index`` narrows each probe down to a shortlist of rows,
+    and per-person centroids (``prototypes``) allow a cheap first pass that is
+    refined against the raw encodings of the best few people only.
+
+    People can be tombstoned (``removed``) without touching the matrices:
+    their runs are masked out (``run_live``) and their distances set to
+    ``inf``. ``extended`` drops dead rows from the added layer; the base
+    loses them when the gallery file is compacted.
+
+    The matrices may be stored as float16 or int8 (with per-dimension
+    ``scales``); distances are then computed on float32 blocks of
+    ``DEQUANTIZE_BLOCK_ROWS`` rows, so no full float32 copy is ever held.
+    """
+
+    def __init__(self, names, encodings):
+        names = list(names)
+        people, person_ids = np.unique(np.array(names, dtype=str), return_inverse=True)
+        matrix = np.asarray(encodings, dtype=np.float32).reshape(len(names), ENCODING_DIM)
+        layer, order = GalleryLayer.grouped([str(p) for p in people], person_ids.astype(np.int32), matrix)
+        self._assemble([layer])
+        self.source_order = order  # input position of every stored row
+
+    @classmethod
+    def from_arrays(cls, people, person_ids, matrix, scales=None):
+        """Adopt a people table, per-row person ids and a float32/float16/int8 matrix.
+
+        Arrays already grouped by person (as written by ``gallery_store``) are
+        used as-is, so a read-only memmap stays shared instead of being copied.
+        """
+        layer, order = GalleryLayer.grouped(people, person_ids, matrix, scales)
+        matcher = cls.__new__(cls)
+        matcher._assemble([layer])
+        matcher.source_order = order
+        return matcher
+
+    @classmethod
+    def layered(cls, base, delta=None, deleted=(), index=None):
+        """Matcher over a base ``GalleryLayer`` and the rows added since.
+
+        ``delta`` is (people, person_ids, matrix, scales) of the added rows,
+        stored in the base's precision and scales; the base rows of
+        ``deleted`` people are masked out. An ``index`` over the base rows is
+        extended with the added rows, as ``extended`` does.
+        """
+        layers = [base]
+        if delta is not None and len(delta[1]):
+            people, person_ids, matrix, scales = delta
+            matrix, _ = requantize(matrix, scales, base.precision, base.scales)
+            layers.append(GalleryLayer.grouped(people, person_ids, matrix, base.scales)[0])
+        lookup = {person: i for i, person in enumerate(base.people)}
+        deleted = [lookup[name] for name in deleted if name in lookup]
+        run_live = np.concatenate([~np.isin(base.run_people, deleted)]
+                                  + [np.ones(len(layer.run_starts), dtype=bool) for layer in layers[1:]])
+        matcher = cls.__new__(cls)
+        matcher._assemble(layers, run_live)
+        matcher.source_order = None
+        if index is not None:
+            added = np.arange(len(base), len(matcher))
+            matcher.index = index.extended(matcher._dequantized(added), added) if len(added) else index
+        return matcher
+
+    def _assemble(self, layers, run_live=None, index=None):
+        """Combine layers into the row, run and person tables matching works on"""
+        self.layers = layers
+        self.scales = layers[0].scales
+        self.index = index
+        self.offsets = np.cumsum([0] + [len(layer) for layer in layers])
+
+        # People with rows in some layer; one layer keeps its own table order
+        if len(layers) == 1:
+            people = [layers[0].people[i] for i in np.unique(layers[0].run_people)]
+        else:
+            people = sorted({layer.people[i] for layer in layers for i in np.unique(layer.run_people)})
+        position = {person: i for i, person in enumerate(people)}
+        lookups = []
+        for layer in layers:
+            lookup = np.full(len(layer.people), -1, dtype=np.int32)
+            present = np.unique(layer.run_people)
+            lookup[present] = [position[layer.people[i]] for i in present]
+            lookups.append(lookup)
+        self.people = people
+
+        if len(layers) == 1 and np.array_equal(lookups[0], np.arange(len(people))):
+            self.person_ids = layers[0].person_ids
+            self.sq_norms = layers[0].sq_norms
+        else:
+            self.person_ids = np.concatenate([lookup[layer.person_ids] for lookup, layer in zip(lookups, layers)])
+            self.sq_norms = np.concatenate([layer.sq_norms for layer in layers])
+        self.run_starts = np.concatenate([layer.run_starts + offset
+                                          for layer, offset in zip(layers, self.offsets)]).astype(np.int64)
+        self.run_ends = np.append(self.run_starts[1:], len(self)).astype(np.int64)
+        self.run_people = np.concatenate([lookup[layer.run_people]
+                                          for lookup, layer in zip(lookups, layers)]).astype(np.int32)
+        self.run_sums = np.concatenate([layer.run_sums for layer in layers])
+        self.run_live = np.ones(len(self.run_starts), dtype=bool) if run_live is None else run_live
+
+        # Reduction from per-run to per-person minima, unless runs are people already
+        if np.array_equal(self.run_people, np.arange(len(people))):
+            self._run_order = None
+        else:
+            self._run_order = np.argsort(self.run_people, kind='stable')
+            self._person_runs = np.searchsorted(self.run_people[self._run_order], np.arange(len(people)))
+        self._refresh()
+
+    def _refresh(self):
+        """Recompute what depends on which runs are live: removed people and prototypes"""
+        live = self.run_live
+        self.dead_runs = np.flatnonzero(~live)
+        counts = np.bincount(self.run_people[live], weights=(self.run_ends - self.run_starts)[live],
+                             minlength=len(self.people))
+        self.removed = counts == 0
+        self.row_counts = counts.astype(np.int64)
+
+        self.prototypes = np.zeros((len(self.people), ENCODING_DIM), dtype=np.float32)
+        np.add.at(self.prototypes, self.run_people[live], self.run_sums[live])
+        self.prototypes[~self.removed] /= counts[~self.removed, None]
+        self.prototype_sq = np.einsum('ij,ij->i', self.prototypes, self.prototypes)
+
+    def _stored(self, rows):
+        """Stored values of the given gallery rows (row numbers)"""
+        if len(self.layers) == 1:
+            return self.layers[0].matrix[rows]
+        rows = np.asarray(rows)
+        out = np.empty((len(rows), ENCODING_DIM), dtype=self.layers[0].matrix.dtype)
+        layer_of = np.searchsorted(self.offsets, rows, side='right') - 1
+        for i, layer in enumerate(self.layers):
+            selected = layer_of == i
+            if selected.any():
+                out[selected] = layer.matrix[rows[selected] - self.offsets[i]]
+        return out
+
+    def _dequantized(self, rows):
+        """float32 values of the selected gallery rows"""
+        return dequantize(self._stored(rows), self.scales)
+
+    def _live_rows(self):
+        """Row numbers of the live runs"""
+        return np.flatnonzero(np.repeat(self.run_live, self.run_ends - self.run_starts))
+
+    def _runs_of(self, person):
+        """Rows of the live runs of one person"""
+        runs = np.flatnonzero((self.run_people == person) & self.run_live)
+        return np.concatenate([np.arange(self.run_starts[r], self.run_ends[r]) for r in runs])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    @property
+    def precision(self):
+        """Storage precision of the matrices ("float32", "float16" or "int8")"""
+        return self.layers[0].precision
+
+    @property
+    def nbytes(self):
+        """Bytes held by the encoding matrices"""
+        return sum(int(layer.matrix.nbytes) for layer in self.layers)
+
+    def quantized(self, precision):
+        """New matcher storing its matrices in ``precision``; shares the index with this one"""
+        base = self.layers[0]
+        scales = None
+        if precision == 'int8' and not len(base) and len(self):
+            # An empty base takes its int8 scales from the rows added since
+            _, scales = quantize(self._dequantized(np.arange(len(self))), precision)
+        matrix, scales = requantize(base.matrix, self.scales, precision, scales)
+        if matrix is base.matrix:
+            return self
+        layers = [GalleryLayer(base.people, base.person_ids, matrix, scales)]
+        for layer in self.layers[1:]:
+            layers.append(GalleryLayer(layer.people, layer.person_ids,
+                                       requantize(layer.matrix, self.scales, precision, scales)[0], scales))
+        matcher = copy.copy(self)
+        matcher._assemble(layers, self.run_live.copy(), self.index)
+        return matcher
+
+    @property
+    def live_people(self):
+        """People that have not been removed"""
+        return [p for p, removed in zip(self.people, self.removed) if not removed]
+
+    @property
+    def live_person_count(self):
+        """Number of people that have not been removed"""
+        return int(len(self.removed) - self.removed.sum())
+
+    @property
+    def live_rows(self):
+        """Number of encodings of people that have not been removed"""
+        return int(self.row_counts.sum())
+
+    def live_arrays(self):
+        """(people, person_ids, matrix) of the live rows; a copy when there are several layers or dead rows"""
+        if len(self.layers) == 1 and not len(self.dead_runs):
+            return self.people, self.person_ids, self.layers[0].matrix
+        rows = self._live_rows()
+        return self.people, self.person_ids[rows], self._stored(rows)
+
+    def person_encodings(self, name):
+        """Encodings of one person (empty if unknown or removed)"""
+        if name not in self.people:
+            return np.zeros((0, ENCODING_DIM), dtype=np.float32)
+        i = self.people.index(name)
+        if self.removed[i]:
+            return np.zeros((0, ENCODING_DIM), dtype=np.float32)
+        return self._dequantized(self._runs_of(i))
+
+    def without(self, names):
+        """New matcher with ``names`` tombstoned; shares the matrices and index with this one"""
+        lookup = {person: i for i, person in enumerate(self.people)}
+        matcher = copy.copy(self)
+        matcher.run_live = self.run_live & ~np.isin(self.run_people, [lookup[name] for name in names if name in lookup])
+        matcher._refresh()
+        return matcher
+
+    def build_index(self, **params):
+        """Build an IVF index over the gallery rows"""
+        if len(self):
+            # k-means needs real values: compact or layered matrices are expanded for the build only
+            single = len(self.layers) == 1 and self.precision == 'float32'
+            matrix = self.layers[0].matrix if single else self._dequantized(np.arange(len(self)))
+            self.index = IVFIndex.build(matrix, **params)
+        return self.index
+
+    def extended(self, names, encodings):
+        """New matcher with ``encodings`` added and the rows added earlier by removed people dropped.
+
+        The base layer is kept as-is (removed people stay masked in it); the
+        live rows added since and the new ones form the second layer, stored
+        in this matcher's precision (and int8 scales). The index is updated,
+        not rebuilt.
+        """
+        names = list(names)
+        new_rows = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        base = self.layers[0]
+        added = int(self.offsets[1])
+        kept = self._live_rows()
+        kept = kept[kept >= added]
+
+        # An empty int8 gallery takes its scales from the first rows added
+        new_codes, scales = quantize(new_rows, self.precision, self.scales if len(self) else None)
+        if not len(self):
+            base = GalleryLayer([], np.zeros(0, dtype=np.int32), np.zeros((0, ENCODING_DIM), new_codes.dtype), scales)
+        people, person_ids = np.unique(np.array([self.people[i] for i in self.person_ids[kept]] + names, dtype=str),
+                                       return_inverse=True)
+        delta, order = GalleryLayer.grouped([str(p) for p in people], person_ids.astype(np.int32),
+                                            np.concatenate([self._stored(kept), new_codes]), scales)
+        layers = [base, delta] if len(delta) else [base]
+        base_runs = int(np.searchsorted(self.run_starts, added))
+
+        combined = GalleryMatcher.__new__(GalleryMatcher)
+        combined._assemble(layers, np.concatenate([self.run_live[:base_runs],
+                                                   np.ones(len(delta.run_starts), dtype=bool)]))
+        combined.source_order = None
+        if self.index is not None:
+            # Row numbers of the kept and new encodings after regrouping by person
+            position = np.empty(len(delta), dtype=np.int64)
+            position[order] = np.arange(len(delta)) + len(base)
+            remap = np.arange(len(self), dtype=np.int64)
+            remap[added:] = -1
+            remap[kept] = position[:len(kept)]
+            combined.index = self.index.extended(new_rows, position[len(kept):], remap=remap)
+        return combined
+
+    @property
+    def names(self):
+        """Person name for every gallery row"""
+        return [self.people[i] for i in self.person_ids]
+
+    def squared_distances(self, probes):
+        """Squared euclidean distances, shape (len(probes), len(gallery))"""
+        probe_sq = np.einsum('ij,ij->i', probes, probes)
+        d2 = np.empty((len(probes), len(self)), dtype=np.float32)
+        # int8 scales (and the float16 widening factor) are folded into the probes: (p * s) . q == p . (q * s)
+        if self.precision == 'float16':
+            scaled = probes * _FLOAT16_WIDENING
+        else:
+            scaled = probes * self.scales if self.scales is not None else probes
+        buffer = np.empty((DEQUANTIZE_BLOCK_ROWS, ENCODING_DIM), dtype=np.float32)
+        for offset, layer in zip(self.offsets, self.layers):
+            if layer.precision == 'float32':
+                np.matmul(probes, layer.matrix.T, out=d2[:, offset:offset + len(layer)])
+                continue
+            for start in range(0, len(layer), DEQUANTIZE_BLOCK_ROWS):
+                block = _widen(layer.matrix[start:start + DEQUANTIZE_BLOCK_ROWS], buffer)
+                np.matmul(scaled, block.T, out=d2[:, offset + start:offset + start + len(block)])
+        d2 *= -2
+        d2 += probe_sq[:, None]
+        d2 += self.sq_norms[None, :]
+        np.maximum(d2, 0, out=d2)
+        return d2
+
+    def _per_person(self, runs):
+        """Per-person minima from per-run minima, ``inf`` for dead runs and removed people"""
+        runs[:, self.dead_runs] = np.inf
+        if self._run_order is None:
+            return runs
+        return np.minimum.reduceat(runs[:, self._run_order], self._person_runs, axis=1)
+
+    def person_distances(self, probes):
+        """Distance from each probe to the closest encoding of every person"""
+        out = np.empty((len(probes), len(self.people)), dtype=np.float32)
+        step = max(1, MAX_BLOCK_ELEMENTS // max(len(self), 1))
+        for i in range(0, len(probes), step):
+            d2 = self.squared_distances(probes[i:i + step])
+            out[i:i + step] = self._per_person(np.minimum.reduceat(d2, self.run_starts, axis=1))
+        return np.sqrt(out, out=out)
+
+    def row_distances(self, probe, rows):
+        """Exact distances from one probe to the given gallery rows"""
+        d2 = self.sq_norms[rows] - 2 * (self._dequantized(rows) @ probe)
+        d2 += probe @ probe
+        return np.sqrt(np.maximum(d2, 0, out=d2), out=d2)
+
+    def prototype_distances(self, probes, refine_people=DEFAULT_REFINE_PEOPLE):
+        """Per-person distances refined only for the people with the closest prototypes.
+
+        Returns ``(people, distances)``: the union of shortlisted people and a
+        (len(probes), len(people)) matrix, ``inf`` where a person was not on
+        that probe's shortlist.
+        """
+        n = min(refine_people, len(self.people))
+        prototype_sq = np.where(self.removed, np.inf, self.prototype_sq)
+        d2 = prototype_sq[None, :] - 2 * (probes @ self.prototypes.T)
+        nearest = np.argpartition(d2, n - 1, axis=1)[:, :n]
+        people = np.unique(nearest)
+        people = people[~self.removed[people]]
+        distances = np.full((len(probes), len(people)), np.inf, dtype=np.float32)
+        if not len(people):
+            return people, distances
+
+        # Raw rows of the live runs of the shortlisted people, ordered by person
+        runs = np.flatnonzero(np.isin(self.run_people, people) & self.run_live)
+        runs = runs[np.argsort(self.run_people[runs], kind='stable')]
+        counts = self.run_ends[runs] - self.run_starts[runs]
+        segments = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        rows = np.repeat(self.run_starts[runs] - segments, counts) + np.arange(counts.sum())
+
+        d2 = self.sq_norms[rows][None, :] - 2 * (probes @ self._dequantized(rows).T)
+        d2 += np.einsum('ij,ij->i', probes, probes)[:, None]
+        per_run = np.minimum.reduceat(d2, segments, axis=1)
+        first_runs = np.searchsorted(self.run_people[runs], people)
+        refined = np.sqrt(np.maximum(np.minimum.reduceat(per_run, first_runs, axis=1), 0))
+
+        shortlisted = np.zeros(distances.shape, dtype=bool)
+        columns = np.searchsorted(people, nearest)
+        valid = (columns < len(people)) & (people[np.minimum(columns, len(people) - 1)] == nearest)
+        shortlisted[np.nonzero(valid)[0], columns[valid]] = True
+        distances[shortlisted] = refined[shortlisted]
+        return people, distances
+
+    def match(self, face_encodings, tolerance=DEFAULT_TOLERANCE, top_k=1, mode=None,
+              refine_people=DEFAULT_REFINE_PEOPLE):
+        """Match every probe encoding in one pass.
+
+        ``mode`` is ``"exact"`` (full scan), ``"ann"`` (index shortlist) or
+        ``"prototype"`` (closest prototypes, refined on the ``refine_people``
+        best people); the default uses the index when one has been built.
+
+        Returns one dict per probe with the best ``name``/``confidence``
+        (``Unknown``/0 when nothing is within ``tolerance``) and the
+        ``top_k`` closest people as ``candidates``.
+        """
+        probes = np.asarray(face_encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        if len(probes) == 0:
+            return []
+        if len(self) == 0:
+            return [_unknown() for _ in range(len(probes))]
+
+        if mode is None:
+            mode = 'ann' if self.index is not None else 'exact'
+        if mode == 'ann' and self.index is not None:
+            return [self._rank_rows(probe, rows, tolerance, top_k)
+                    for probe, rows in zip(probes, self.index.search(probes))]
+        if mode == 'prototype':
+            people, distances = self.prototype_distances(probes, max(refine_people, top_k))
+        else:
+            people, distances = None, self.person_distances(probes)
+
+        results = []
+        for row in distances:
+            finite = np.isfinite(row).sum()
+            if finite == 0:
+                results.append(_unknown())
+                continue
+            k = min(top_k, finite)
+            top = np.argpartition(row, k - 1)[:k]
+            top = top[np.argsort(row[top])]
+            results.append(self._result(top if people is None else people[top], row[top], tolerance))
+        return results
+
+    def _rank_rows(self, probe, rows, tolerance, top_k):
+        """Rank the people owning a shortlist of gallery rows"""
+        if len(self.dead_runs):
+            rows = rows[self.run_live[np.searchsorted(self.run_starts, rows, side='right') - 1]]
+        if len(rows) == 0:
+            return _unknown()
+        distances = self.row_distances(probe, rows)
+        order = np.argsort(distances)
+        # First (closest) occurrence of each person along the sorted shortlist
+        _, first = np.unique(self.person_ids[rows[order]], return_index=True)
+        best = order[np.sort(first)[:top_k]]
+        return self._result(self.person_ids[rows[best]], distances[best], tolerance)
+
+    def _result(self, people, distances, tolerance):
+        """Match result from people sorted by ascending distance"""
+        candidates = [{
+            'name': self.people[i],
+            'distance': float(d),
+            'confidence': float((1 - d) * 100)
+        } for i, d in zip(people, distances)]
+
+        best = candidates[0]
+        if best['distance'] > tolerance:
+            result = _unknown()
+            result['distance'] = best['distance']
+        else:
+            result = dict(best)
+        result['candidates'] = candidates
+        return result
+
+
+def _widen(block, buffer):
+    """float32 rows of a float16/int8 block, written into (the start of) ``buffer``.
+
+    float16 rows come out times 2**-112: shifting the bits is several times
+    faster than numpy's float16 conversion, and exact.
+    """
+    out = buffer[:len(block)]
+    if block.dtype == np.float16:
+        bits = out.view(np.int32)
+        np.copyto(bits, block.view(np.int16), casting='unsafe')
+        bits <<= 13
+        bits &= _FLOAT16_WIDENING_MASK
+    else:
+        np.copyto(out, block, casting='unsafe')
+    return out
+
+
+def _unknown():
+    return {'name': 'Unknown', 'confidence': 0.0, 'distance': None, 'candidates': []}
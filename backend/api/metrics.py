@@ -0,0 +1,309 @@
+"""Request and pipeline metrics in the Prometheus text format, merged across workers.
+
+Every gunicorn worker counts into plain in-process dicts (one lock, a bisect
+per observation). A background thread writes the worker's totals to a small
+file in METRICS_DIR about once a second, and only when something changed
+(or once a minute, for its gauges), so an idle or unscraped worker does next
+to no work. ``/metrics`` sums the files of all workers:
+
+- Counters and histograms keep counting after a worker exits: the files of
+  dead workers are folded into an archive file on the next scrape.
+- Gauges are sampled from callbacks when a worker writes its file. Only live
+  workers are reported, summed or maxed per gauge.
+"""
+
+import atexit
+import bisect
+import contextlib
+import fcntl
+import json
+import math
+import os
+import threading
+import time
+
+from .gallery_sync import default_shared_dir
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 1.0))
+# An idle worker still refreshes its gauges this often
+GAUGE_REFRESH_INTERVAL = 60
+
+METRICS_DIR = os.environ.get('METRICS_DIR') or default_shared_dir('metrics')
+
+# Seconds; covers a cache hit on the matcher up to the inference timeout
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+FACE_BUCKETS = (0, 1, 2, 3, 4, 6, 8, 12, 20)
+
+_ARCHIVE = 'archive.json'
+
+_lock = threading.Lock()
+_metrics = {}  # name -> metric, in registration order
+_dirty = False
+_flusher_pid = None
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.values = {}  # label values -> value
+        _metrics[name] = self
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        global _dirty
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+            _dirty = True
+
+
+class Histogram(_Metric):
+    """Bucket counts (per bucket, +Inf last), sum and count per label set"""
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        global _dirty
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            entry[index] += 1
+            entry[-2] += value
+            entry[-1] += 1
+            _dirty = True
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observe the seconds spent in the ``with`` block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+
+class Gauge(_Metric):
+    """Sampled from ``fn`` when the worker writes its metrics; ``merge`` is "sum" or "max" across workers"""
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, fn, merge='sum'):
+        super().__init__(name, help_text)
+        self.fn = fn
+        self.merge = merge
+
+    def sample(self):
+        try:
+            value = self.fn()
+        except Exception:
+            return None
+        return None if value is None else float(value)
+
+
+def _snapshot():
+    """This worker's totals as a JSON-able dict"""
+    with _lock:
+        data = {name: [[list(key), list(value) if isinstance(value, list) else value]
+                       for key, value in metric.values.items()]
+                for name, metric in _metrics.items() if metric.kind != 'gauge'}
+    data['_gauges'] = {name: metric.sample() for name, metric in _metrics.items() if metric.kind == 'gauge'}
+    return {'pid': os.getpid(), 'time': time.time(), 'metrics': data}
+
+
+def _write(path, snapshot):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, path)
+
+
+def flush():
+    """Write this worker's totals to its file in METRICS_DIR"""
+    global _dirty
+    if not METRICS_ENABLED:
+        return
+    _dirty = False
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        _write(os.path.join(METRICS_DIR, f'{os.getpid()}.json'), _snapshot())
+    except Exception as e:
+        print(f"⚠️ Writing metrics failed: {e}")
+
+
+def start():
+    """Start this process's flush thread (once per process, also after a fork)"""
+    global _flusher_pid
+    if not METRICS_ENABLED or _flusher_pid == os.getpid():
+        return
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    threading.Thread(target=_flush_loop, daemon=True, name='metrics-flush').start()
+
+
+def _flush_loop():
+    flushed = time.monotonic()
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        if _dirty or time.monotonic() - flushed >= GAUGE_REFRESH_INTERVAL:
+            flush()
+            flushed = time.monotonic()
+
+
+@atexit.register
+def _flush_at_exit():
+    if _flusher_pid == os.getpid():
+        flush()
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _add(totals, metrics):
+    """Sum one snapshot's counters and histograms into ``totals``"""
+    for name, entries in metrics.items():
+        if name == '_gauges':
+            continue
+        merged = totals.setdefault(name, {})
+        for key, value in entries:
+            key = tuple(key)
+            if isinstance(value, list):
+                current = merged.get(key)
+                merged[key] = value if current is None else [a + b for a, b in zip(current, value)]
+            else:
+                merged[key] = merged.get(key, 0) + value
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def collect():
+    """(totals, gauges, workers) over all workers; folds exited workers into the archive"""
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    own = _snapshot()
+    totals, gauges, workers = {}, {}, 1
+    lock_fd = os.open(os.path.join(METRICS_DIR, '.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        archive_path = os.path.join(METRICS_DIR, _ARCHIVE)
+        archive = _read(archive_path) or {'metrics': {}}
+        folded = False
+        for filename in os.listdir(METRICS_DIR):
+            if not filename.endswith('.json') or filename == _ARCHIVE:
+                continue
+            pid = int(filename.split('.')[0])
+            if pid == own['pid']:
+                continue
+            path = os.path.join(METRICS_DIR, filename)
+            snapshot = _read(path)
+            if snapshot is None:
+                continue
+            if not _alive(pid):
+                archived = {}
+                _add(archived, archive['metrics'])
+                _add(archived, snapshot['metrics'])
+                archive['metrics'] = {name: [[list(k), v] for k, v in entries.items()]
+                                      for name, entries in archived.items()}
+                os.remove(path)
+                folded = True
+                continue
+            workers += 1
+            _add(totals, snapshot['metrics'])
+            for name, value in snapshot['metrics'].get('_gauges', {}).items():
+                gauges.setdefault(name, []).append(value)
+        if folded:
+            _write(archive_path, archive)
+        _add(totals, archive['metrics'])
+    finally:
+        fcntl.flock(lock_fd, fcntl.LOCK_UN)
+        os.close(lock_fd)
+    _add(totals, own['metrics'])
+    for name, value in own['metrics']['_gauges'].items():
+        gauges.setdefault(name, []).append(value)
+    return totals, gauges, workers
+
+
+def _labels(labelnames, key, extra=()):
+    pairs = list(zip(labelnames, key)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """All metrics of all workers in the Prometheus text exposition format"""
+    totals, gauges, workers = collect()
+    lines = ['# HELP face_api_workers Worker processes reporting metrics',
+             '# TYPE face_api_workers gauge',
+             f'face_api_workers {workers}']
+    for name, metric in _metrics.items():
+        lines.append(f'# HELP {name} {metric.help}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        if metric.kind == 'gauge':
+            values = [v for v in gauges.get(name, []) if v is not None]
+            if values:
+                lines.append(f'{name} {_number(max(values) if metric.merge == "max" else sum(values))}')
+            continue
+        for key, value in sorted(totals.get(name, {}).items()):
+            if metric.kind == 'counter':
+                lines.append(f'{name}{_labels(metric.labelnames, key)} {_number(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets + (math.inf,), value):
+                cumulative += count
+                le = _number(float(bound)) if bound != math.inf else '+Inf'
+                lines.append(f'{name}_bucket{_labels(metric.labelnames, key, [("le", le)])} {cumulative}')
+            lines.append(f'{name}_sum{_labels(metric.labelnames, key)} {_number(float(value[-2]))}')
+            lines.append(f'{name}_count{_labels(metric.labelnames, key)} {value[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+REQUESTS = Counter('face_api_requests_total', 'HTTP requests by endpoint, method and status',
+                   ('endpoint', 'method', 'status'))
+REQUEST_SECONDS = Histogram('face_api_request_duration_seconds', 'Time to build the response, by endpoint',
+                            LATENCY_BUCKETS, ('endpoint',))
+STAGE_SECONDS = Histogram('face_api_stage_duration_seconds',
+                          'Time per recognition pipeline stage (queue_wait, decode, detect, encode, match, log)',
+                          LATENCY_BUCKETS, ('endpoint', 'stage'))
+FACES_PER_IMAGE = Histogram('face_api_faces_per_image', 'Faces found per recognized image',
+                            FACE_BUCKETS, ('endpoint',))
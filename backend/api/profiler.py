@@ -0,0 +1,235 @@
+"""Sampling profiler for a fraction of requests, served as flame-graph input.
+
+A sampled request gets a sampler thread that records the request thread's
+Python stack every PROFILE_INTERVAL_MS milliseconds (``sys._current_frames``,
+so the request itself is not slowed by tracing hooks). Work sent to the
+inference pool is sampled inside the pool process and merged under an
+``inference-pool`` frame. Requests that are not sampled pay one random draw.
+
+Each profile (endpoint, time, duration and collapsed stacks) is appended to
+the worker's file in PROFILE_DIR. A file is rotated once it reaches
+PROFILE_FILE_BYTES, so every worker keeps at most two files. ``/admin/profiles``
+merges all workers' files into the collapsed-stack format read by
+flamegraph.pl, speedscope and inferno.
+"""
+
+import collections
+import contextlib
+import functools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from .gallery_sync import default_shared_dir
+
+# Fraction of requests profiled (0 = profiler off)
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 10))
+PROFILE_ENDPOINTS = tuple(e.strip() for e in os.environ.get(
+    'PROFILE_ENDPOINTS', '/recognize,/recognize/batch,/enroll,/train').split(',') if e.strip())
+PROFILE_DIR = os.environ.get('PROFILE_DIR') or default_shared_dir('profiles')
+PROFILE_FILE_BYTES = int(os.environ.get('PROFILE_FILE_BYTES', 4 * 2**20))
+# Files of workers that stopped writing are removed after this many hours
+PROFILE_RETENTION_HOURS = float(os.environ.get('PROFILE_RETENTION_HOURS', 24))
+
+_local = threading.local()
+_write_lock = threading.Lock()
+_frame_names = {}  # code object -> "file.py:function"
+
+
+def _frame_name(code):
+    name = _frame_names.get(code)
+    if name is None:
+        name = _frame_names[code] = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+    return name
+
+
+def _collapse(frame):
+    """'root;...;leaf' for a frame and its callers"""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Sampler:
+    """Samples one thread's stack on a background thread until stopped"""
+
+    def __init__(self, endpoint, interval_ms=None):
+        self.endpoint = endpoint
+        self.interval = (interval_ms or PROFILE_INTERVAL_MS) / 1000
+        self.thread_id = threading.get_ident()
+        self.stacks = collections.Counter()
+        self.started = None
+        self.duration = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started = time.time()
+        self._thread = threading.Thread(target=self._run, daemon=True, name='profiler')
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return
+            self.stacks[_collapse(frame)] += 1
+
+    def stop(self):
+        if self.duration is None:
+            self._stop.set()
+            self._thread.join()
+            self.duration = time.time() - self.started
+        return self
+
+    def add(self, stacks, prefix):
+        """Merge stacks sampled elsewhere (e.g. in a pool process) under a ``prefix`` frame"""
+        for stack, count in stacks.items():
+            self.stacks[f'{prefix};{stack}'] += count
+
+
+def maybe_start(endpoint):
+    """Start sampling this thread for ``endpoint`` with probability PROFILE_SAMPLE_RATE; returns the sampler"""
+    if PROFILE_SAMPLE_RATE <= 0 or endpoint not in PROFILE_ENDPOINTS or random.random() >= PROFILE_SAMPLE_RATE:
+        return None
+    sampler = Sampler(endpoint).start()
+    _local.sampler = sampler
+    return sampler
+
+
+def finish(sampler, status=None):
+    """Stop a sampler from maybe_start() and store its profile"""
+    if sampler is None:
+        return
+    sampler.stop()
+    if getattr(_local, 'sampler', None) is sampler:
+        _local.sampler = None
+    if sampler.stacks:
+        _record(sampler, status)
+
+
+@contextlib.contextmanager
+def sampled(endpoint):
+    """Profile the ``with`` block like a request to ``endpoint`` (subject to the sample rate)"""
+    sampler = maybe_start(endpoint)
+    status = 'ok'
+    try:
+        yield sampler
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        finish(sampler, status)
+
+
+class _Profiled:
+    """Result of a pool job plus the stacks sampled while it ran"""
+
+    def __init__(self, result, stacks):
+        self.result = result
+        self.stacks = stacks
+
+
+def _sampled_job(fn, interval_ms, *args):
+    sampler = Sampler('inference-pool', interval_ms).start()
+    try:
+        result = fn(*args)
+    finally:
+        sampler.stop()
+    return _Profiled(result, dict(sampler.stacks))
+
+
+def pool_job(fn, executor):
+    """``fn``, sampled inside the pool process when this thread is being profiled"""
+    if getattr(_local, 'sampler', None) is None or executor.workers == 0:
+        return fn
+    return functools.partial(_sampled_job, fn, PROFILE_INTERVAL_MS)
+
+
+def unwrap(result):
+    """Result of a pool_job(); its stacks go to this thread's sampler"""
+    if not isinstance(result, _Profiled):
+        return result
+    sampler = getattr(_local, 'sampler', None)
+    if sampler is not None:
+        sampler.add(result.stacks, 'inference-pool')
+    return result.result
+
+
+def _record(sampler, status):
+    """Append a profile to this worker's file, rotating it at PROFILE_FILE_BYTES"""
+    line = json.dumps({
+        'time': datetime.fromtimestamp(sampler.started).isoformat(),
+        'endpoint': sampler.endpoint,
+        'status': status,
+        'duration_ms': round(sampler.duration * 1000, 1),
+        'samples': sum(sampler.stacks.values()),
+        'interval_ms': sampler.interval * 1000,
+        'stacks': sampler.stacks,
+    }) + '\n'
+    path = os.path.join(PROFILE_DIR, f'{os.getpid()}.ndjson')
+    try:
+        with _write_lock:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            if os.path.exists(path) and os.path.getsize(path) + len(line) > PROFILE_FILE_BYTES:
+                os.replace(path, path + '.1')
+            with open(path, 'a') as f:
+                f.write(line)
+    except OSError as e:
+        print(f"⚠️ Storing profile failed: {e}")
+
+
+def profiles(endpoint=None, since=None, until=None):
+    """Stored profiles of all workers, oldest first (times are normalized ISO strings)"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    expired = time.time() - PROFILE_RETENTION_HOURS * 3600
+    found = []
+    for filename in os.listdir(PROFILE_DIR):
+        if not filename.endswith(('.ndjson', '.ndjson.1')):
+            continue
+        path = os.path.join(PROFILE_DIR, filename)
+        try:
+            if os.path.getmtime(path) < expired:
+                os.remove(path)
+                continue
+            with open(path) as f:
+                lines = f.readlines()
+        except OSError:
+            continue
+        for line in lines:
+            try:
+                profile = json.loads(line)
+            except ValueError:
+                continue  # A line being appended right now
+            if endpoint and profile['endpoint'] != endpoint:
+                continue
+            if since and profile['time'] < since:
+                continue
+            if until and profile['time'] >= until:
+                continue
+            found.append(profile)
+    found.sort(key=lambda p: p['time'])
+    return found
+
+
+def collapsed(found):
+    """Collapsed stacks ("frame;frame;frame count" lines) of profiles, rooted at their endpoint"""
+    totals = collections.Counter()
+    for profile in found:
+        for stack, count in profile['stacks'].items():
+            totals[f"{profile['endpoint']};{stack}"] += count
+    return ''.join(f'{stack} {count}\n' for stack, count in sorted(totals.items()))
+
+
+def default_since():
+    """Start of the default /admin/profiles window (the last hour)"""
+    return (datetime.now() - timedelta(hours=1)).isoformat()
@@ -0,0 +1,98 @@
+"""Gallery redundancy pruning: drop near-duplicate encodings and cap each person.
+
+Enrollment bursts produce many almost identical frames. Every extra row costs
+matching time on each probe without adding discriminative power, so a
+person's encodings are thinned out to the ones that cover their appearance.
+"""
+
+import numpy as np
+
+# Encodings of one person closer than this to an already kept one are dropped (0 = off).
+# Burst frames of one photo are ~0.06 apart, different photos of a person ~0.3-0.5.
+DEFAULT_MIN_DISTANCE = 0.1
+# Most encodings kept per person, chosen by k-medoids (0 = no cap)
+DEFAULT_MAX_PER_PERSON = 0
+
+
+def _pairwise(x):
+    sq = np.einsum('ij,ij->i', x, x)
+    d2 = sq[:, None] + sq[None, :] - 2 * (x @ x.T)
+    np.fill_diagonal(d2, 0)  # exactly, not up to rounding
+    return np.sqrt(np.maximum(d2, 0, out=d2), out=d2)
+
+
+def _k_medoids(d, k, iterations=10):
+    """Indices of at most ``k`` medoids of a distance matrix.
+
+    Farthest-point initialisation spreads the medoids over the person's whole
+    appearance range (coverage); alternating assignment/update steps then move
+    each medoid to the centre of the encodings it represents. Fewer medoids
+    are returned when fewer than ``k`` rows are distinct.
+    """
+    medoids = [int(np.argmin(d.sum(axis=1)))]
+    nearest = d[medoids[0]].copy()
+    while len(medoids) < k:
+        farthest = int(np.argmax(nearest))
+        if nearest[farthest] <= 0:
+            break  # every row duplicates a medoid already
+        medoids.append(farthest)
+        np.minimum(nearest, d[farthest], out=nearest)
+    medoids = np.array(medoids)
+
+    for _ in range(iterations):
+        assignment = np.argmin(d[medoids], axis=0)
+        updated = medoids.copy()
+        for cluster in range(len(medoids)):
+            members = np.flatnonzero(assignment == cluster)
+            if not len(members):
+                continue  # its medoid ties with an identical one listed first
+            updated[cluster] = members[np.argmin(d[np.ix_(members, members)].sum(axis=1))]
+        if np.array_equal(updated, medoids):
+            break
+        medoids = updated
+    return np.sort(medoids)
+
+
+def prune_person(encodings, min_distance=DEFAULT_MIN_DISTANCE, max_count=DEFAULT_MAX_PER_PERSON):
+    """Sorted indices of the encodings of one person worth keeping"""
+    x = np.asarray(encodings, dtype=np.float32).reshape(len(encodings), -1)
+    keep = np.arange(len(x))
+    if len(x) <= 1 or (min_distance <= 0 and (not max_count or len(x) <= max_count)):
+        return keep
+
+    d = _pairwise(x)
+    if min_distance > 0:
+        # Most central encodings first, so each kept row stands for its near-duplicates
+        dropped = np.zeros(len(x), dtype=bool)
+        kept = []
+        for i in np.argsort(d.sum(axis=1)):
+            if not dropped[i]:
+                kept.append(i)
+                dropped |= d[i] < min_distance
+        keep = np.sort(kept)
+
+    if max_count and len(keep) > max_count:
+        keep = keep[_k_medoids(d[np.ix_(keep, keep)], max_count)]
+    return keep
+
+
+def prune_gallery(names, encodings, min_distance=DEFAULT_MIN_DISTANCE, max_count=DEFAULT_MAX_PER_PERSON):
+    """Prune every person of a (names, encodings) gallery.
+
+    Returns the sorted row indices to keep and per-run stats.
+    """
+    names = np.asarray(list(names), dtype=str)
+    encodings = np.asarray(encodings, dtype=np.float32)
+    keep = []
+    pruned_people = 0
+    for person in np.unique(names):
+        rows = np.flatnonzero(names == person)
+        kept = rows[prune_person(encodings[rows], min_distance, max_count)]
+        pruned_people += len(kept) < len(rows)
+        keep.append(kept)
+    keep = np.sort(np.concatenate(keep)) if keep else np.zeros(0, dtype=np.int64)
+    return keep, {
+        'encodings_before': len(names),
+        'encodings_after': len(keep),
+        'people_pruned': int(pruned_people),
+    }
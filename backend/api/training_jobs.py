@@ -0,0 +1,210 @@
+"""Background training jobs with their state on disk.
+
+Every job is a JSON file in the jobs directory, rewritten atomically as the
+job progresses, so any worker can answer ``GET /train/<id>``. The process
+running a job holds an exclusive flock on the job's ``.lock`` file; the
+kernel drops it if that process dies, and the next worker to scan the
+directory picks the unfinished job up again.
+
+Each process keeps the jobs it has read in memory and only parses a file
+again when it changes (finished jobs never do), and only the newest
+``keep_finished`` finished jobs are kept on disk.
+"""
+
+import contextlib
+import fcntl
+import json
+import os
+import queue
+import re
+import threading
+import uuid
+from datetime import datetime
+
+FINISHED = ('completed', 'failed')
+DEFAULT_KEEP_FINISHED = 500
+
+_JOB_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+def _now():
+    return datetime.now().astimezone().isoformat(timespec='seconds')
+
+
+class TrainingJobs:
+    """Queue of training jobs run by one background thread per worker process.
+
+    ``run_job(job, report)`` does the work: it updates the ``job`` dict and
+    calls ``report()`` to persist progress. It raises to fail the job.
+    """
+
+    def __init__(self, directory, run_job, scan_interval=30.0, keep_finished=DEFAULT_KEEP_FINISHED):
+        self.directory = directory
+        self.run_job = run_job
+        self.scan_interval = scan_interval
+        self.keep_finished = keep_finished  # 0 keeps every finished job
+        self._index = {}  # job id -> (mtime_ns, job) of every job file read
+        self._index_lock = threading.Lock()
+        self._queue = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, job_id, extension='.json'):
+        return os.path.join(self.directory, job_id + extension)
+
+    def load(self, job_id):
+        """Job state, or None for an unknown id"""
+        if not _JOB_ID.match(job_id):
+            return None
+        try:
+            with open(self._path(job_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, job):
+        job['updated_at'] = _now()
+        tmp_path = self._path(job['id'], f'.{os.getpid()}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(job, f, indent=2)
+        os.replace(tmp_path, self._path(job['id']))
+
+    def jobs(self):
+        """All jobs on disk, oldest first; a file is parsed again only when it has changed"""
+        job_ids = {f[:-5] for f in os.listdir(self.directory) if f.endswith('.json') and _JOB_ID.match(f[:-5])}
+        with self._index_lock:
+            for job_id in set(self._index) - job_ids:
+                del self._index[job_id]
+            for job_id in job_ids:
+                cached = self._index.get(job_id)
+                if cached is not None and cached[1]['status'] in FINISHED:
+                    continue
+                try:
+                    mtime = os.stat(self._path(job_id)).st_mtime_ns
+                except OSError:
+                    continue
+                if cached is not None and cached[0] == mtime:
+                    continue
+                job = self.load(job_id)
+                if job is not None:
+                    self._index[job_id] = (mtime, job)
+            found = [dict(job) for _, job in self._index.values()]
+        return sorted(found, key=lambda job: job['created_at'])
+
+    def prune(self):
+        """Delete the oldest finished jobs beyond ``keep_finished``; returns how many"""
+        if self.keep_finished <= 0:
+            return 0
+        finished = sorted((job for job in self.jobs() if job['status'] in FINISHED),
+                          key=lambda job: job['finished_at'] or job['created_at'])
+        expired = finished[:max(0, len(finished) - self.keep_finished)]
+        for job in expired:
+            for extension in ('.json', '.lock'):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(self._path(job['id'], extension))
+        return len(expired)
+
+    @contextlib.contextmanager
+    def _flock(self, path, blocking=True):
+        """Exclusive lock on ``path``; yields False if ``blocking`` is off and it is taken"""
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            yield True
+        finally:
+            os.close(fd)
+
+    def submit(self, name, images_total, replace=False):
+        """Queue a job for ``name``; returns (job, created) with an already pending job reused.
+
+        A ``replace`` job swaps the person's existing encodings for the new ones.
+        """
+        self.start()
+        with self._flock(os.path.join(self.directory, '.submit.lock')):
+            for job in self.jobs():
+                if job['name'] == name and job.get('replace', False) == replace and job['status'] not in FINISHED:
+                    return job, False
+            job = {
+                'id': uuid.uuid4().hex,
+                'name': name,
+                'replace': replace,
+                'status': 'queued',
+                'created_at': _now(),
+                'started_at': None,
+                'finished_at': None,
+                'attempts': 0,
+                'images_total': images_total,
+                'images_processed': 0,
+                'faces_added': 0,
+                'encodings_reused': 0,
+                'faces_pruned': 0,
+                'errors': [],
+                'error': None,
+                'gallery_version': None,
+                'total_faces': None,
+            }
+            self.save(job)
+        self._queue.put(job['id'])
+        return job, True
+
+    def start(self):
+        """Start this process's runner thread (once per process, also after a fork)"""
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._pid = os.getpid()
+            threading.Thread(target=self._loop, daemon=True, name='training-jobs').start()
+
+    def _loop(self):
+        self._resume()
+        while True:
+            try:
+                job_id = self._queue.get(timeout=self.scan_interval)
+            except queue.Empty:
+                self._resume()
+                continue
+            self._claim_and_run(job_id)
+
+    def _resume(self):
+        """Run unfinished jobs nobody holds a lock on (their worker died or restarted)"""
+        try:
+            self.prune()
+            pending = [job['id'] for job in self.jobs() if job['status'] not in FINISHED]
+        except OSError as e:
+            print(f"Warning: Failed to scan training jobs: {str(e)}")
+            return
+        for job_id in pending:
+            self._claim_and_run(job_id)
+
+    def _claim_and_run(self, job_id):
+        with self._flock(self._path(job_id, '.lock'), blocking=False) as claimed:
+            if not claimed:
+                return
+            job = self.load(job_id)
+            if job is None or job['status'] in FINISHED:
+                return
+            if job['status'] == 'running':
+                print(f"🔁 Resuming training job {job_id} for {job['name']}")
+            job['status'] = 'running'
+            job['attempts'] += 1
+            job['started_at'] = job['started_at'] or _now()
+            self.save(job)
+            try:
+                self.run_job(job, lambda: self.save(job))
+                job['status'] = 'completed'
+            except Exception as e:
+                print(f"Error in training job {job_id}: {str(e)}")
+                job['status'] = 'failed'
+                job['error'] = str(e)
+            job['finished_at'] = _now()
+            self.save(job)
+        try:
+            self.prune()
+        except OSError as e:
+            print(f"Warning: Failed to prune training jobs: {str(e)}")
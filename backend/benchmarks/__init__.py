@@ -0,0 +1,2 @@
+# Benchmarks for the recognition hot paths. Run from the backend directory, e.g.
+#   python -m benchmarks.bench_ann
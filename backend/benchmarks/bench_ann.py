@@ -0,0 +1,76 @@
+"""Recall/latency of the IVF index against the brute-force matcher.
+
+Usage (from backend/):
+    python -m benchmarks.bench_ann --sizes 10000 100000 1000000
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from api.matcher import GalleryMatcher
+from benchmarks.synthetic import make_gallery, make_probes
+
+
+def time_queries(matcher, probes, mode):
+    """Match probes one at a time (as /recognize does per image); return results and latencies"""
+    results, latencies = [], []
+    for probe in probes:
+        start = time.perf_counter()
+        results.extend(matcher.match([probe], mode=mode))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, np.array(latencies)
+
+
+def run(size, n_probes, n_probe, n_lists=None):
+    names, encodings, centres = make_gallery(size)
+    _, probes = make_probes(centres, n_probes)
+
+    matcher = GalleryMatcher(names, encodings)
+    start = time.perf_counter()
+    matcher.build_index(n_lists=n_lists, n_probe=n_probe)
+    build_s = time.perf_counter() - start
+
+    exact, exact_ms = time_queries(matcher, probes, 'exact')
+    approx, ann_ms = time_queries(matcher, probes, 'ann')
+    recall = np.mean([e['name'] == a['name'] for e, a in zip(exact, approx)])
+
+    return {
+        'gallery_size': size,
+        'n_lists': len(matcher.index.lists),
+        'n_probe': n_probe,
+        'index_build_s': round(build_s, 3),
+        'recall_at_1': float(recall),
+        'exact_p50_ms': float(np.percentile(exact_ms, 50)),
+        'exact_p95_ms': float(np.percentile(exact_ms, 95)),
+        'ann_p50_ms': float(np.percentile(ann_ms, 50)),
+        'ann_p95_ms': float(np.percentile(ann_ms, 95)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--probes', type=int, default=200)
+    parser.add_argument('--nprobe', type=int, default=8)
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    rows = []
+    for size in args.sizes:
+        row = run(size, args.probes, args.nprobe)
+        rows.append(row)
+        print(f"{size:>8} rows | lists={row['n_lists']:<5} build={row['index_build_s']:.2f}s | "
+              f"recall@1={row['recall_at_1']:.3f} | exact p50={row['exact_p50_ms']:.2f}ms "
+              f"p95={row['exact_p95_ms']:.2f}ms | ann p50={row['ann_p50_ms']:.2f}ms "
+              f"p95={row['ann_p95_ms']:.2f}ms")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
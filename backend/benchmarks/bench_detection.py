@@ -0,0 +1,111 @@
+"""Detection latency and recall at reduced decode/detection sizes.
+
+Usage (from backend/):
+    python -m benchmarks.bench_detection --images ../model-train/test_images
+    python -m benchmarks.bench_detection --images photos/ --sizes 0 640 1280 1600 --full-res
+
+Every image is first processed at native resolution; those boxes are the
+reference. For each ``--sizes`` entry (long side in pixels, 0 = native) the
+benchmark reports the median decode/detect/encode time, the fraction of
+reference faces found again (box IoU >= 0.5) and how far the encodings moved
+from the native ones. Needs ``face_recognition``.
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+from api.inference import detect_faces
+
+
+def iou(a, b):
+    """Intersection over union of two (top, right, bottom, left) boxes"""
+    top, bottom = max(a[0], b[0]), min(a[2], b[2])
+    left, right = max(a[3], b[3]), min(a[1], b[1])
+    inter = max(0, bottom - top) * max(0, right - left)
+    area = lambda box: (box[2] - box[0]) * (box[1] - box[3])  # noqa: E731
+    union = area(a) + area(b) - inter
+    return inter / union if union else 0.0
+
+
+def measure(data, max_dim, full_res, repeat):
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = detect_faces(data, max_dim, full_res)
+        runs.append((time.perf_counter() - start) * 1000)
+    return result, float(np.median(runs))
+
+
+def compare(reference, result):
+    """(faces recalled, mean encoding distance of recalled faces to the reference)"""
+    found = 0
+    drift = []
+    for box, encoding in zip(reference['locations'], reference['encodings']):
+        overlaps = [iou(box, other) for other in result['locations']]
+        if overlaps and max(overlaps) >= 0.5:
+            found += 1
+            drift.append(float(np.linalg.norm(encoding - result['encodings'][int(np.argmax(overlaps))])))
+    return found, drift
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', required=True, help='Directory of test images (e.g. ../model-train/test_images)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[0, 2400, 1600, 1280, 960, 640])
+    parser.add_argument('--full-res', action='store_true', help='Encode faces from full-resolution crops')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    images = [(path.name, path.read_bytes()) for path in sorted(Path(args.images).iterdir())
+              if path.suffix.lower() in ('.jpg', '.jpeg', '.png') and not path.stem.endswith('_output')]
+    references = {name: detect_faces(data) for name, data in images}
+    total_faces = sum(len(r['locations']) for r in references.values())
+    print(f"{len(images)} image(s), {total_faces} reference face(s) at native resolution")
+
+    rows = []
+    for max_dim in args.sizes:
+        per_image = []
+        for name, data in images:
+            result, elapsed = measure(data, max_dim, args.full_res, args.repeat)
+            found, drift = compare(references[name], result)
+            per_image.append({
+                'image': name,
+                'size': f"{result['width']}x{result['height']}",
+                'detect_size': f"{result['detect_size']['width']}x{result['detect_size']['height']}",
+                'total_ms': elapsed,
+                **result['stages'],
+                'reference_faces': len(references[name]['locations']),
+                'found_faces': found,
+                'extra_faces': len(result['locations']) - found,
+                'encoding_drift': drift,
+            })
+        found = sum(r['found_faces'] for r in per_image)
+        drift = [d for r in per_image for d in r['encoding_drift']]
+        row = {
+            'max_dim': max_dim,
+            'full_res_encodings': args.full_res,
+            'total_ms': sum(r['total_ms'] for r in per_image),
+            'recall': found / total_faces if total_faces else 1.0,
+            'mean_encoding_drift': float(np.mean(drift)) if drift else 0.0,
+            'images': per_image,
+        }
+        rows.append(row)
+        print(f"max_dim {max_dim or 'native':>6} | {row['total_ms']:8.1f}ms total | "
+              f"recall {row['recall']:.3f} | encoding drift {row['mean_encoding_drift']:.3f}")
+        for r in per_image:
+            print(f"    {r['image']:<12} {r['size']:>10} -> {r['detect_size']:>10} | {r['total_ms']:7.1f}ms "
+                  f"(decode {r['decode_ms']}, detect {r['detect_ms']}, encode {r['encode_ms']}) | "
+                  f"{r['found_faces']}/{r['reference_faces']} faces")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""/logs query latency on a large log table: OFFSET + COUNT(*) without indexes vs indexed keyset pages.
+
+Usage (from backend/):
+    python -m benchmarks.bench_logs --rows 2000000
+    python -m benchmarks.bench_logs --db /tmp/logs_bench.db --keep   # reuse the generated table
+
+Builds a synthetic table shaped like production (mostly /pi/results events),
+times the old queries on it, adds the indexes and times ``get_logs()`` for the
+same pages. ``cold`` runs clear the cached filter totals first.
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from api import logger
+
+EVENTS = [
+    ('/pi/results', 'pi_recognition', 0.70),
+    ('/recognize', 'recognition', 0.20),
+    ('/pi/status', 'pi_status_update', 0.05),
+    ('/enroll', 'enrollment', 0.03),
+    ('/recognize', 'error', 0.02),
+]
+
+
+def generate(path, rows, days=90, seed=0):
+    """Fill a logs table with ``rows`` events spread over the last ``days`` days"""
+    rng = random.Random(seed)
+    start = datetime.now() - timedelta(days=days)
+    step = timedelta(days=days) / rows
+    weights = [w for *_, w in EVENTS]
+    details = json.dumps({'faces': [{'name': 'Alice', 'confidence': 61.2,
+                                     'location': {'top': 10, 'right': 90, 'bottom': 90, 'left': 10}}]})
+
+    def events():
+        for i in range(rows):
+            endpoint, event_type, _ = rng.choices(EVENTS, weights)[0]
+            yield ((start + step * i).isoformat(), endpoint, event_type,
+                   0 if event_type == 'error' else 1, f'{event_type} {i}', details)
+
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('''CREATE TABLE logs (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT NOT NULL,
+                    endpoint TEXT, event_type TEXT, success INTEGER, message TEXT, details_json TEXT)''')
+    with conn:
+        conn.executemany('INSERT INTO logs (timestamp, endpoint, event_type, success, message, details_json) '
+                         'VALUES (?, ?, ?, ?, ?, ?)', events())
+    conn.close()
+
+
+def timed(fn, repeat):
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        runs.append((time.perf_counter() - start) * 1000)
+    return sorted(runs)[len(runs) // 2]
+
+
+def old_get_logs(conn, limit, offset, endpoint=None, since=None):
+    """The previous get_logs(): COUNT(*) plus LIMIT/OFFSET"""
+    query, params = "SELECT * FROM logs WHERE 1=1", []
+    if endpoint:
+        query += " AND endpoint = ?"
+        params.append(endpoint)
+    if since:
+        query += " AND timestamp >= ?"
+        params.append(since)
+    conn.execute(query.replace("SELECT *", "SELECT COUNT(*)", 1), params).fetchone()
+    return conn.execute(query + " ORDER BY id DESC LIMIT ? OFFSET ?", params + [limit, offset]).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--db', help='Database file (default: a temporary file)')
+    parser.add_argument('--keep', action='store_true', help='Keep the database file')
+    parser.add_argument('--depths', type=int, nargs='+', default=[0, 10000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), 'logs_bench.db')
+    if not os.path.exists(path):
+        print(f"Generating {args.rows} log rows in {path}...")
+        started = time.perf_counter()
+        generate(path, args.rows)
+        print(f"  done in {time.perf_counter() - started:.0f}s ({os.path.getsize(path) / 2**20:.0f}MB)")
+
+    logger.DB_FILE = path
+    old = sqlite3.connect(path)
+    for name in logger.LOG_INDEXES:
+        old.execute(f"DROP INDEX IF EXISTS {name}")
+    total = old.execute("SELECT COUNT(*) FROM logs").fetchone()[0]
+    recognize_total = old.execute("SELECT COUNT(*) FROM logs WHERE endpoint = ?", ('/recognize',)).fetchone()[0]
+    now = datetime.now()
+    last_hour = (now - timedelta(hours=1)).isoformat()
+    week_ago = (now - timedelta(days=7)).isoformat()
+    week_ago_hour = (now - timedelta(days=7) + timedelta(hours=1)).isoformat()
+
+    cases = [(f'page at depth {d}', {}, d) for d in args.depths if d < total]
+    cases += [(f'endpoint=/recognize, depth {d}', {'endpoint': '/recognize'}, d)
+              for d in (0, 100000) if d < recognize_total]
+    cases += [('last hour', {'since': last_hour}, 0)]
+
+    print(f"{total} rows, page size 50")
+    results = []
+    timings_old = {}
+    for label, filters, depth in cases:
+        timings_old[label] = timed(lambda: old_get_logs(old, 50, depth, filters.get('endpoint'), filters.get('since')),
+                                   args.repeat)
+    old.close()
+
+    started = time.perf_counter()
+    conn = logger._connect()
+    logger.create_schema(conn)
+    conn.close()
+    print(f"Built indexes in {time.perf_counter() - started:.1f}s")
+
+    cases.append(('one hour a week ago', {'since': week_ago, 'until': week_ago_hour}, 0))
+    for label, filters, depth in cases:
+        # The cursor a client would hold after paging down to `depth`
+        cursor = None
+        if depth:
+            where, params = logger._filters(filters.get('endpoint'), since=filters.get('since'))
+            cursor = logger._reader().execute(f"SELECT id FROM logs{where} ORDER BY id DESC LIMIT 1 OFFSET ?",
+                                              params + [depth - 1]).fetchone()[0]
+
+        def page():
+            result = logger.get_logs(50, before_id=cursor, **filters)
+            assert 'error' not in result, result['error']
+
+        def cold_page():
+            logger._count_cache.clear()
+            page()
+
+        row = {
+            'case': label,
+            'old_ms': timings_old.get(label),
+            'cold_ms': timed(cold_page, args.repeat),
+            'warm_ms': timed(page, args.repeat),
+        }
+        results.append(row)
+        old_text = f"{row['old_ms']:9.2f}ms" if row['old_ms'] is not None else f"{'-':>11}"
+        print(f"  {label:<34} old {old_text} | new cold {row['cold_ms']:8.2f}ms | warm {row['warm_ms']:6.2f}ms")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if not args.keep and not args.db:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""Speed and accuracy of prototype (two-stage) matching against exact matching.
+
+Usage (from backend/):
+    python -m benchmarks.bench_prototypes                      # synthetic galleries
+    python -m benchmarks.bench_prototypes --images ../model-train/test_images
+
+With ``--images`` the faces found in every image (``*_output`` renders are
+skipped) are matched against the real gallery in ``--gallery`` (the API's
+``.gal`` with its delta segments by default, or a legacy ``.pkl``); this
+needs ``face_recognition``.
+
+A batch refines the union of its probes' shortlists, so prototype mode only
+pays off once the gallery has many more people than that union: on 50-probe
+batches it is 0.8x at 10k rows / 50 people, 1.2x at 200 people and 3-13x
+at 100k rows, while single probes win at every size. The API falls back to
+exact matching below ``PROTOTYPE_MIN_PEOPLE`` (200) people.
+"""
+
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+from api import gallery_store
+from api.matcher import GalleryMatcher
+from benchmarks.synthetic import make_gallery, make_probes
+
+
+def compare(matcher, probes, refine_people, repeat=5):
+    """Time both modes on the same probes and report agreement"""
+    timings = {}
+    results = {}
+    for mode in ('exact', 'prototype'):
+        runs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            results[mode] = matcher.match(probes, mode=mode, refine_people=refine_people)
+            runs.append((time.perf_counter() - start) * 1000)
+        timings[mode] = float(np.median(runs))
+
+    agreement = np.mean([e['name'] == p['name'] for e, p in zip(results['exact'], results['prototype'])])
+    return timings, float(agreement), results
+
+
+def synthetic(sizes, faces_per_person, refine_people, n_probes):
+    rows = []
+    for size in sizes:
+        names, encodings, centres = make_gallery(size, faces_per_person=faces_per_person)
+        expected, probes = make_probes(centres, n_probes)
+        matcher = GalleryMatcher(names, encodings)
+
+        timings, agreement, results = compare(matcher, probes, refine_people)
+        row = {
+            'gallery_size': size,
+            'people': len(matcher.people),
+            'rows_per_person': size / len(matcher.people),
+            'probes': n_probes,
+            'exact_ms': timings['exact'],
+            'prototype_ms': timings['prototype'],
+            'speedup': timings['exact'] / timings['prototype'],
+            'agreement': agreement,
+            'exact_accuracy': float(np.mean([r['name'] == e for r, e in zip(results['exact'], expected)])),
+            'prototype_accuracy': float(np.mean([r['name'] == e for r, e in zip(results['prototype'], expected)])),
+        }
+        rows.append(row)
+        print(f"{size:>8} rows / {row['people']:>5} people | exact {row['exact_ms']:.2f}ms | "
+              f"prototype {row['prototype_ms']:.2f}ms ({row['speedup']:.1f}x) | agreement {agreement:.3f} | "
+              f"accuracy {row['exact_accuracy']:.3f} -> {row['prototype_accuracy']:.3f}")
+    return rows
+
+
+def test_images(image_dir, gallery_path, refine_people):
+    import face_recognition
+
+    people, person_ids, matrix = gallery_store.load_any(gallery_path)
+    matcher = GalleryMatcher.from_arrays(people, person_ids, matrix)
+    print(f"{gallery_path}: {len(matcher)} rows, {len(matcher.people)} people")
+
+    rows = []
+    for path in sorted(Path(image_dir).iterdir()):
+        if path.suffix.lower() not in ('.jpg', '.jpeg', '.png') or path.stem.endswith('_output'):
+            continue
+        image = face_recognition.load_image_file(path)
+        locations = face_recognition.face_locations(image, model="hog")
+        probes = face_recognition.face_encodings(image, locations)
+        if not probes:
+            continue
+
+        timings, agreement, results = compare(matcher, probes, refine_people)
+        rows.append({
+            'image': path.name,
+            'faces': len(probes),
+            'exact_ms': timings['exact'],
+            'prototype_ms': timings['prototype'],
+            'agreement': agreement,
+            'exact_names': [r['name'] for r in results['exact']],
+            'prototype_names': [r['name'] for r in results['prototype']],
+        })
+        print(f"{path.name:<12} {len(probes)} face(s) | exact {timings['exact']:.3f}ms | "
+              f"prototype {timings['prototype']:.3f}ms | agreement {agreement:.2f}")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--faces-per-person', type=int, default=200)
+    parser.add_argument('--refine-people', type=int, default=5)
+    parser.add_argument('--probes', type=int, default=50)
+    parser.add_argument('--images', help='Directory of test images (e.g. ../model-train/test_images)')
+    parser.add_argument('--gallery', default=os.environ.get(
+        'GALLERY_PATH', os.path.join(os.path.dirname(__file__), '..', 'encodings.gal')),
+        help='Gallery for --images: .gal (with its segments) or legacy .pkl')
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    if args.images:
+        rows = test_images(args.images, args.gallery, args.refine_people)
+    else:
+        rows = synthetic(args.sizes, args.faces_per_person, args.refine_people, args.probes)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
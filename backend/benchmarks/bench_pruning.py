@@ -0,0 +1,104 @@
+"""Gallery size, matching time and accuracy before and after pruning.
+
+Usage (from backend/):
+    python -m benchmarks.bench_pruning                          # synthetic enrollment bursts
+    python -m benchmarks.bench_pruning --gallery encodings.pkl  # real gallery, held-out encodings
+    python -m benchmarks.bench_pruning --min-distance 0.1 0.2 --max-per-person 0 10 20
+
+The synthetic gallery imitates app enrollments (bursts of near-identical
+frames per photo) and is probed with fresh photos of the same people plus
+strangers. With ``--gallery`` every ``--holdout``-th encoding of each person
+is held out as a probe and the rest is pruned and matched against.
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from api import gallery_store
+from api.matcher import GalleryMatcher
+from api.pruning import prune_gallery
+from benchmarks.synthetic import make_burst_gallery, make_probes
+
+
+def evaluate(names, encodings, probes, expected, repeat=5):
+    """(accuracy, median match time in ms) of a gallery on labelled probes"""
+    matcher = GalleryMatcher(names, encodings)
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = matcher.match(probes)
+        runs.append((time.perf_counter() - start) * 1000)
+    accuracy = float(np.mean([r['name'] == e for r, e in zip(results, expected)]))
+    return accuracy, float(np.median(runs))
+
+
+def report(names, encodings, probes, expected, settings):
+    base_accuracy, base_ms = evaluate(names, encodings, probes, expected)
+    print(f"{'unpruned':<22} {len(names):>7} rows | match {base_ms:7.2f}ms | accuracy {base_accuracy:.3f}")
+    rows = []
+    for min_distance, max_count in settings:
+        start = time.perf_counter()
+        keep, stats = prune_gallery(names, encodings, min_distance, max_count)
+        prune_ms = (time.perf_counter() - start) * 1000
+        accuracy, match_ms = evaluate([names[i] for i in keep], encodings[keep], probes, expected)
+        row = {
+            'min_distance': min_distance,
+            'max_per_person': max_count,
+            **stats,
+            'size_reduction': 1 - stats['encodings_after'] / max(1, stats['encodings_before']),
+            'prune_ms': prune_ms,
+            'match_ms_before': base_ms,
+            'match_ms_after': match_ms,
+            'accuracy_before': base_accuracy,
+            'accuracy_after': accuracy,
+        }
+        rows.append(row)
+        label = f"d>={min_distance:g} cap={max_count or '-'}"
+        print(f"{label:<22} {stats['encodings_after']:>7} rows ({row['size_reduction']:6.1%} smaller, "
+              f"pruned in {prune_ms:.0f}ms) | match {match_ms:7.2f}ms | accuracy {accuracy:.3f} "
+              f"({accuracy - base_accuracy:+.3f})")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--people', type=int, default=500)
+    parser.add_argument('--photos-per-person', type=int, default=5)
+    parser.add_argument('--frames-per-photo', type=int, default=8)
+    parser.add_argument('--probes', type=int, default=2000)
+    parser.add_argument('--gallery', help='Real gallery (.gal or .pkl) to evaluate with held-out encodings')
+    parser.add_argument('--holdout', type=int, default=5, help='Hold out every N-th encoding of a person')
+    parser.add_argument('--min-distance', type=float, nargs='+', default=[0.0, 0.1, 0.2])
+    parser.add_argument('--max-per-person', type=int, nargs='+', default=[0, 5, 10])
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    settings = [(d, k) for d in args.min_distance for k in args.max_per_person if d > 0 or k]
+    if args.gallery:
+        all_names, matrix = gallery_store.load_names_and_encodings(args.gallery)
+        all_names = np.asarray(all_names)
+        position = np.zeros(len(all_names), dtype=np.int64)
+        for person in np.unique(all_names):
+            rows = np.flatnonzero(all_names == person)
+            position[rows] = np.arange(len(rows))
+        held_out = (position % args.holdout == args.holdout - 1)
+        names, encodings = list(all_names[~held_out]), np.asarray(matrix[~held_out])
+        probes, expected = np.asarray(matrix[held_out]), list(all_names[held_out])
+        print(f"{args.gallery}: {len(names)} gallery rows, {len(probes)} held-out probes")
+    else:
+        names, encodings, centres = make_burst_gallery(args.people, args.photos_per_person, args.frames_per_photo)
+        expected, probes = make_probes(centres, args.probes)
+        print(f"Synthetic bursts: {args.people} people x {args.photos_per_person} photos x "
+              f"{args.frames_per_photo} frames, {len(probes)} probes")
+
+    rows = report(names, encodings, probes, expected, settings)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
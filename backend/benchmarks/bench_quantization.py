@@ -0,0 +1,115 @@
+"""Memory, matching throughput and top-1 agreement of float32/float16/int8 galleries.
+
+Usage (from backend/):
+    python -m benchmarks.bench_quantization --sizes 10000 100000 1000000
+    python -m benchmarks.bench_quantization --gallery encodings.pkl   # real gallery, held-out probes
+
+Every precision is compared against a float64 baseline (the legacy pickle's
+precision): ``agreement`` is the fraction of probes whose top-1 result
+(including ``Unknown``) is the same, ``max_distance_error`` the largest
+deviation of a best-match distance.
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from api import gallery_store
+from api.matcher import DEFAULT_TOLERANCE, ENCODING_DIM, GalleryMatcher
+from api.quantization import ITEM_SIZES, PRECISIONS
+from benchmarks.synthetic import make_gallery, make_probes
+
+
+def float64_baseline(matcher, encodings, probes, tolerance=DEFAULT_TOLERANCE, step=256):
+    """(names, distances) of the best match of every probe, computed in float64"""
+    gallery = np.asarray(encodings, dtype=np.float64)[matcher.source_order]
+    gallery_sq = np.einsum('ij,ij->i', gallery, gallery)
+    names, distances = [], []
+    for i in range(0, len(probes), step):
+        block = np.asarray(probes[i:i + step], dtype=np.float64)
+        d2 = np.einsum('ij,ij->i', block, block)[:, None] + gallery_sq[None, :] - 2 * (block @ gallery.T)
+        per_person = np.sqrt(np.maximum(np.minimum.reduceat(d2, matcher.run_starts, axis=1), 0))
+        best = np.argmin(per_person, axis=1)
+        for person, d in zip(best, per_person[np.arange(len(block)), best]):
+            names.append(matcher.people[person] if d <= tolerance else 'Unknown')
+            distances.append(d)
+    return names, np.array(distances)
+
+
+def measure(matcher, probes, repeat=3):
+    """Results, batch throughput (probes/s) and median single-probe latency (ms)"""
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = matcher.match(probes, mode='exact')
+        runs.append(time.perf_counter() - start)
+    latencies = []
+    for probe in probes[:100]:
+        start = time.perf_counter()
+        matcher.match([probe], mode='exact')
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, len(probes) / float(np.median(runs)), float(np.median(latencies))
+
+
+def run(label, names, encodings, probes):
+    base = GalleryMatcher(names, encodings)
+    expected, expected_distances = float64_baseline(base, encodings, probes)
+    float64_bytes = len(base) * ENCODING_DIM * ITEM_SIZES['float64']
+    print(f"{label}: {len(base)} rows, {len(base.people)} people, {len(probes)} probes, "
+          f"float64 {float64_bytes / 2**20:.1f}MB")
+
+    rows = []
+    for precision in PRECISIONS:
+        matcher = base.quantized(precision)
+        results, throughput, latency_ms = measure(matcher, probes)
+        agreement = float(np.mean([r['name'] == e for r, e in zip(results, expected)]))
+        # Best distances are reported even for Unknown results, so compare them all
+        distances = np.array([r['distance'] if r['distance'] is not None else np.nan for r in results])
+        row = {
+            'gallery': label,
+            'rows': len(matcher),
+            'precision': precision,
+            'matrix_bytes': matcher.nbytes,
+            'reduction_vs_float64': float64_bytes / max(1, matcher.nbytes),
+            'probes_per_s': throughput,
+            'single_probe_p50_ms': latency_ms,
+            'top1_agreement': agreement,
+            'max_distance_error': float(np.nanmax(np.abs(distances - expected_distances))),
+        }
+        rows.append(row)
+        print(f"  {precision:<8} {row['matrix_bytes'] / 2**20:8.1f}MB ({row['reduction_vs_float64']:.0f}x smaller) | "
+              f"{throughput:9.0f} probes/s | single probe {latency_ms:6.2f}ms | "
+              f"top-1 agreement {agreement:.4f} | max distance error {row['max_distance_error']:.4f}")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--probes', type=int, default=1000)
+    parser.add_argument('--gallery', help='Real gallery (.gal or .pkl); every --holdout-th encoding is a probe')
+    parser.add_argument('--holdout', type=int, default=5)
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    rows = []
+    if args.gallery:
+        all_names, matrix = gallery_store.load_names_and_encodings(args.gallery)
+        held_out = np.arange(len(all_names)) % args.holdout == args.holdout - 1
+        names = [n for n, h in zip(all_names, held_out) if not h]
+        rows += run(args.gallery, names, np.asarray(matrix[~held_out]), np.asarray(matrix[held_out]))
+    else:
+        for size in args.sizes:
+            names, encodings, centres = make_gallery(size)
+            _, probes = make_probes(centres, args.probes)
+            rows += run(f"synthetic {size}", names, encodings, probes)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""Cold start of the API under gunicorn: time to first request and memory per worker.
+
+Usage (from backend/):
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --modes preload no-preload --workers 2 --runs 5 --json startup.json
+
+Each run starts gunicorn (with gunicorn.conf.py, like the Docker image) on
+temporary gallery, log, job, metrics and profile files and measures:
+
+- ``health_s``: launch until the first ``GET /health`` answers 200
+- ``first_recognize_s``: launch until the first ``POST /recognize`` of
+  ``--image`` is answered (clients retry while nothing listens yet)
+
+Then it sends ``--requests`` recognitions so every worker has served traffic
+and reads RSS, PSS (shared pages split between the processes sharing them)
+and USS (private pages) of the master, of every worker and of every worker's
+inference processes from /proc. The total PSS is what the whole service
+costs in RAM. ``--modes`` picks ``GUNICORN_PRELOAD`` for each variant; an
+untimed first start converts ``encodings.pkl`` and warms the page cache.
+Linux only.
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+DEFAULT_IMAGE = BACKEND_DIR.parent / 'model-train' / 'test_images' / 'test1.jpg'
+MODES = {'preload': 'true', 'no-preload': 'false'}
+START_TIMEOUT = 180
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def recognize_request(url, image):
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="{image.name}"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n').encode() + image.read_bytes() + f'\r\n--{boundary}--\r\n'.encode()
+    return urllib.request.Request(f'{url}/recognize', data=body,
+                                  headers={'Content-Type': f'multipart/form-data; boundary={boundary}'})
+
+
+def wait_for(make_request, started, deadline):
+    """Seconds from ``started`` until a request answers 200 (retrying while the port is closed)"""
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(make_request(), timeout=START_TIMEOUT) as response:
+                if response.status == 200:
+                    return time.perf_counter() - started
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.02)
+    raise TimeoutError('server did not answer in time')
+
+
+def memory(pid):
+    """RSS, PSS and USS of a process in MB"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                values[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return {
+        'rss_mb': round(values.get('Rss', 0), 1),
+        'pss_mb': round(values.get('Pss', 0), 1),
+        'uss_mb': round(values.get('Private_Clean', 0) + values.get('Private_Dirty', 0), 1),
+    }
+
+
+def children(pid):
+    """Direct children of a process"""
+    found = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # The command name may contain spaces; ppid follows the closing parenthesis
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            found.append(int(entry))
+    return found
+
+
+def descendants(pid):
+    found = []
+    for child in children(pid):
+        found.append(child)
+        found.extend(descendants(child))
+    return found
+
+
+def process_tree(master):
+    """Memory of the master, of each worker and of each worker's inference processes"""
+    workers = []
+    for worker in children(master):
+        pool = [memory(p) for p in descendants(worker)]
+        workers.append({
+            **memory(worker),
+            'pool_processes': len(pool),
+            'pool_pss_mb': round(sum(p['pss_mb'] for p in pool), 1),
+            'pool_rss_mb': round(sum(p['rss_mb'] for p in pool), 1),
+        })
+    master_memory = memory(master)
+    total_pss = master_memory['pss_mb'] + sum(w['pss_mb'] + w['pool_pss_mb'] for w in workers)
+    return {'master': master_memory, 'workers': workers, 'total_pss_mb': round(total_pss, 1)}
+
+
+def start_server(workdir, mode, args, port):
+    env = dict(os.environ)
+    env.update({
+        'GUNICORN_PRELOAD': MODES[mode],
+        'GALLERY_PATH': str(workdir / 'encodings.gal'),
+        'GALLERY_VERSION_PATH': str(workdir / 'gallery.ver'),
+        'TRAIN_JOBS_PATH': str(workdir / 'training_jobs'),
+        'METRICS_DIR': str(workdir / 'metrics'),
+        'PROFILE_DIR': str(workdir / 'profiles'),
+        'LOG_DB_FILE': str(workdir / 'logs.db'),
+        'LOG_BACKUP_DIR': str(workdir / 'backups'),
+    })
+    command = [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}',
+               '--workers', str(args.workers), '--threads', str(args.threads),
+               '--timeout', '120', '--worker-tmp-dir', '/dev/shm', 'api.app:app']
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def stop_server(server):
+    server.send_signal(signal.SIGTERM)
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+def run_once(workdir, mode, args, measure_memory=True):
+    port = free_port()
+    url = f'http://127.0.0.1:{port}'
+    server = start_server(workdir, mode, args, port)
+    started = time.perf_counter()
+    deadline = time.time() + START_TIMEOUT
+    try:
+        result = {}
+        health = threading.Thread(target=lambda: result.update(
+            health_s=wait_for(lambda: urllib.request.Request(f'{url}/health'), started, deadline)))
+        health.start()
+        result['first_recognize_s'] = wait_for(lambda: recognize_request(url, args.image), started, deadline)
+        health.join()
+        if measure_memory:
+            # Spread requests over the workers so all of them have served traffic
+            with ThreadPoolExecutor(args.threads * args.workers) as pool:
+                list(pool.map(lambda _: wait_for(lambda: recognize_request(url, args.image), started, deadline),
+                              range(args.requests)))
+            time.sleep(1)
+            result['memory'] = process_tree(server.pid)
+        return result
+    finally:
+        stop_server(server)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--requests', type=int, default=16, help='recognitions sent before memory is read')
+    parser.add_argument('--image', type=Path, default=DEFAULT_IMAGE)
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        run_once(workdir, args.modes[0], args, measure_memory=False)
+        for mode in args.modes:
+            runs = [run_once(workdir, mode, args, measure_memory=(i == args.runs - 1)) for i in range(args.runs)]
+            mem = runs[-1]['memory']
+            report[mode] = {
+                'health_s': round(statistics.median(r['health_s'] for r in runs), 2),
+                'first_recognize_s': round(statistics.median(r['first_recognize_s'] for r in runs), 2),
+                'runs': runs,
+            }
+            workers = mem['workers']
+            print(f"{mode:>10}: /health after {report[mode]['health_s']:.2f}s, first /recognize after "
+                  f"{report[mode]['first_recognize_s']:.2f}s (median of {args.runs})")
+            print(f"{'':>10}  master RSS {mem['master']['rss_mb']:.0f}MB PSS {mem['master']['pss_mb']:.0f}MB")
+            for i, w in enumerate(workers):
+                print(f"{'':>10}  worker {i} RSS {w['rss_mb']:.0f}MB PSS {w['pss_mb']:.0f}MB USS {w['uss_mb']:.0f}MB"
+                      f" | {w['pool_processes']} inference process(es) RSS {w['pool_rss_mb']:.0f}MB"
+                      f" PSS {w['pool_pss_mb']:.0f}MB")
+            print(f"{'':>10}  total PSS {mem['total_pss_mb']:.0f}MB")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,319 @@
+"""Benchmark suite for the recognition hot paths, with baseline comparison.
+
+Usage (from backend/):
+    python -m benchmarks.suite --json results.json
+    python -m benchmarks.suite --quick --only match log        # a subset, smaller galleries
+    python -m benchmarks.suite --json new.json --compare baseline.json
+    python -m benchmarks.suite --results new.json --compare baseline.json   # compare without running
+
+Cases, all on fixed inputs (the photos in ../model-train/test_images and
+seeded synthetic galleries), CPU only and offline:
+
+- ``decode``, ``detect``, ``encode``: the stages of ``detect_faces`` per test
+  image, at DETECT_MAX_DIM like the API
+- ``match/<rows>/single`` and ``match/<rows>/batch``: exact matching of one
+  probe / a batch of probes against synthetic galleries of 100 to 1M rows
+- ``match/<rows>/single/float16`` and ``.../int8``: the single probe against
+  the same gallery stored in a compact ``GALLERY_PRECISION``
+- ``log/enqueue`` and ``log/write``: ``log_event()`` latency and the writer's
+  throughput into a temporary database
+- ``recognize``: a full ``POST /recognize`` through the Flask test client,
+  with the app on temporary gallery, log and job files
+
+Every case runs for at least ``--min-time`` seconds and ``--min-runs`` runs.
+It reports p50/p90/p99/mean/min/max latency and throughput. ``--compare``
+flags cases whose p50 latency or throughput got worse than the baseline by
+more than ``--threshold``, and exits with status 1 if there are any.
+"""
+
+import argparse
+import io
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.synthetic import make_gallery, make_probes
+
+REPO_DIR = Path(__file__).resolve().parents[2]
+DEFAULT_IMAGES = REPO_DIR / 'model-train' / 'test_images'
+DEFAULT_SIZES = [100, 1000, 10000, 100000, 1000000]
+QUICK_SIZES = [100, 1000, 10000, 100000]
+MATCH_BATCH = 32
+# Detection size used by the API (api.app reads the same variable)
+DETECT_MAX_DIM = int(os.environ.get('DETECT_MAX_DIM', 1600))
+
+# Latency differences below this are noise on any machine, whatever the ratio
+MIN_DELTA_MS = 0.05
+
+
+def run_case(fn, min_time, min_runs, max_runs=10000):
+    """Seconds per call of ``fn`` (after one warm-up call)"""
+    fn()
+    runs = []
+    deadline = time.perf_counter() + min_time
+    while len(runs) < max_runs and (len(runs) < min_runs or time.perf_counter() < deadline):
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+    return runs
+
+
+def summarize(name, runs, items=1, unit='calls', **params):
+    """Percentile latencies (ms) and throughput (``unit`` per second) of a case"""
+    ms = np.array(runs) * 1000
+    result = {
+        'case': name,
+        'runs': len(runs),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p90_ms': float(np.percentile(ms, 90)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'mean_ms': float(ms.mean()),
+        'min_ms': float(ms.min()),
+        'max_ms': float(ms.max()),
+        'throughput': items * len(runs) / float(np.sum(runs)),
+        'throughput_unit': f'{unit}/s',
+        'params': params,
+    }
+    print(f"  {name:<28} p50 {result['p50_ms']:9.3f}ms | p90 {result['p90_ms']:9.3f}ms | "
+          f"p99 {result['p99_ms']:9.3f}ms | {result['throughput']:10.1f} {result['throughput_unit']} "
+          f"({result['runs']} runs)")
+    return result
+
+
+def load_images(directory):
+    return [(path.name, path.read_bytes()) for path in sorted(Path(directory).iterdir())
+            if path.suffix.lower() in ('.jpg', '.jpeg', '.png') and not path.stem.endswith('_output')]
+
+
+def bench_pipeline(images, args):
+    """decode / detect / encode per test image, as detect_faces() runs them"""
+    import face_recognition
+    from api.inference import decode_image
+
+    results = []
+    for name, data in images:
+        image, size = decode_image(data, DETECT_MAX_DIM)
+        array = np.array(image)
+        locations = face_recognition.face_locations(array, model='hog')
+        params = {'image': name, 'size': f'{size[0]}x{size[1]}',
+                  'detect_size': f'{image.width}x{image.height}', 'faces': len(locations)}
+        results.append(summarize(f'decode/{name}', run_case(lambda: np.array(decode_image(data, DETECT_MAX_DIM)[0]),
+                                                            args.min_time, args.min_runs),
+                                 unit='images', **params))
+        results.append(summarize(f'detect/{name}', run_case(lambda: face_recognition.face_locations(array, model='hog'),
+                                                            args.min_time, args.min_runs),
+                                 unit='images', **params))
+        results.append(summarize(f'encode/{name}', run_case(lambda: face_recognition.face_encodings(array, locations),
+                                                            args.min_time, args.min_runs),
+                                 items=max(1, len(locations)), unit='faces', **params))
+    return results
+
+
+def bench_match(sizes, args):
+    """Exact matching against seeded synthetic galleries"""
+    results = []
+    for size in sizes:
+        # One gallery at a time: it is freed when _bench_match_size() returns
+        results.extend(_bench_match_size(size, args))
+    return results
+
+
+def _bench_match_size(size, args):
+    from api.matcher import GalleryMatcher
+
+    names, encodings, centres = make_gallery(size)
+    matcher = GalleryMatcher(names, encodings)
+    del names, encodings
+    _, probes = make_probes(centres, 256)
+    single = itertools.cycle(range(len(probes)))
+    results = [
+        summarize(f'match/{size}/single',
+                  run_case(lambda: matcher.match([probes[next(single)]], mode='exact'),
+                           args.min_time, args.min_runs),
+                  unit='probes', rows=size, people=len(matcher.people)),
+        summarize(f'match/{size}/batch',
+                  run_case(lambda: matcher.match(probes[:MATCH_BATCH], mode='exact'),
+                           args.min_time, args.min_runs),
+                  items=MATCH_BATCH, unit='probes', rows=size, people=len(matcher.people),
+                  batch=MATCH_BATCH),
+    ]
+    # Compact storage trades conversion work per query for memory (see quantization.PRECISIONS)
+    for precision in ('float16', 'int8'):
+        quantized = matcher.quantized(precision)
+        results.append(summarize(f'match/{size}/single/{precision}',
+                                 run_case(lambda: quantized.match([probes[next(single)]], mode='exact'),
+                                          args.min_time, args.min_runs),
+                                 unit='probes', rows=size, people=len(matcher.people), precision=precision))
+    return results
+
+
+def bench_log(workdir, args):
+    """log_event() latency, and how fast the writer thread drains batches into SQLite"""
+    from api import logger
+
+    logger.DB_FILE = os.path.join(workdir, 'bench_logs.db')
+    logger.init_db()
+    details = {'faces': [{'name': 'person_1', 'confidence': 61.2,
+                          'location': {'top': 10, 'right': 90, 'bottom': 90, 'left': 10}}],
+               'total_faces': 1, 'timing': {'queue_depth': 1, 'wait_ms': 0.1, 'service_ms': 250.0}}
+    sightings = logger.sightings_of(details['faces'], 'bench', 'id')
+
+    def enqueue():
+        logger.log_event('/recognize', 'recognition', True, 'Recognized 1 face(s)', details, sightings=sightings)
+
+    batch = 1000
+
+    def write():
+        for _ in range(batch):
+            enqueue()
+        logger.flush(timeout=60)
+
+    results = [summarize('log/enqueue', run_case(enqueue, args.min_time, args.min_runs, max_runs=5000),
+                         unit='events')]
+    logger.flush(timeout=60)
+    results.append(summarize('log/write', run_case(write, args.min_time, args.min_runs),
+                             items=batch, unit='events', batch=batch))
+    logger.shutdown()
+    return results
+
+
+def bench_recognize(images, workdir, args):
+    """Full POST /recognize through the Flask test client"""
+    # The app converts encodings.pkl into a gallery of its own and keeps all state in workdir
+    os.environ['GALLERY_PATH'] = os.path.join(workdir, 'encodings.gal')
+    os.environ['GALLERY_VERSION_PATH'] = os.path.join(workdir, 'gallery.ver')
+    os.environ['TRAIN_JOBS_PATH'] = os.path.join(workdir, 'training_jobs')
+    os.environ['METRICS_DIR'] = os.path.join(workdir, 'metrics')
+    os.environ['PROFILE_DIR'] = os.path.join(workdir, 'profiles')
+    from api import logger
+    logger.DB_FILE = os.path.join(workdir, 'bench_app_logs.db')
+    logger.BACKUP_DIR = os.path.join(workdir, 'backups')
+    from api import app as app_module
+
+    client = app_module.app.test_client()
+    results = []
+    for name, data in images:
+        def recognize():
+            response = client.post('/recognize', data={'image': (io.BytesIO(data), name)},
+                                   content_type='multipart/form-data')
+            assert response.status_code == 200, response.get_json()
+
+        results.append(summarize(f'recognize/{name}', run_case(recognize, args.min_time, args.min_runs),
+                                 unit='requests', image=name,
+                                 gallery_rows=app_module.current_gallery().live_rows))
+    app_module.inference.shutdown()
+    return results
+
+
+def environment():
+    """Where the results come from; comparisons across machines are only rough"""
+    cpu = platform.processor()
+    try:
+        with open('/proc/cpuinfo') as f:
+            cpu = next((line.split(':', 1)[1].strip() for line in f if line.startswith('model name')), cpu)
+    except OSError:
+        pass
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=REPO_DIR, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'time': datetime.now().isoformat(),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu': cpu,
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print case-by-case changes against a baseline; returns the regressed cases"""
+    previous = {r['case']: r for r in baseline['results']}
+    regressions = []
+    print(f"\nAgainst baseline from {baseline['environment'].get('time')} "
+          f"(commit {baseline['environment'].get('commit')}), threshold {threshold:.0%}:")
+    for result in results:
+        before = previous.pop(result['case'], None)
+        if before is None:
+            print(f"  {result['case']:<28} new")
+            continue
+        latency = result['p50_ms'] / before['p50_ms'] if before['p50_ms'] else 1.0
+        throughput = result['throughput'] / before['throughput'] if before['throughput'] else 1.0
+        slower = latency > 1 + threshold and result['p50_ms'] - before['p50_ms'] > MIN_DELTA_MS
+        if slower or throughput < 1 / (1 + threshold):
+            verdict = 'REGRESSION'
+            regressions.append(result['case'])
+        elif latency < 1 / (1 + threshold):
+            verdict = 'faster'
+        else:
+            verdict = ''
+        print(f"  {result['case']:<28} p50 {before['p50_ms']:9.3f} -> {result['p50_ms']:9.3f}ms ({latency:5.2f}x) | "
+              f"throughput {throughput:5.2f}x  {verdict}")
+    for case in previous:
+        print(f"  {case:<28} missing from this run")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', default=str(DEFAULT_IMAGES), help='Directory of fixed test images')
+    parser.add_argument('--sizes', type=int, nargs='+', help=f'Gallery sizes (default: {DEFAULT_SIZES})')
+    parser.add_argument('--only', nargs='+', choices=['pipeline', 'match', 'log', 'recognize'],
+                        help='Run only these groups')
+    parser.add_argument('--quick', action='store_true', help='Galleries up to 100k rows, shorter runs')
+    parser.add_argument('--min-time', type=float, help='Seconds per case (default 2, 0.5 with --quick)')
+    parser.add_argument('--min-runs', type=int, default=5)
+    parser.add_argument('--json', help='Write the results to this file')
+    parser.add_argument('--results', help='Compare this results file instead of running the suite')
+    parser.add_argument('--compare', help='Baseline results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help='Relative slowdown flagged as a regression (default 0.15)')
+    args = parser.parse_args()
+    if args.min_time is None:
+        args.min_time = 0.5 if args.quick else 2.0
+
+    if args.results:
+        with open(args.results) as f:
+            report = json.load(f)
+    else:
+        groups = args.only or ['pipeline', 'match', 'log', 'recognize']
+        images = load_images(args.images)
+        report = {'environment': environment(), 'results': []}
+        print(f"{report['environment']['cpu']} ({report['environment']['cpu_count']} CPUs), "
+              f"commit {report['environment']['commit']}")
+        with tempfile.TemporaryDirectory() as workdir:
+            if 'pipeline' in groups:
+                report['results'] += bench_pipeline(images, args)
+            if 'match' in groups:
+                report['results'] += bench_match(args.sizes or (QUICK_SIZES if args.quick else DEFAULT_SIZES), args)
+            if 'log' in groups:
+                report['results'] += bench_log(workdir, args)
+            if 'recognize' in groups:
+                report['results'] += bench_recognize(images, workdir, args)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report['results'], baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Synthetic face-encoding galleries for benchmarks"""
+
+import numpy as np
+
+from api.matcher import ENCODING_DIM
+
+# Spreads chosen so that distances look like dlib's: ~0.9 between different
+# people and ~0.3-0.4 between two photos of the same person. Real encodings
+# also share a common offset, which gives them a norm of ~1.45.
+OFFSET_SPREAD = 0.12
+PERSON_SPREAD = 0.056
+PHOTO_SPREAD = 0.027
+
+
+def _offset():
+    return np.random.default_rng(1234).normal(0, OFFSET_SPREAD, ENCODING_DIM).astype(np.float32)
+
+
+def make_gallery(size, faces_per_person=10, seed=0):
+    """Return (names, encodings, centres) for a gallery of ``size`` rows"""
+    rng = np.random.default_rng(seed)
+    n_people = max(1, size // faces_per_person)
+    centres = _offset() + rng.normal(0, PERSON_SPREAD, (n_people, ENCODING_DIM)).astype(np.float32)
+    person = rng.integers(0, n_people, size)
+    encodings = centres[person] + rng.normal(0, PHOTO_SPREAD, (size, ENCODING_DIM)).astype(np.float32)
+    names = [f"person_{i}" for i in person]
+    return names, encodings, centres
+
+
+def make_probes(centres, count, unknown_fraction=0.1, seed=1):
+    """Return (expected_names, probes); a fraction of probes are strangers"""
+    rng = np.random.default_rng(seed)
+    person = rng.integers(0, len(centres), count)
+    probes = centres[person] + rng.normal(0, PHOTO_SPREAD, (count, ENCODING_DIM)).astype(np.float32)
+    expected = [f"person_{i}" for i in person]
+
+    strangers = rng.random(count) < unknown_fraction
+    probes[strangers] = _offset() + rng.normal(0, PERSON_SPREAD, (int(strangers.sum()), ENCODING_DIM))
+    for i in np.flatnonzero(strangers):
+        expected[i] = 'Unknown'
+    return expected, probes
+
+
+def make_burst_gallery(n_people, photos_per_person=5, frames_per_photo=8, frame_spread=0.004, seed=0):
+    """Gallery shaped like app enrollments: every photo is a burst of near-identical frames.
+
+    Returns (names, encodings, centres).
+    """
+    rng = np.random.default_rng(seed)
+    centres = _offset() + rng.normal(0, PERSON_SPREAD, (n_people, ENCODING_DIM)).astype(np.float32)
+    photos = np.repeat(centres, photos_per_person, axis=0)
+    photos += rng.normal(0, PHOTO_SPREAD, photos.shape).astype(np.float32)
+    encodings = np.repeat(photos, frames_per_photo, axis=0)
+    encodings += rng.normal(0, frame_spread, encodings.shape).astype(np.float32)
+    names = [f"person_{i}" for i in range(n_people) for _ in range(photos_per_person * frames_per_photo)]
+    return names, encodings, centres
@@ -59,7 +59,7 @@ Type=simple
 User=$USER
 WorkingDirectory=$WORK_DIR
 Environment="PATH=$WORK_DIR/venv/bin"
-ExecStart=$WORK_DIR/venv/bin/gunicorn --bind 0.0.0.0:8080 --workers 2 --timeout 120 api.app:app
+ExecStart=$WORK_DIR/venv/bin/gunicorn -c gunicorn.conf.py --bind 0.0.0.0:8080 api.app:app
 Restart=always
 RestartSec=10
 
@@ -0,0 +1,45 @@
+"""Gunicorn settings for the API.
+
+gunicorn reads this file from backend/ by default; command-line flags override it.
+
+The app is imported once, in the master (``preload_app``). Workers are forked
+from it and share its modules, the mapped gallery and the checked log schema
+copy-on-write, so they start in milliseconds. The dlib models are not shared
+from the master: every detection (``/enroll`` included) runs in the worker's
+inference pool, whose processes fork from a per-worker fork server that loads
+the models once. Before a worker accepts its first connection,
+``post_worker_init`` starts that pool and runs a warm-up detection, so a
+request (or the Docker HEALTHCHECK) never lands on a cold worker.
+
+With ``preload_app``, a HUP reload re-forks the workers but does not re-import
+changed code; restart the master to deploy. Set GUNICORN_PRELOAD=false to import
+the app in every worker instead.
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8080)}"
+workers = int(os.environ.get('GUNICORN_WORKERS', 2))
+
+# Requests one worker's inference pool admits at once (InferenceExecutor.capacity in api/app.py)
+inference_capacity = (max(1, int(os.environ.get('INFERENCE_WORKERS', 1)))
+                      + int(os.environ.get('INFERENCE_QUEUE_SIZE', 4)))
+# Threads only wait on the inference pool. There must be more of them than the pool admits,
+# or the pool never fills up and answers 503: excess requests would wait unseen in
+# gunicorn's backlog instead. The spare threads also keep /health and /logs responsive.
+spare_threads = int(os.environ.get('GUNICORN_SPARE_THREADS', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', inference_capacity + spare_threads))
+if threads <= inference_capacity:
+    print(f"⚠️ GUNICORN_THREADS={threads} does not exceed the inference capacity ({inference_capacity}): "
+          f"busy workers queue requests instead of answering 503")
+timeout = 120
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() in ('1', 'true', 'yes')
+
+
+def post_worker_init(worker):
+    """Warm the worker up before it accepts connections"""
+    from api import app as api_app
+    api_app.warm_up()
@@ -0,0 +1,65 @@
+"""/recognize answers 503 under a burst, with the shipped gunicorn and inference settings.
+
+Run from backend/: python -m pytest -q tests
+"""
+
+import io
+import runpy
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+# Large enough that its detection outlasts the burst
+TEST_IMAGE = BACKEND_DIR.parent / 'model-train' / 'test_images' / 'test0.jpg'
+
+
+@pytest.fixture(scope='module')
+def api_app(tmp_path_factory):
+    workdir = tmp_path_factory.mktemp('api')
+    with pytest.MonkeyPatch.context() as env:
+        for name, value in {
+            'GALLERY_PATH': workdir / 'encodings.gal',
+            'GALLERY_VERSION_PATH': workdir / 'gallery.ver',
+            'TRAIN_JOBS_PATH': workdir / 'training_jobs',
+            'METRICS_DIR': workdir / 'metrics',
+            'PROFILE_DIR': workdir / 'profiles',
+            'LOG_DB_FILE': workdir / 'logs.db',
+            'LOG_BACKUP_DIR': workdir / 'backups',
+        }.items():
+            env.setenv(name, str(value))
+        from api import app as api_app
+        api_app.warm_up()
+        yield api_app
+        api_app.inference.shutdown()
+
+
+def test_gunicorn_threads_exceed_inference_capacity(api_app):
+    config = runpy.run_path(str(BACKEND_DIR / 'gunicorn.conf.py'))
+    assert config['inference_capacity'] == api_app.inference.capacity
+    assert config['threads'] > api_app.inference.capacity
+
+
+def test_burst_beyond_capacity_gets_503(api_app):
+    # As many simultaneous requests as one gunicorn worker has threads
+    threads = runpy.run_path(str(BACKEND_DIR / 'gunicorn.conf.py'))['threads']
+    image = TEST_IMAGE.read_bytes()
+    start = threading.Barrier(threads)
+
+    def recognize(_):
+        client = api_app.app.test_client()
+        start.wait()
+        return client.post('/recognize', data={'image': (io.BytesIO(image), TEST_IMAGE.name)})
+
+    with ThreadPoolExecutor(threads) as pool:
+        responses = list(pool.map(recognize, range(threads)))
+
+    statuses = sorted(r.status_code for r in responses)
+    assert set(statuses) <= {200, 503}
+    assert statuses.count(503) >= threads - api_app.inference.capacity
+    for response in responses:
+        if response.status_code == 503:
+            assert int(response.headers['Retry-After']) >= 1
+    assert api_app.inference.depth == 0
@@ -0,0 +1,131 @@
+""".gal base files, delta segments with tombstones, and compaction.
+
+Run from backend/: python -m pytest -q tests
+"""
+
+import numpy as np
+import pytest
+
+from api import gallery_store
+
+
+def _rows(n, seed=0):
+    return np.random.default_rng(seed).normal(scale=0.3, size=(n, 128)).astype(np.float32)
+
+
+def _as_dict(names, encodings):
+    """{person: sorted rows}, to compare galleries regardless of row order"""
+    out = {}
+    for name, row in zip(names, np.asarray(encodings, dtype=np.float32)):
+        out.setdefault(name, []).append(tuple(row))
+    return {name: sorted(rows) for name, rows in out.items()}
+
+
+@pytest.fixture
+def gallery(tmp_path):
+    """Base with alice and bob, then a segment adding carol and one retraining bob"""
+    path = str(tmp_path / 'encodings.gal')
+    base = _rows(5)
+    gallery_store.save_names_and_encodings(path, ['bob', 'alice', 'bob', 'alice', 'alice'], base, generation=1)
+    carol, bob = _rows(2, seed=1), _rows(1, seed=2)
+    gallery_store.append_names_and_encodings(path, ['carol', 'carol'], carol, generation=2)
+    gallery_store.append_names_and_encodings(path, ['bob'], bob, generation=3, deleted=['bob'])
+    expected = _as_dict(['alice'] * 3 + ['carol'] * 2 + ['bob'], np.vstack([base[[1, 3, 4]], carol, bob]))
+    return path, expected
+
+
+def test_base_round_trip_is_mapped_and_grouped(tmp_path):
+    path = str(tmp_path / 'encodings.gal')
+    names, encodings = ['bob', 'alice', 'bob'], _rows(3)
+    gallery_store.save_names_and_encodings(path, names, encodings, generation=4)
+
+    people, person_ids, matrix, header = gallery_store.load_gallery(path)
+    assert isinstance(matrix, np.memmap)
+    assert people == ['alice', 'bob']
+    assert list(person_ids) == [0, 1, 1]
+    assert header['generation'] == 4 and header['version'] == 1
+    assert _as_dict([people[i] for i in person_ids], matrix) == _as_dict(names, encodings)
+    assert matrix.ctypes.data % gallery_store.ALIGNMENT == 0
+
+
+def test_segments_merge_with_tombstones(gallery):
+    path, expected = gallery
+    people, person_ids, matrix, info = gallery_store.load_segmented(path)
+    assert _as_dict([people[i] for i in person_ids], matrix) == expected
+    assert info['generation'] == 3
+    assert info['segments'] == 2 and info['segment_rows'] == 3
+    assert info['deleted'] == ['bob']
+    assert gallery_store.latest_generation(path) == 3
+
+
+def test_layers_keep_the_base_mapped(gallery):
+    path, expected = gallery
+    (people, person_ids, matrix), (delta_people, delta_ids, delta), info = gallery_store.load_layers(path)
+    assert isinstance(matrix, np.memmap)
+    assert len(matrix) == 5  # tombstoned rows stay in the base, hidden by info['deleted']
+    assert delta_people == ['bob', 'carol']
+    assert sorted(delta_people[i] for i in delta_ids) == ['bob', 'carol', 'carol']
+
+
+def test_tombstone_drops_rows_of_earlier_segments(tmp_path):
+    path = str(tmp_path / 'encodings.gal')
+    gallery_store.append_names_and_encodings(path, ['dave', 'erin'], _rows(2), generation=1)
+    gallery_store.append_names_and_encodings(path, [], np.zeros((0, 128)), generation=2, deleted=['dave'])
+    people, person_ids, _, info = gallery_store.load_segmented(path)
+    assert people == ['erin'] and list(person_ids) == [0]
+    assert info['generation'] == 2
+
+
+def test_compact_folds_segments_into_the_base(gallery):
+    path, expected = gallery
+    assert gallery_store.compact(path) == 2
+    assert gallery_store.segment_paths(path) == []
+    assert gallery_store.base_generation(path) == 3
+
+    people, person_ids, matrix, info = gallery_store.load_segmented(path)
+    assert info['segments'] == 0 and isinstance(matrix, np.memmap)
+    assert _as_dict([people[i] for i in person_ids], matrix) == expected
+    assert gallery_store.compact(path) == 0
+
+
+def test_compact_converts_precision(gallery):
+    path, expected = gallery
+    gallery_store.compact(path, precision='int8')
+    assert gallery_store.base_precision(path) == 'int8'
+    people, person_ids, matrix, info = gallery_store.load_segmented(path)
+    restored = gallery_store.dequantize(matrix, info['scales'])
+    for name, rows in _as_dict([people[i] for i in person_ids], restored).items():
+        np.testing.assert_allclose(rows, expected[name], atol=0.01)
+
+    # Later segments are stored as float32 and converted on load
+    gallery_store.append_names_and_encodings(path, ['frank'], _rows(1, seed=3), generation=4)
+    _, (delta_people, _, delta), info = gallery_store.load_layers(path)
+    assert delta_people == ['frank'] and delta.dtype == np.int8
+
+
+def test_compact_carries_the_index_over(gallery):
+    path, _ = gallery
+    centroids = _rows(3, seed=4)
+    gallery_store.compact(path, centroids=centroids)
+    assert gallery_store.base_indexed(path)
+    people, person_ids, matrix, header = gallery_store.load_gallery(path)
+    stored_centroids, assignments = gallery_store.load_index(path, header)
+    np.testing.assert_array_equal(stored_centroids, centroids)
+    np.testing.assert_array_equal(assignments, gallery_store.nearest_centroids(np.asarray(matrix), centroids))
+
+    # Rows of a new segment join their nearest list; the trained centroids stay
+    gallery_store.append_names_and_encodings(path, ['gina', 'gina'], _rows(2, seed=5), generation=4, deleted=['alice'])
+    gallery_store.compact(path)
+    people, person_ids, matrix, header = gallery_store.load_gallery(path)
+    stored_centroids, assignments = gallery_store.load_index(path, header)
+    assert 'alice' not in people and len(assignments) == len(matrix) == 5
+    np.testing.assert_array_equal(stored_centroids, centroids)
+    np.testing.assert_array_equal(assignments, gallery_store.nearest_centroids(np.asarray(matrix), centroids))
+
+
+def test_reading_a_newer_format_fails_cleanly(tmp_path):
+    path = str(tmp_path / 'encodings.gal')
+    with open(path, 'wb') as f:
+        f.write(gallery_store._PREAMBLE.pack(gallery_store.MAGIC, gallery_store.FORMAT_VERSION + 1, 2) + b'{}')
+    with pytest.raises(gallery_store.GalleryFormatError):
+        gallery_store.read_header(path)
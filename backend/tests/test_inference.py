@@ -0,0 +1,69 @@
+"""InferenceExecutor admission, timeouts and pool recovery.
+
+Run from backend/: python -m pytest -q tests
+"""
+
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from api.inference import InferenceExecutor, InferenceTimeout, QueueFull
+
+
+def test_batch_larger_than_capacity_times_out_per_job():
+    executor = InferenceExecutor(workers=1, queue_size=1, timeout=1)
+    try:
+        outcomes = executor.run_many(time.sleep, [(3,)] * 4)
+        assert len(outcomes) == 4
+        for error, timing in outcomes:
+            assert isinstance(error, InferenceTimeout)
+            assert timing is None
+    finally:
+        executor.shutdown()
+
+
+def test_batch_deadline_is_per_job():
+    executor = InferenceExecutor(workers=1, queue_size=0, timeout=30)
+    try:
+        executor.warm_up(time.sleep, 0)
+        # Four 0.4s jobs run one after the other: longer than one job's timeout would allow
+        # if it covered the batch with timeout=1, but each job alone is well within it
+        executor.timeout = 1
+        outcomes = executor.run_many(time.sleep, [(0.4,)] * 4)
+        assert [timing is not None for _, timing in outcomes] == [True] * 4
+    finally:
+        executor.shutdown()
+
+
+def test_timed_out_job_keeps_its_slot_until_it_finishes():
+    executor = InferenceExecutor(workers=1, queue_size=0, timeout=30)
+    try:
+        executor.warm_up(time.sleep, 0)
+        executor.timeout = 0.5
+        with pytest.raises(InferenceTimeout):
+            executor.run(time.sleep, 2)
+        # The pool process is still busy, so the executor is full
+        assert executor.depth == 1
+        with pytest.raises(QueueFull):
+            executor.run(time.sleep, 0)
+        time.sleep(2)
+        assert executor.depth == 0
+        executor.run(time.sleep, 0)
+    finally:
+        executor.shutdown()
+
+
+def test_pool_is_replaced_after_a_worker_dies():
+    executor = InferenceExecutor(workers=1, queue_size=1, timeout=30)
+    try:
+        with pytest.raises(BrokenProcessPool):
+            executor.run(os._exit, 1)
+        result, timing = executor.run(abs, -3)
+        assert result == 3
+        outcomes = executor.run_many(abs, [(-1,), (-2,), (-3,)])
+        assert [result for result, _ in outcomes] == [1, 2, 3]
+        assert executor.depth == 0
+    finally:
+        executor.shutdown()
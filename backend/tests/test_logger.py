@@ -0,0 +1,99 @@
+"""Batched log writer and keyset pagination of the logs.
+
+Run from backend/: python -m pytest -q tests
+"""
+
+import sqlite3
+import threading
+
+import pytest
+
+from api import logger
+
+
+@pytest.fixture
+def log_db(tmp_path, monkeypatch):
+    """A fresh log database with its own writer thread and read connections"""
+    logger.shutdown()
+    monkeypatch.setattr(logger, 'DB_FILE', str(tmp_path / 'logs.db'))
+    monkeypatch.setattr(logger, '_readers', threading.local())
+    monkeypatch.setattr(logger, '_count_cache', {})
+    logger.init_db()
+    yield logger.DB_FILE
+    logger.shutdown()
+
+
+def _log(n, start=0):
+    for i in range(start, start + n):
+        logger.log_event('/recognize', 'recognition' if i % 2 else 'training', i % 3 != 0, f'event {i}',
+                         details={'i': i})
+    assert logger.flush()
+
+
+def test_writer_batches_events_into_few_transactions(log_db, monkeypatch):
+    # A long interval: batches end only when full or at the flush
+    monkeypatch.setattr(logger, 'LOG_BATCH_SIZE', 500)
+    monkeypatch.setattr(logger, 'LOG_FLUSH_INTERVAL', 30.0)
+    before = logger.writer_stats()
+    _log(1200)
+    after = logger.writer_stats()
+    assert after['running'] and after['queued'] == 0
+    assert after['written'] - before['written'] == 1200
+    assert after['batches'] - before['batches'] == 3
+    assert after['failed'] == before['failed']
+
+    with sqlite3.connect(log_db) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM logs').fetchone()[0] == 1200
+        assert conn.execute('SELECT message FROM logs ORDER BY id DESC LIMIT 1').fetchone()[0] == 'event 1199'
+
+
+def test_sightings_are_stored_with_their_event(log_db):
+    faces = [{'name': 'alice', 'confidence': 0.9, 'location': {'top': 1, 'right': 2, 'bottom': 3, 'left': 4}},
+             {'name': None}]
+    _log(3)
+    logger.log_event('/recognize', 'recognition', True, 'with faces',
+                     sightings=logger.sightings_of(faces, device='cam-1', recognition_id='r1'))
+    _log(2, start=3)
+
+    with sqlite3.connect(log_db) as conn:
+        log_id = conn.execute("SELECT id FROM logs WHERE message = 'with faces'").fetchone()[0]
+        rows = conn.execute('SELECT log_id, recognition_id, device, person, box_left FROM sightings').fetchall()
+    assert rows == [(log_id, 'r1', 'cam-1', 'alice', 4)]
+
+
+def test_keyset_pages_cover_every_log_once(log_db):
+    _log(120)
+    seen, cursor = [], None
+    while True:
+        page = logger.get_logs(limit=50, before_id=cursor)
+        seen.extend(log['id'] for log in page['logs'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert len(seen) == 120
+    assert seen == sorted(seen, reverse=True)
+    assert page['total'] == 120 and page['total_estimated']
+
+
+def test_keyset_pages_match_offset_pages_with_filters(log_db):
+    _log(90)
+    filters = {'event_type': 'recognition', 'success': True}
+    first = logger.get_logs(limit=10, **filters)
+    second = logger.get_logs(limit=10, before_id=first['next_cursor'], **filters)
+    by_offset = logger.get_logs(limit=10, offset=10, **filters)
+    assert [log['id'] for log in second['logs']] == [log['id'] for log in by_offset['logs']]
+    assert all(log['event_type'] == 'recognition' and log['success'] == 1 for log in second['logs'])
+    assert second['logs'][0]['details'] == {'i': int(second['logs'][0]['message'].split()[1])}
+
+    # Odd i are recognitions, and i % 3 != 0 succeeds: 30 of the 90 events
+    assert first['total'] == 30 and not first['total_estimated']
+    assert second['total'] == 30 and second['total_estimated']  # served from the count cache
+
+
+def test_partial_last_page_has_no_cursor(log_db):
+    _log(5)
+    page = logger.get_logs(limit=5)
+    assert page['next_cursor'] == page['logs'][-1]['id']
+    last = logger.get_logs(limit=5, before_id=page['next_cursor'])
+    assert last['logs'] == [] and last['next_cursor'] is None
+    assert logger.get_logs(limit=10)['next_cursor'] is None
@@ -0,0 +1,165 @@
+"""GalleryMatcher: per-person minima, top_k ranking, tombstones and layers.
+
+Run from backend/: python -m pytest -q tests
+"""
+
+import numpy as np
+import pytest
+
+from api.matcher import GalleryLayer, GalleryMatcher, _FLOAT16_WIDENING, _widen
+
+
+def _gallery(people=30, rows=200, seed=0):
+    """(names, encodings) with people in random row order, so rows get regrouped"""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(scale=0.3, size=(people, 128)).astype(np.float32)
+    owners = rng.integers(0, people, rows)
+    encodings = centres[owners] + rng.normal(scale=0.05, size=(rows, 128)).astype(np.float32)
+    return [f'person_{i:02d}' for i in owners], encodings
+
+
+def _brute_force(names, encodings, probes):
+    """{person: distances from every probe to their closest encoding}"""
+    d = np.linalg.norm(probes[:, None, :].astype(np.float64) - encodings[None, :, :], axis=2)
+    return {person: d[:, [n == person for n in names]].min(axis=1) for person in set(names)}
+
+
+def test_person_distances_are_per_person_minima():
+    names, encodings = _gallery()
+    probes = encodings[::17] + 0.01
+    matcher = GalleryMatcher(names, encodings)
+    expected = _brute_force(names, encodings, probes)
+    distances = matcher.person_distances(probes)
+    for i, person in enumerate(matcher.people):
+        np.testing.assert_allclose(distances[:, i], expected[person], atol=1e-4)
+
+
+def test_layered_matcher_matches_the_merged_gallery():
+    names, encodings = _gallery()
+    new_names = ['person_03'] * 4 + ['newcomer'] * 3
+    new_encodings = _gallery(seed=1)[1][:7]
+    probes = np.vstack([encodings[::23], new_encodings]) + 0.01
+
+    # Base with person_05 tombstoned, then rows added for an existing and a new person
+    layered = GalleryMatcher(names, encodings).without(['person_05']).extended(new_names, new_encodings)
+    assert len(layered.layers) == 2
+    kept = [i for i, n in enumerate(names) if n != 'person_05']
+    merged_names = [names[i] for i in kept] + new_names
+    merged = np.vstack([encodings[kept], new_encodings])
+    expected = _brute_force(merged_names, merged, probes)
+
+    distances = layered.person_distances(probes)
+    for i, person in enumerate(layered.people):
+        if person == 'person_05':
+            assert np.isinf(distances[:, i]).all()
+        else:
+            np.testing.assert_allclose(distances[:, i], expected[person], atol=1e-4)
+    assert layered.live_rows == len(merged)
+    assert len(layered.person_encodings('person_03')) == merged_names.count('person_03')
+
+
+def test_top_k_candidates_are_distinct_people_by_distance():
+    names, encodings = _gallery()
+    matcher = GalleryMatcher(names, encodings)
+    for result in matcher.match(encodings[:5] + 0.01, top_k=4, tolerance=10):
+        candidates = result['candidates']
+        assert len(candidates) == 4
+        assert len({c['name'] for c in candidates}) == 4
+        assert [c['distance'] for c in candidates] == sorted(c['distance'] for c in candidates)
+        assert result['name'] == candidates[0]['name']
+
+
+def test_top_k_is_capped_by_live_people():
+    matcher = GalleryMatcher(['a', 'b', 'c'], np.eye(3, 128, dtype=np.float32))
+    result = matcher.without(['c']).match([np.zeros(128)], top_k=5, tolerance=10)[0]
+    assert [c['name'] for c in result['candidates']] == ['a', 'b']
+
+
+def test_unknown_keeps_the_best_distance():
+    matcher = GalleryMatcher(['a'], np.zeros((1, 128), dtype=np.float32))
+    result = matcher.match([np.full(128, 0.1)], tolerance=0.6)[0]
+    assert result['name'] == 'Unknown'
+    assert result['distance'] == pytest.approx(np.sqrt(128) * 0.1, rel=1e-5)
+    assert result['candidates'][0]['name'] == 'a'
+
+
+@pytest.mark.parametrize('mode', ['exact', 'prototype', 'ann'])
+def test_tombstoned_people_are_never_returned(mode):
+    names, encodings = _gallery()
+    matcher = GalleryMatcher(names, encodings)
+    matcher.build_index(n_lists=4, n_probe=4)
+    victim = names[0]
+    removed = matcher.without([victim])
+    assert victim not in removed.live_people
+    assert victim in matcher.live_people  # the original is untouched
+    for result in removed.match(encodings[:20], top_k=3, mode=mode, refine_people=3):
+        assert victim not in [c['name'] for c in result['candidates']]
+    assert len(removed.person_encodings(victim)) == 0
+
+
+def test_retrained_person_is_matched_on_new_rows_only():
+    names, encodings = _gallery()
+    victim = names[0]
+    old_rows = encodings[[n == victim for n in names]]
+    new_row = np.full((1, 128), 0.5, dtype=np.float32)
+    matcher = GalleryMatcher(names, encodings)
+    matcher.build_index(n_lists=4, n_probe=4)
+    retrained = matcher.without([victim]).extended([victim], new_row)
+
+    assert retrained.live_person_count == matcher.live_person_count
+    np.testing.assert_array_equal(retrained.person_encodings(victim), new_row)
+    for mode in ('exact', 'ann', 'prototype'):
+        result = retrained.match(old_rows[:1], top_k=30, mode=mode, refine_people=30, tolerance=10)[0]
+        distances = {c['name']: c['distance'] for c in result['candidates']}
+        assert distances[victim] == pytest.approx(float(np.linalg.norm(old_rows[0] - new_row[0])), rel=1e-4)
+
+
+def test_ann_matches_exact_with_every_list_probed():
+    names, encodings = _gallery()
+    matcher = GalleryMatcher(names, encodings).extended(['late'], encodings[:1] + 0.2)
+    matcher.build_index(n_lists=8, n_probe=8)
+    probes = encodings[::11] + 0.01
+    exact = matcher.match(probes, mode='exact', top_k=2)
+    ann = matcher.match(probes, mode='ann', top_k=2)
+    assert [[c['name'] for c in r['candidates']] for r in exact] == \
+        [[c['name'] for c in r['candidates']] for r in ann]
+
+
+def test_layer_keeps_a_grouped_memmap_unchanged(tmp_path):
+    path = tmp_path / 'rows.f32'
+    rows = np.memmap(path, dtype=np.float32, mode='w+', shape=(6, 128))
+    rows[:] = np.arange(6)[:, None]
+    rows.flush()
+    mapped = np.memmap(path, dtype=np.float32, mode='r', shape=(6, 128))
+    layer, order = GalleryLayer.grouped(['a', 'b'], np.array([0, 0, 0, 1, 1, 1], dtype=np.int32), mapped)
+    assert layer.matrix is mapped
+    np.testing.assert_array_equal(order, np.arange(6))
+    np.testing.assert_array_equal(layer.run_starts, [0, 3])
+    np.testing.assert_allclose(layer.run_sums[:, 0], [0 + 1 + 2, 3 + 4 + 5])
+
+
+@pytest.mark.parametrize('precision', ['float16', 'int8'])
+def test_quantized_matcher_agrees_with_float32(precision):
+    names, encodings = _gallery()
+    probes = encodings[::13] + 0.01
+    matcher = GalleryMatcher(names, encodings)
+    quantized = matcher.quantized(precision)
+    assert quantized.precision == precision
+    assert quantized.nbytes < matcher.nbytes
+    np.testing.assert_allclose(quantized.person_distances(probes), matcher.person_distances(probes), atol=0.02)
+    assert [r['name'] for r in quantized.match(probes)] == [r['name'] for r in matcher.match(probes)]
+
+
+def test_float16_widening_is_exact():
+    every_half = np.arange(-2 ** 15, 2 ** 15, dtype=np.int32).astype(np.int16).view(np.float16)
+    finite = every_half[np.isfinite(every_half)]
+    block = np.resize(finite, (len(finite) // 128 + 1) * 128).reshape(-1, 128)
+    widened = _widen(block, np.empty(block.shape, dtype=np.float32)).astype(np.float64)
+    np.testing.assert_array_equal(widened * float(_FLOAT16_WIDENING), block.astype(np.float64))
+
+
+def test_empty_gallery_answers_unknown():
+    matcher = GalleryMatcher([], []).quantized('int8')
+    assert matcher.match([np.zeros(128)])[0]['name'] == 'Unknown'
+    grown = matcher.extended(['a'], np.full((1, 128), 0.1, dtype=np.float32))
+    assert grown.match([np.full(128, 0.1)])[0]['name'] == 'a'
@@ -0,0 +1,54 @@
+"""Near-duplicate pruning and the k-medoids per-person cap.
+
+Run from backend/: python -m pytest -q tests
+"""
+
+import numpy as np
+
+from api.pruning import _k_medoids, _pairwise, prune_gallery, prune_person
+
+
+def _distinct(n, seed=0):
+    """``n`` unit encodings far apart from each other"""
+    x = np.random.default_rng(seed).normal(size=(n, 128)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def test_cap_with_duplicate_rows_keeps_one_per_distinct_encoding():
+    # Three distinct encodings, each enrolled five times; no distance pruning
+    x = np.repeat(_distinct(3), 5, axis=0)
+    keep = prune_person(x, min_distance=0, max_count=5)
+    assert len(keep) == 3
+    assert len({tuple(x[i]) for i in keep}) == 3
+
+
+def test_cap_with_identical_rows_keeps_one():
+    x = np.repeat(_distinct(1), 6, axis=0)
+    assert len(prune_person(x, min_distance=0, max_count=3)) == 1
+
+
+def test_k_medoids_survives_medoids_tied_with_duplicates():
+    # Two pairs of identical rows and one outlier: every cluster update has ties
+    x = _distinct(3)[[0, 0, 1, 1, 2]]
+    medoids = _k_medoids(_pairwise(x), 4)
+    assert 1 <= len(medoids) <= 3
+    assert len(set(medoids)) == len(medoids)
+
+
+def test_near_duplicates_are_dropped_but_distinct_faces_kept():
+    base = _distinct(4)
+    noise = np.random.default_rng(1).normal(scale=0.002, size=(4, 3, 128)).astype(np.float32)
+    x = (base[:, None, :] + noise).reshape(-1, 128)  # 4 faces x 3 burst frames
+    keep = prune_person(x, min_distance=0.1)
+    assert len(keep) == 4
+    assert sorted(i // 3 for i in keep) == [0, 1, 2, 3]
+    assert list(keep) == sorted(keep)
+
+
+def test_prune_gallery_prunes_each_person_separately():
+    alice = np.repeat(_distinct(1, seed=1), 3, axis=0)
+    bob = _distinct(2, seed=2)
+    names = ['alice'] * 3 + ['bob'] * 2
+    keep, stats = prune_gallery(names, np.vstack([alice, bob]), min_distance=0.1)
+    assert [names[i] for i in keep] == ['alice', 'bob', 'bob']
+    assert stats == {'encodings_before': 5, 'encodings_after': 3, 'people_pruned': 1}
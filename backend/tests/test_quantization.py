@@ -0,0 +1,86 @@
+"""float16 and int8 storage of encodings: round trips and requantizing.
+
+Run from backend/: python -m pytest -q tests
+"""
+
+import numpy as np
+import pytest
+
+from api.quantization import dequantize, precision_of, quantize, requantize
+
+
+def _encodings(n=300, seed=0):
+    return np.random.default_rng(seed).normal(scale=0.1, size=(n, 128)).astype(np.float32)
+
+
+def test_int8_round_trip_is_within_half_a_step():
+    x = _encodings()
+    codes, scales = quantize(x, 'int8')
+    assert codes.dtype == np.int8 and scales.shape == (128,)
+    np.testing.assert_allclose(scales, np.abs(x).max(axis=0) / 127, rtol=1e-6)
+    error = np.abs(dequantize(codes, scales) - x)
+    assert (error <= scales / 2 + 1e-7).all()
+    # The largest magnitude of every dimension is stored exactly
+    assert (np.abs(codes).max(axis=0) == 127).all()
+
+
+def test_float16_round_trip():
+    x = _encodings()
+    codes, scales = quantize(x, 'float16')
+    assert scales is None and precision_of(codes) == 'float16'
+    restored = dequantize(codes)
+    assert restored.dtype == np.float32
+    np.testing.assert_allclose(restored, x, rtol=2 ** -11, atol=2 ** -24)
+
+
+def test_float32_is_stored_as_is():
+    x = _encodings()
+    codes, scales = quantize(x, 'float32')
+    assert codes is x and scales is None
+
+
+def test_zero_dimension_gets_a_usable_scale():
+    x = _encodings()
+    x[:, 5] = 0
+    codes, scales = quantize(x, 'int8')
+    assert scales[5] == 1 and not codes[:, 5].any()
+    assert np.isfinite(dequantize(codes, scales)).all()
+
+
+def test_reused_scales_clip_values_out_of_range():
+    codes, scales = quantize(_encodings(), 'int8')
+    outlier = np.full((1, 128), 10.0, dtype=np.float32)
+    clipped, same = quantize(outlier, 'int8', scales)
+    assert same is not None and np.array_equal(same, scales)
+    assert (clipped == 127).all()
+    np.testing.assert_allclose(dequantize(clipped, scales)[0], scales * 127, rtol=1e-6)
+
+
+def test_requantize_is_a_no_op_when_nothing_changes():
+    codes, scales = quantize(_encodings(), 'int8')
+    for target_scales in (None, scales.copy()):
+        same, same_scales = requantize(codes, scales, 'int8', target_scales)
+        assert same is codes and same_scales is scales
+
+
+def test_requantize_to_new_scales_and_precisions():
+    x = _encodings()
+    codes, scales = quantize(x, 'int8')
+    wider = scales * 2
+    recoded, recoded_scales = requantize(codes, scales, 'int8', wider)
+    assert recoded_scales is not scales and np.array_equal(recoded_scales, wider)
+    assert (np.abs(dequantize(recoded, wider) - x) <= scales / 2 + wider / 2 + 1e-7).all()
+
+    as_float16, none = requantize(codes, scales, 'float16')
+    assert none is None and precision_of(as_float16) == 'float16'
+    np.testing.assert_allclose(dequantize(as_float16), dequantize(codes, scales), rtol=2 ** -11)
+
+
+def test_empty_matrix_gets_unit_scales():
+    codes, scales = quantize(np.zeros((0, 128)), 'int8')
+    assert codes.shape == (0, 128) and (scales == 1).all()
+
+
+def test_unknown_precision_is_rejected():
+    with pytest.raises(ValueError, match='bfloat16'):
+        quantize(_encodings(), 'bfloat16')
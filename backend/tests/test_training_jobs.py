@@ -0,0 +1,59 @@
+"""Training job index and retention.
+
+Run from backend/: python -m pytest -q tests
+"""
+
+import os
+
+from api.training_jobs import TrainingJobs
+
+
+def _finished_job(jobs, name, minute):
+    """Write a completed job file as a worker would leave it"""
+    job = {'id': f'{minute:032x}', 'name': name, 'replace': False, 'status': 'completed',
+           'created_at': f'2026-01-01T00:{minute:02d}:00+00:00',
+           'finished_at': f'2026-01-01T00:{minute:02d}:30+00:00'}
+    jobs.save(job)
+    return job
+
+
+def test_prune_keeps_the_newest_finished_jobs(tmp_path):
+    jobs = TrainingJobs(str(tmp_path), run_job=None, keep_finished=2)
+    for minute in range(5):
+        _finished_job(jobs, f'person_{minute}', minute)
+    pending = {'id': 'f' * 32, 'name': 'pending', 'status': 'queued', 'created_at': '2026-01-01T00:00:00+00:00'}
+    jobs.save(pending)
+    (tmp_path / f'{0:032x}.lock').touch()
+
+    assert jobs.prune() == 3
+    assert [job['name'] for job in jobs.jobs()] == ['pending', 'person_3', 'person_4']
+    assert not os.path.exists(tmp_path / f'{0:032x}.lock')
+    assert jobs.prune() == 0
+
+
+def test_keep_zero_keeps_every_job(tmp_path):
+    jobs = TrainingJobs(str(tmp_path), run_job=None, keep_finished=0)
+    for minute in range(3):
+        _finished_job(jobs, f'person_{minute}', minute)
+    assert jobs.prune() == 0
+    assert len(jobs.jobs()) == 3
+
+
+def test_index_sees_other_workers_changes(tmp_path):
+    mine = TrainingJobs(str(tmp_path), run_job=None)
+    other = TrainingJobs(str(tmp_path), run_job=None)
+    job = {'id': 'a' * 32, 'name': 'alice', 'status': 'running', 'created_at': '2026-01-01T00:00:00+00:00'}
+    other.save(job)
+    assert [j['status'] for j in mine.jobs()] == ['running']
+
+    job['status'] = 'completed'
+    other.save(job)
+    os.utime(other._path(job['id']), ns=(1, 1))  # a different mtime even on coarse clocks
+    assert [j['status'] for j in mine.jobs()] == ['completed']
+
+    # Returned jobs are copies: changing one does not change the index
+    mine.jobs()[0]['status'] = 'queued'
+    assert mine.jobs()[0]['status'] == 'completed'
+
+    os.remove(other._path(job['id']))
+    assert mine.jobs() == []
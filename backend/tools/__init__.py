@@ -0,0 +1,2 @@
+# Maintenance tools. Run from the backend directory, e.g.
+#   python -m tools.convert_gallery encodings.pkl
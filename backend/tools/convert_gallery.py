@@ -0,0 +1,59 @@
+"""Convert between the legacy encodings.pkl and the memory-mapped .gal format.
+
+Usage (from backend/):
+    python -m tools.convert_gallery encodings.pkl                 # -> encodings.gal
+    python -m tools.convert_gallery encodings.pkl out.gal
+    python -m tools.convert_gallery --to-pickle encodings.gal encodings.pkl
+    python -m tools.convert_gallery --info encodings.gal
+    python -m tools.convert_gallery --compact encodings.gal       # fold delta segments into the base
+    python -m tools.convert_gallery --compact --precision int8 encodings.gal  # and store it as int8
+"""
+
+import argparse
+import sys
+
+from api import gallery_store
+from api.quantization import PRECISIONS
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source')
+    parser.add_argument('destination', nargs='?')
+    parser.add_argument('--to-pickle', action='store_true', help='Write a legacy pickle from a .gal file')
+    parser.add_argument('--info', action='store_true', help='Print the header of a .gal file')
+    parser.add_argument('--compact', action='store_true', help='Merge the delta segments of a .gal into its base file')
+    parser.add_argument('--precision', choices=PRECISIONS,
+                        help='Storage precision of the written gallery (default: float32, --compact keeps the current one)')
+    args = parser.parse_args()
+
+    try:
+        if args.info:
+            header = gallery_store.read_header(args.source)
+            print(f"Format v{header['version']}: {header['count']} encodings, "
+                  f"{len(header['people'])} people, dim={header['dim']}, dtype={header['dtype']}, "
+                  f"generation {header.get('generation', 0)}")
+            segments = gallery_store.segment_paths(args.source, after=header.get('generation', 0))
+            if segments:
+                print(f"{len(segments)} delta segment(s) up to generation {segments[-1][0]}")
+        elif args.compact:
+            # Run with the API stopped, or let it compact by itself (GALLERY_COMPACT_SEGMENTS)
+            merged = gallery_store.compact(args.source, args.precision)
+            print(f"✅ Merged {merged} delta segment(s) into {args.source} "
+                  f"({gallery_store.base_precision(args.source)})")
+        elif args.to_pickle:
+            if not args.destination:
+                parser.error('--to-pickle needs a destination path')
+            count = gallery_store.export_pickle(args.source, args.destination)
+            print(f"✅ Wrote {count} encodings to {args.destination}")
+        else:
+            path, count, people = gallery_store.convert_pickle(args.source, args.destination,
+                                                               args.precision or 'float32')
+            print(f"✅ Wrote {count} encodings for {people} people to {path} ({args.precision or 'float32'})")
+    except (OSError, gallery_store.GalleryFormatError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,9 +7,21 @@ WORK_DIR="$APP_DIR/backend"
 
 echo "🔄 Updating Face Recognition API..."
 
-# Pull latest code
+# Pull latest code. encodings.pkl is no longer tracked, so the pull that untracks it
+# deletes it: keep this server's copy (it is only converted while no encodings.gal exists)
 cd $APP_DIR
+PICKLE="$WORK_DIR/encodings.pkl"
+if [ -f "$PICKLE" ]; then
+    cp -p "$PICKLE" "$PICKLE.update-backup"
+fi
 git pull
+if [ -f "$PICKLE.update-backup" ]; then
+    if [ -f "$PICKLE" ]; then
+        rm "$PICKLE.update-backup"
+    else
+        mv "$PICKLE.update-backup" "$PICKLE"
+    fi
+fi
 
 # Update dependencies
 cd $WORK_DIR
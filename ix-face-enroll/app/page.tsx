@@ -7,6 +7,9 @@ import { Camera, X, CheckCircle2, AlertCircle, Loader2, Settings, RefreshCw, Wif
 
 const DEFAULT_API_URL = process.env.BACKEND_URL || "http://138.197.234.202:8080";
 const ENROLLMENT_DELIMITER = "__rel__"; // safe for cross-platform filenames
+// Give up waiting for a training job after this long (it may still finish on the backend)
+const TRAINING_POLL_TIMEOUT_MS = 10 * 60 * 1000;
+const TRAINING_POLL_INTERVAL_MS = 1000;
 
 // Debug: Log API URL configuration
 console.log("[DEBUG] API Configuration:", {
@@ -729,6 +732,32 @@ export default function Home() {
         throw new Error(`Server returned invalid JSON (${response.status}): ${text.substring(0, 200)}`);
       }
 
+      if (result.success && result.job_id) {
+        // Training runs as a background job on the backend: poll until it finishes
+        const statusUrl = useProxy ? `/api/train/${result.job_id}` : `${apiUrl}/train/${result.job_id}`;
+        const deadline = Date.now() + TRAINING_POLL_TIMEOUT_MS;
+        let job = null;
+        while (!job || (job.status !== "completed" && job.status !== "failed")) {
+          if (Date.now() > deadline) {
+            throw new Error(
+              `Training is still ${job ? job.status : "pending"} after ${TRAINING_POLL_TIMEOUT_MS / 60000} minutes. ` +
+              `It may finish later; check Enrolled Faces before enrolling again.`
+            );
+          }
+          await new Promise((resolve) => setTimeout(resolve, TRAINING_POLL_INTERVAL_MS));
+          const statusResponse = await fetch(statusUrl);
+          const status = await statusResponse.json();
+          if (!status.success) {
+            throw new Error(status.error || `Failed to get training status (${statusResponse.status})`);
+          }
+          job = status.job;
+          console.log("[DEBUG] Training job:", job);
+        }
+        result = job.status === "completed"
+          ? { success: true, faces_added: job.faces_added, total_faces: job.total_faces }
+          : { success: false, error: job.error };
+      }
+
       if (result.success) {
         console.log("[DEBUG] Training successful:", result);
         setMessage({
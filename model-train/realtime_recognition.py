@@ -1,9 +1,12 @@
 import face_recognition
-import pickle
 import cv2
 import numpy as np
 from datetime import datetime
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from api import gallery_store  # noqa: E402
 
 def realtime_face_recognition():
     """Real-time face recognition from webcam"""
@@ -12,8 +15,8 @@ def realtime_face_recognition():
     print("Loading face encodings...")
   
     encodings_path = os.path.join(os.path.dirname(__file__), "..", "backend", "encodings.pkl")
-    with open(encodings_path, "rb") as f:
-        loaded_encodings = pickle.load(f)
+    names, matrix = gallery_store.load_names_and_encodings(encodings_path)
+    loaded_encodings = {"names": names, "encodings": matrix}
     
     print(f"Loaded {len(loaded_encodings['encodings'])} encodings")
     print(f"Known people: {set(loaded_encodings['names'])}")
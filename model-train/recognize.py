@@ -1,16 +1,20 @@
 import face_recognition
-import pickle
 from pathlib import Path
 import cv2
 import numpy as np
 from datetime import datetime
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from api import gallery_store  # noqa: E402
 
 def recognize_faces_with_boxes(image_path, output_path=None, show_debug=True):
     """Recognize faces and draw bounding boxes with labels"""
     
-    # Load saved encodings
-    with open("encodings.pkl", "rb") as f:
-        loaded_encodings = pickle.load(f)
+    # Load saved encodings (encodings.gal, or the legacy encodings.pkl)
+    names, matrix = gallery_store.load_names_and_encodings("encodings.pkl")
+    loaded_encodings = {"names": names, "encodings": matrix}
     
     if show_debug:
         print(f"\n{'='*50}")
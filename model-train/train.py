@@ -1,87 +1,223 @@
 import face_recognition
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-import pickle
+import argparse
+import base64
+import hashlib
+import json
 import os
-import csv
-
-FOLDER_CSV = "trained_folders.csv"
-ENCODINGS_PATH = os.path.join("..", "deploy", "encodings.pkl")
-
-
-def load_trained_folders(csv_path=FOLDER_CSV):
-    trained = set()
-    if os.path.exists(csv_path):
-        with open(csv_path, newline="") as csvfile:
-            reader = csv.reader(csvfile)
-            for row in reader:
-                if row:
-                    trained.add(row[0])
-    return trained
-
-
-def save_trained_folders(trained, csv_path=FOLDER_CSV):
-    with open(csv_path, "w", newline="") as csvfile:
-        writer = csv.writer(csvfile)
-        for folder in sorted(trained):
-            writer.writerow([folder])
-
-
-def train_faces(incremental=True):
-    """Train faces and skip folders (people) already trained before."""
-
-    # Load model if exists
-    if incremental and os.path.exists(ENCODINGS_PATH):
-        print("Loading existing encodings...")
-        with open(ENCODINGS_PATH, "rb") as f:
-            data = pickle.load(f)
-            names = data["names"]
-            encodings = data["encodings"]
-        print(f"Loaded {len(encodings)} known faces.")
-    else:
-        print("Starting fresh training...")
-        names, encodings = [], []
-
-    # Load which folders (names) are already trained
-    trained_folders = load_trained_folders()
-    print(f"Already trained folders: {trained_folders or 'None'}")
-
-    training_root = Path("training")
-    new_folders = [p for p in training_root.iterdir() if p.is_dir() and p.name not in trained_folders]
-
-    if not new_folders:
-        print("No new folders to train. Everything is up to date.")
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+sys.path.insert(0, BACKEND_DIR)
+from api import gallery_store  # noqa: E402
+from api.gallery_sync import VersionSegment, default_segment_path  # noqa: E402
+from api.pruning import DEFAULT_MAX_PER_PERSON, DEFAULT_MIN_DISTANCE, prune_gallery  # noqa: E402
+
+TRAINING_ROOT = "training"
+# Per-image content hashes and encodings of everything trained so far
+MANIFEST_PATH = "training_manifest.json"
+# The API's gallery, with the same defaults and environment variables as backend/api/app.py,
+# so an API running on this machine picks the update up. A legacy encodings.pkl is still read.
+ENCODINGS_PATH = os.path.join(BACKEND_DIR, "encodings.pkl")
+GALLERY_PATH = os.environ.get("GALLERY_PATH", gallery_store.gallery_path_for(ENCODINGS_PATH))
+GALLERY_VERSION_PATH = os.environ.get("GALLERY_VERSION_PATH", default_segment_path(GALLERY_PATH))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def load_manifest(path=MANIFEST_PATH):
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {"version": 1, "images": {}}
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    """Atomically write the manifest (it doubles as the checkpoint of a running training)"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def pack_encodings(encodings):
+    return [base64.b64encode(np.asarray(e, dtype=np.float32).tobytes()).decode() for e in encodings]
+
+
+def unpack_encodings(packed):
+    return [np.frombuffer(base64.b64decode(e), dtype=np.float32) for e in packed]
+
+
+def file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scan_training_images(root=TRAINING_ROOT):
+    """{relative path: (person, path)} for every image in training/<person>/"""
+    images = {}
+    for folder in sorted(Path(root).iterdir()):
+        if folder.is_dir():
+            for fp in sorted(folder.glob("*")):
+                if fp.is_file() and fp.suffix.lower() in IMAGE_EXTENSIONS:
+                    images[f"{folder.name}/{fp.name}"] = (folder.name, fp)
+    return images
+
+
+def encode_image(path):
+    """Worker: every face encoding found in one image"""
+    img = face_recognition.load_image_file(path)
+    locs = face_recognition.face_locations(img, model="hog")  # Use "cnn" if GPU is available
+    return face_recognition.face_encodings(img, locs)
+
+
+def plan(manifest, images):
+    """Find the training images to encode and the manifest entries whose image is gone.
+
+    The content hash is only recomputed when an image's size or mtime changed.
+    Images that failed to encode last time are tried again.
+    """
+    to_encode = []
+    for key, (person, fp) in images.items():
+        st = fp.stat()
+        entry = manifest["images"].get(key)
+        if entry and entry.get("error"):
+            to_encode.append((key, person, fp, st, file_hash(fp)))
+            continue
+        if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+            continue
+        digest = file_hash(fp)
+        if entry and entry["sha1"] == digest and entry["person"] == person:
+            entry.update(size=st.st_size, mtime_ns=st.st_mtime_ns)
+            continue
+        to_encode.append((key, person, fp, st, digest))
+    deleted = [key for key in manifest["images"] if key not in images]
+    return to_encode, deleted
+
+
+def train_faces(workers=None, checkpoint_every=50, rebuild=False,
+                prune_min_distance=DEFAULT_MIN_DISTANCE, max_per_person=DEFAULT_MAX_PER_PERSON):
+    """Encode new or changed training images in parallel and update the gallery.
+
+    Only people whose images were added, changed or deleted are rewritten in the
+    gallery, after near-duplicate pruning (the manifest keeps every encoding).
+    Progress is checkpointed to the manifest, so an interrupted run resumes
+    where it stopped.
+    """
+    manifest = {"version": 1, "images": {}} if rebuild else load_manifest()
+    images = scan_training_images()
+    to_encode, deleted = plan(manifest, images)
+    # People trained by an interrupted run whose gallery update was not published yet
+    changed_people = set(manifest.get("pending_people", []))
+
+    retried = sum(1 for key, *_ in to_encode if manifest["images"].get(key, {}).get("error"))
+    for key in deleted:
+        changed_people.add(manifest["images"].pop(key)["person"])
+    print(f"{len(images)} training images: {len(to_encode) - retried} new or changed, "
+          f"{retried} failed before and retried, {len(deleted)} deleted")
+
+    if to_encode:
+        workers = workers or os.cpu_count()
+        print(f"Encoding {len(to_encode)} images with {workers} processes...")
+        started = time.time()
+        done = 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(encode_image, str(fp)): (key, person, st, digest)
+                       for key, person, fp, st, digest in to_encode}
+            for future in as_completed(futures):
+                key, person, st, digest = futures[future]
+                try:
+                    encodings, error = future.result(), None
+                except Exception as e:
+                    print(f"Warning: Failed to process {key}: {str(e)}")
+                    encodings, error = [], str(e)
+                old = manifest["images"].get(key)
+                # A retried image that fails again changes nothing in the gallery
+                failed_again = (old and old.get("error") and error
+                                and old["sha1"] == digest and old["person"] == person)
+                if old and not failed_again:
+                    changed_people.add(old["person"])
+                manifest["images"][key] = {
+                    "person": person,
+                    "sha1": digest,
+                    "size": st.st_size,
+                    "mtime_ns": st.st_mtime_ns,
+                    "encodings": pack_encodings(encodings),
+                    "error": error,
+                }
+                if not failed_again:
+                    changed_people.add(person)
+                done += 1
+                if done % checkpoint_every == 0:
+                    manifest["pending_people"] = sorted(changed_people)
+                    save_manifest(manifest)
+                    print(f"  {done}/{len(to_encode)} images ({done / (time.time() - started):.1f}/s), checkpoint saved")
+        print(f"Encoded {done} images in {time.time() - started:.1f}s")
+
+    if not changed_people and not rebuild:
+        save_manifest(manifest)
+        print("No new or changed images. Everything is up to date.")
         return
 
-    for folder in new_folders:
-        person_name = folder.name
-        print(f"\nTraining new folder: {person_name}")
-
-        for fp in folder.glob("*"):
-            if fp.is_file():
-                img = face_recognition.load_image_file(fp)
-                locs = face_recognition.face_locations(img, model="hog")  # Use "cnn" if GPU is available
-                codes = face_recognition.face_encodings(img, locs)
-                for code in codes:
-                    names.append(person_name)
-                    encodings.append(code)
-
-        trained_folders.add(person_name)
-        print(f"Trained folder '{person_name}' with {len(list(folder.glob('*')))} images.")
-
-    # Ensure the deploy directory exists
-    deploy_dir = os.path.dirname(ENCODINGS_PATH)
-    os.makedirs(deploy_dir, exist_ok=True)
-
-    # Save updated encodings
-    out = {"names": names, "encodings": encodings}
-    with open(ENCODINGS_PATH, "wb") as f:
-        pickle.dump(out, f)
-    print(f"✅ Updated model saved as {ENCODINGS_PATH}")
-
-    # Save updated trained folder list
-    save_trained_folders(trained_folders)
-    print(f"✅ Updated folder list saved in {FOLDER_CSV}")
+    # All current encodings of the people that changed
+    names, encodings = [], []
+    for entry in manifest["images"].values():
+        if rebuild or entry["person"] in changed_people:
+            for encoding in unpack_encodings(entry["encodings"]):
+                names.append(entry["person"])
+                encodings.append(encoding)
+
+    # Drop near-duplicate encodings and cap encodings per person
+    keep, stats = prune_gallery(names, encodings, prune_min_distance, max_per_person)
+    names = [names[i] for i in keep]
+    encodings = [encodings[i] for i in keep]
+    print(f"Pruned {stats['encodings_before'] - stats['encodings_after']} of {stats['encodings_before']} "
+          f"encodings ({stats['people_pruned']} people)")
+
+    # Ensure the gallery directory exists
+    os.makedirs(os.path.dirname(os.path.abspath(GALLERY_PATH)), exist_ok=True)
+
+    # Save updated encodings under the API's publish lock; a running API picks them up.
+    # Changed people are replaced wholesale: one delta segment with their tombstones and encodings.
+    manifest["pending_people"] = sorted(changed_people)
+    save_manifest(manifest)
+    version_segment = VersionSegment(GALLERY_VERSION_PATH)
+    with version_segment.lock():
+        if not rebuild and gallery_store.gallery_state(GALLERY_PATH) is None and os.path.exists(ENCODINGS_PATH):
+            print(f"Converting {ENCODINGS_PATH} to {GALLERY_PATH}...")
+            gallery_store.convert_pickle(ENCODINGS_PATH, GALLERY_PATH)
+        generation = max(version_segment.read(), gallery_store.latest_generation(GALLERY_PATH)) + 1
+        if rebuild or not os.path.exists(GALLERY_PATH):
+            gallery_store.save_names_and_encodings(GALLERY_PATH, names, encodings, generation)
+        else:
+            gallery_store.append_names_and_encodings(GALLERY_PATH, names, encodings, generation,
+                                                     deleted=changed_people)
+        version_segment.write(generation)
+    print(f"✅ Updated {len(changed_people)} people ({len(encodings)} encodings) in {GALLERY_PATH} "
+          f"(gallery version {generation})")
+
+    manifest.pop("pending_people", None)
+    save_manifest(manifest)
+    print(f"✅ Updated manifest saved in {MANIFEST_PATH}")
 
 
 if __name__ == "__main__":
-    train_faces(incremental=True)
+    parser = argparse.ArgumentParser(description="Train face encodings from training/<person>/ folders")
+    parser.add_argument("--workers", type=int, help="Encoding processes (default: all cores)")
+    parser.add_argument("--checkpoint-every", type=int, default=50, help="Save progress every N images")
+    parser.add_argument("--rebuild", action="store_true", help="Ignore the manifest and rebuild the gallery")
+    parser.add_argument("--prune-min-distance", type=float, default=DEFAULT_MIN_DISTANCE,
+                        help="Drop encodings closer than this to a kept one of the same person (0 = off)")
+    parser.add_argument("--max-per-person", type=int, default=DEFAULT_MAX_PER_PERSON,
+                        help="Keep at most this many encodings per person, chosen by k-medoids (0 = no cap)")
+    args = parser.parse_args()
+    train_faces(workers=args.workers, checkpoint_every=args.checkpoint_every, rebuild=args.rebuild,
+                prune_min_distance=args.prune_min_distance, max_per_person=args.max_per_person)
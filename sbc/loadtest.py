@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""Replay the Pi client protocol against a backend with a fleet of simulated devices.
+
+Every device is a thread running the loop of rpi.py in continuous mode: poll
+/pi/command every --poll-interval seconds and, every --capture-interval
+seconds, post "capturing" to /pi/status, upload a frame from
+model-train/test_images to /recognize, echo the result (with its
+recognition_id) to /pi/results and post "continuous_running". Like the real
+client, a device waits for each response before it moves on, so the fleet
+is a closed loop: when the server falls behind, latency grows instead of the
+request rate.
+
+The fleet is ramped through --devices (one step of --duration seconds per
+count). Each step reports latency percentiles and error rates per endpoint
+and whether the server saturated. The summary projects how many devices one
+backend can serve before /recognize takes longer than --timeout (gunicorn's
+120s by default), using Little's law:
+devices = throughput x (response time + capture interval).
+
+Run it against a local or staging backend only: the devices poll
+/pi/command like real Pis do, so they consume commands queued for them.
+
+    python3 sbc/loadtest.py --api-url http://localhost:8080 --devices 1 2 4 8 16
+"""
+
+import argparse
+import collections
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+API_URL = os.getenv('API_URL', 'http://localhost:8080')
+SESSION_USER_AGENT = 'OrangePi-Client/1.0 (loadtest)'
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_IMAGES = os.path.join(REPO_ROOT, 'model-train', 'test_images')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# Timeouts of rpi.py for everything but /recognize
+STATUS_TIMEOUT = 5
+
+ENDPOINTS = ('/recognize', '/pi/command', '/pi/status', '/pi/results')
+
+
+def load_images(directory, frame_width=0):
+    """(name, JPEG bytes) of the test images, skipping the annotated *_output copies"""
+    images = []
+    for filename in sorted(os.listdir(directory)):
+        stem, ext = os.path.splitext(filename)
+        if ext.lower() not in IMAGE_EXTENSIONS or stem.endswith('_output'):
+            continue
+        with open(os.path.join(directory, filename), 'rb') as f:
+            data = f.read()
+        if frame_width:
+            data = _resize(data, frame_width)
+        images.append((filename, data))
+    if not images:
+        raise SystemExit(f"❌ No images found in {directory}")
+    return images
+
+
+def _resize(data, width):
+    """Re-encode an image at ``width`` pixels wide, like a camera frame"""
+    import cv2
+    import numpy as np
+    frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    height = round(frame.shape[0] * width / frame.shape[1])
+    ok, encoded = cv2.imencode('.jpg', cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA))
+    return encoded.tobytes()
+
+
+def percentile(values, q):
+    """q-th percentile of sorted ``values`` (nearest rank)"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+class Stats:
+    """Latencies and outcomes per endpoint, shared by the devices of one step"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = collections.defaultdict(list)  # endpoint -> seconds of successful calls
+        self.outcomes = collections.defaultdict(collections.Counter)  # endpoint -> outcome -> calls
+        self.server = collections.defaultdict(list)  # X-Queue-Wait-Ms / X-Service-Ms of /recognize
+        self.commands = collections.Counter()
+        self.faces = 0
+
+    def record(self, endpoint, outcome, seconds):
+        with self.lock:
+            self.outcomes[endpoint][outcome] += 1
+            if outcome == 'ok':
+                self.latencies[endpoint].append(seconds)
+
+    def record_server(self, response):
+        with self.lock:
+            for header in ('X-Queue-Wait-Ms', 'X-Service-Ms'):
+                if header in response.headers:
+                    self.server[header].append(float(response.headers[header]))
+
+
+class Device(threading.Thread):
+    """One simulated Pi in continuous mode"""
+
+    def __init__(self, index, args, images, stats, stop):
+        super().__init__(daemon=True, name=f'device-{index}')
+        self.device_id = f'{args.device_prefix}-{index:03d}'
+        self.args = args
+        self.images = images
+        self.stats = stats
+        self.stop = stop
+        self.rng = random.Random(args.seed + index)
+        self.session = requests.Session()
+        self.session.headers.update({'User-Agent': SESSION_USER_AGENT, 'X-Device-Id': self.device_id})
+
+    def call(self, method, endpoint, timeout=STATUS_TIMEOUT, **kwargs):
+        """The response of one request, or None; every call is recorded in the stats"""
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, f"{self.args.api_url}{endpoint}", timeout=timeout, **kwargs)
+        except requests.Timeout:
+            self.stats.record(endpoint, 'timeout', time.perf_counter() - started)
+            return None
+        except requests.RequestException:
+            self.stats.record(endpoint, 'connection_error', time.perf_counter() - started)
+            return None
+        outcome = 'ok' if response.status_code == 200 else f'http_{response.status_code}'
+        self.stats.record(endpoint, outcome, time.perf_counter() - started)
+        return response
+
+    def update_status(self, status):
+        self.call('POST', '/pi/status', json={'status': status})
+
+    def poll_command(self):
+        response = self.call('GET', '/pi/command')
+        if response is not None and response.status_code == 200:
+            command = response.json().get('command')
+            if command:
+                with self.stats.lock:
+                    self.stats.commands[command] += 1
+
+    def capture_and_recognize(self):
+        self.update_status('capturing')
+        name, data = self.rng.choice(self.images)
+        response = self.call('POST', '/recognize', timeout=self.args.timeout,
+                             files={'image': (name, data, 'image/jpeg')})
+        if response is None or response.status_code != 200:
+            return
+        self.stats.record_server(response)
+        result = response.json()
+        if not result.get('success'):
+            return
+        faces = result.get('faces', [])
+        with self.stats.lock:
+            self.stats.faces += len(faces)
+        names = sorted({face['name'] for face in faces if face.get('name') != 'Unknown'})
+        payload = dict(result, speech_text=f"I see {', '.join(names)}." if names else '')
+        self.call('POST', '/pi/results', json=payload)
+
+    def run(self):
+        # Devices do not boot in lockstep
+        if self.stop.wait(self.rng.uniform(0, self.args.capture_interval)):
+            return
+        self.update_status('continuous_running')
+        last_capture = 0
+        while not self.stop.is_set():
+            self.poll_command()
+            if time.monotonic() - last_capture >= self.args.capture_interval:
+                self.capture_and_recognize()
+                last_capture = time.monotonic()
+                self.update_status('continuous_running')
+            self.stop.wait(self.args.poll_interval)
+        self.update_status('idle')
+
+
+def summarize(devices, stats, elapsed, args):
+    """Report of one step"""
+    endpoints = {}
+    calls = errors = 0
+    for endpoint in ENDPOINTS:
+        outcomes = stats.outcomes.get(endpoint, collections.Counter())
+        total = sum(outcomes.values())
+        if not total:
+            continue
+        latencies = sorted(stats.latencies.get(endpoint, []))
+        failed = total - outcomes['ok']
+        calls += total
+        errors += failed
+        endpoints[endpoint] = {
+            'calls': total,
+            'errors': {outcome: count for outcome, count in outcomes.items() if outcome != 'ok'},
+            'error_rate': failed / total,
+            **{f'p{q}_ms': round(percentile(latencies, q) * 1000, 1) if latencies else None
+               for q in (50, 90, 99)},
+            'max_ms': round(latencies[-1] * 1000, 1) if latencies else None,
+        }
+    recognized = stats.outcomes['/recognize']['ok']
+    server = {header: sorted(values) for header, values in stats.server.items()}
+    return {
+        'devices': devices,
+        'seconds': round(elapsed, 1),
+        'recognitions': recognized,
+        'faces': stats.faces,
+        # What the fleet would send if every response were instant
+        'offered_per_s': round(devices / args.capture_interval, 3),
+        'recognitions_per_s': round(recognized / elapsed, 3),
+        'error_rate': errors / calls if calls else 0.0,
+        'endpoints': endpoints,
+        'queue_wait_p50_ms': percentile(server.get('X-Queue-Wait-Ms', []), 50),
+        'service_p50_ms': percentile(server.get('X-Service-Ms', []), 50),
+        'commands_consumed': dict(stats.commands),
+    }
+
+
+def saturation(step, previous, args):
+    """Why a step counts as saturated (empty if it does not)"""
+    reasons = []
+    if step['error_rate'] > args.max_error_rate:
+        reasons.append(f"error rate {step['error_rate']:.1%}")
+    recognize = step['endpoints'].get('/recognize', {})
+    p99 = recognize.get('p99_ms')
+    if p99 is not None and p99 > args.slo * 1000:
+        reasons.append(f"/recognize p99 {p99 / 1000:.1f}s > {args.slo:g}s")
+    if recognize and not recognize['calls'] - sum(recognize['errors'].values()):
+        reasons.append("no successful /recognize")
+    if previous and previous['recognitions_per_s'] and step['devices'] > previous['devices']:
+        # Below saturation, throughput grows with the fleet
+        gain = step['recognitions_per_s'] / previous['recognitions_per_s'] - 1
+        if gain < args.min_scaling * (step['devices'] / previous['devices'] - 1):
+            reasons.append(f"throughput {gain:+.0%} for {step['devices'] / previous['devices']:.1f}x devices")
+    return reasons
+
+
+def run_step(devices, args, images):
+    stats = Stats()
+    stop = threading.Event()
+    fleet = [Device(i, args, images, stats, stop) for i in range(devices)]
+    started = time.monotonic()
+    for device in fleet:
+        device.start()
+    stop.wait(args.duration)
+    stop.set()
+    # In-flight requests finish (or time out) before the step is counted
+    for device in fleet:
+        device.join()
+    return summarize(devices, stats, time.monotonic() - started, args)
+
+
+def _ms(value):
+    return f"{value / 1000:.2f}s" if value is not None else "-"
+
+
+def print_step(step):
+    recognize = step['endpoints'].get('/recognize', {})
+    error_text = ', '.join(f"{endpoint} {outcome}×{count}" for endpoint, report in step['endpoints'].items()
+                           for outcome, count in report['errors'].items()) or 'none'
+    print(f"👥 {step['devices']:4d} devices | {step['recognitions_per_s']:6.2f} rec/s "
+          f"(offered ≤{step['offered_per_s']:.2f}) | /recognize p50 {_ms(recognize.get('p50_ms'))} "
+          f"p90 {_ms(recognize.get('p90_ms'))} p99 {_ms(recognize.get('p99_ms'))} "
+          f"max {_ms(recognize.get('max_ms'))}")
+    print(f"      errors {step['error_rate']:.1%} ({error_text}) | server queue wait p50 "
+          f"{_ms(step['queue_wait_p50_ms'])}, service p50 {_ms(step['service_p50_ms'])}")
+    others = ', '.join(f"{endpoint} p99 {_ms(step['endpoints'][endpoint]['p99_ms'])}"
+                       for endpoint in ENDPOINTS[1:] if endpoint in step['endpoints'])
+    if others:
+        print(f"      {others}")
+    if step['saturated']:
+        print(f"   🔥 saturated: {'; '.join(step['saturated'])}")
+
+
+def conclude(steps, args):
+    """Healthy fleet size, measured capacity and the projected fleet size at the timeout"""
+    healthy = [step['devices'] for step in steps if not step['saturated']]
+    capacity = max(step['recognitions_per_s'] for step in steps)
+    # Closed loop (Little's law): devices = throughput x (response time + time between captures)
+    projected = int(capacity * (args.timeout + args.capture_interval))
+    return {
+        'max_healthy_devices': max(healthy) if healthy else 0,
+        'capacity_per_s': capacity,
+        'saturated_at': next((step['devices'] for step in steps if step['saturated']), None),
+        'timeout_s': args.timeout,
+        'projected_devices_at_timeout': projected,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--api-url', default=API_URL, help='backend to load (default: $API_URL or localhost:8080)')
+    parser.add_argument('--devices', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32],
+                        help='fleet sizes to ramp through')
+    parser.add_argument('--duration', type=float, default=60, help='seconds per step')
+    parser.add_argument('--capture-interval', type=float, default=2.0,
+                        help='seconds between captures of one device (continuous mode: 2)')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='seconds between /pi/command polls')
+    parser.add_argument('--images', default=DEFAULT_IMAGES, help='directory of frames to upload')
+    parser.add_argument('--frame-width', type=int, default=0,
+                        help='re-encode frames at this width, e.g. 640 for camera frames (needs cv2)')
+    parser.add_argument('--timeout', type=float, default=120,
+                        help='/recognize client timeout; gunicorn kills requests after 120s (rpi.py gives up at 30s)')
+    parser.add_argument('--slo', type=float, default=None,
+                        help='/recognize p99 above this many seconds counts as saturated (default: --timeout)')
+    parser.add_argument('--max-error-rate', type=float, default=0.01,
+                        help='error rate above this counts as saturated')
+    parser.add_argument('--min-scaling', type=float, default=0.5,
+                        help='throughput growing by less than this fraction of the fleet growth counts as saturated')
+    parser.add_argument('--keep-going', action='store_true', help='run every step, not just up to saturation')
+    parser.add_argument('--device-prefix', default='loadtest', help='X-Device-Id prefix of the simulated devices')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='write the steps and the conclusion to this file')
+    args = parser.parse_args()
+    args.api_url = args.api_url.rstrip('/')
+    if args.slo is None:
+        args.slo = args.timeout
+
+    try:
+        health = requests.get(f"{args.api_url}/health", timeout=STATUS_TIMEOUT).json()
+    except Exception as e:
+        raise SystemExit(f"❌ Backend not reachable at {args.api_url}: {e}")
+    images = load_images(args.images, args.frame_width)
+    print(f"🚀 Load test against {args.api_url} ({health.get('status')}, {len(health.get('known_people') or [])} people), "
+          f"{len(images)} frames, a capture every {args.capture_interval:g}s per device, "
+          f"{args.duration:g}s per step")
+
+    # One untimed pass so lazy start-up work is not billed to the first step
+    warm = requests.Session()
+    for name, data in images:
+        try:
+            warm.post(f"{args.api_url}/recognize", files={'image': (name, data, 'image/jpeg')},
+                      headers={'X-Device-Id': f'{args.device_prefix}-warmup'}, timeout=args.timeout)
+        except requests.RequestException as e:
+            print(f"⚠️ Warm-up request failed: {e}")
+
+    steps = []
+    for devices in args.devices:
+        step = run_step(devices, args, images)
+        step['saturated'] = saturation(step, steps[-1] if steps else None, args)
+        steps.append(step)
+        print_step(step)
+        if step['commands_consumed']:
+            print(f"⚠️ The simulated devices consumed queued commands: {step['commands_consumed']}")
+        if step['saturated'] and not args.keep_going:
+            break
+
+    conclusion = conclude(steps, args)
+    print(f"\n📊 Healthy up to {conclusion['max_healthy_devices']} devices "
+          f"(first saturated at {conclusion['saturated_at'] or '-'}); "
+          f"peak {conclusion['capacity_per_s']:.2f} recognitions/s.")
+    print(f"📈 At that rate, about {conclusion['projected_devices_at_timeout']} devices capturing every "
+          f"{args.capture_interval:g}s would push /recognize past {args.timeout:g}s, if the server queued "
+          f"every request; with the default INFERENCE_QUEUE_SIZE it answers the excess with 503 first.")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'time': datetime.now().isoformat(),
+                'api_url': args.api_url,
+                'settings': {key: value for key, value in vars(args).items() if key != 'json'},
+                'steps': steps,
+                'conclusion': conclusion,
+            }, f, indent=2)
+        print(f"💾 Results written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,7 @@
 
 import asyncio
 import os
+import socket
 import subprocess
 import tempfile
 import time
@@ -38,9 +39,12 @@ API_URL = os.getenv('API_URL', 'http://138.197.234.202:8080')
 
 SESSION_USER_AGENT = 'OrangePi-Client/1.0'
 
+# Identifies this device in the server's sightings (defaults to the hostname)
+DEVICE_ID = os.getenv('DEVICE_ID', socket.gethostname())
+
 # Create a session for connection pooling and better performance
 session = requests.Session()
-session.headers.update({'User-Agent': SESSION_USER_AGENT})
+session.headers.update({'User-Agent': SESSION_USER_AGENT, 'X-Device-Id': DEVICE_ID})
 
 # Text-to-speech configuration
 TTS_VOICE = os.getenv('EDGE_TTS_VOICE', 'en-US-EmmaMultilingualNeural')